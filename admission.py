@@ -0,0 +1,130 @@
+"""
+Admission control for upstream LLM calls: a bounded number of calls in flight, a short
+FIFO wait queue in front of them and a queue-time budget. Requests that find the queue
+full, or that wait longer than the budget, are shed instead of piling up on workers.
+"""
+import asyncio
+import threading
+from collections import deque
+
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+
+
+class _Waiter:
+    """A queued request; ``granted`` is set (under the controller lock) when a slot is handed over"""
+    __slots__ = ('granted', 'event', 'future', 'loop')
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    """
+    At most ``max_concurrent`` admitted calls at a time and ``max_queue`` waiting for a
+    slot, each for no longer than ``queue_timeout`` seconds. Slots are handed to waiters
+    in arrival order; threads (``acquire``) and coroutines (``acquire_async``) can share
+    one controller. Every successful acquire must be paired with ``release``.
+    """
+
+    def __init__(self, max_concurrent=64, max_queue=64, queue_timeout=2.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = {QUEUE_FULL: 0, QUEUE_TIMEOUT: 0}
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def _enter(self, loop=None):
+        """Take a free slot (None), refuse (False) or queue a new waiter (returned)"""
+        with self._lock:
+            if self.in_flight < self.max_concurrent and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.shed[QUEUE_FULL] += 1
+                return False
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _leave_queue(self, waiter, timed_out=True):
+        """After a wait ended: True if the slot was granted meanwhile, else dequeue (counting a timeout)"""
+        with self._lock:
+            if waiter.granted:
+                self.admitted += 1
+                return True
+            self._waiters.remove(waiter)
+            if timed_out:
+                self.shed[QUEUE_TIMEOUT] += 1
+            return False
+
+    def _timeout(self, timeout):
+        return self.queue_timeout if timeout is None else min(self.queue_timeout, max(0.0, timeout))
+
+    def acquire(self, timeout=None):
+        """Block until admitted (True) or shed (False); ``timeout`` can shorten the queue budget"""
+        waiter = self._enter()
+        if waiter is None:
+            return True
+        if waiter is False:
+            return False
+        waiter.event.wait(self._timeout(timeout))
+        return self._leave_queue(waiter)
+
+    async def acquire_async(self, timeout=None):
+        """asyncio version of ``acquire``; cancellation while queued gives the place back"""
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is None:
+            return True
+        if waiter is False:
+            return False
+        try:
+            await asyncio.wait({waiter.future}, timeout=self._timeout(timeout))
+        except asyncio.CancelledError:
+            if self._leave_queue(waiter, timed_out=False):
+                self.release()
+            raise
+        return self._leave_queue(waiter)
+
+    def release(self):
+        """Free a slot, handing it straight to the longest-waiting request if there is one"""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().grant()
+            else:
+                self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self.in_flight,
+                'queue_depth': len(self._waiters),
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+            }
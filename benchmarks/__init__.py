@@ -0,0 +1,3 @@
+"""
+Performance benchmarks; run each module with ``python -m benchmarks.<name>`` from the repo root
+"""
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark: rendering answers with markdown.markdown vs one reusable instance, the memo and canned bodies.
+
+    python -m benchmarks.bench_canned [--iterations N]
+"""
+import argparse
+import json
+import os
+import timeit
+
+import markdown
+
+from canned_responses import CannedAnswer, MarkdownRenderer
+from catalog import load_catalog
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'products.json')
+
+
+def sample_answers():
+    """A fixed reply, a top-products listing and a longer LLM-style answer"""
+    products = load_catalog(PRODUCTS_FILE, "https://example.myshopify.com")
+    listing = "Here are some of our products:<br>" + "<br>".join(
+        f'<a href="{product.link}">{product.title}</a> - ${product.price}' for product in products[:10]
+    )
+    long_answer = "\n\n".join(
+        f"**{product.title}** costs ${product.price}.\n\n- {product.description[:160]}" for product in products[:6]
+    )
+    return {
+        'greeting': "Hello! Welcome to Starky Shop. How can I help you today?",
+        'product_list': listing,
+        'llm_answer': long_answer,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000, help="renders timed per answer and method")
+    args = parser.parse_args()
+
+    renderer = MarkdownRenderer()
+    print(f"{'answer':<14} {'chars':>6} {'markdown us':>12} {'reused us':>10} {'memo us':>10} {'canned us':>10}")
+    for name, text in sample_answers().items():
+        canned = CannedAnswer(text, renderer)
+        renderer.render(text)
+        timings = [
+            min(timeit.repeat(fn, number=args.iterations, repeat=3)) / args.iterations * 1e6
+            for fn in (
+                lambda: json.dumps({'response': markdown.markdown(text)}),
+                lambda: json.dumps({'response': renderer.convert(text)}),
+                lambda: json.dumps({'response': renderer.render(text)}),
+                lambda: canned.body,
+            )
+        ]
+        print(f"{name:<14} {len(text):>6} " + " ".join(f"{t:>{w}.1f}" for t, w in zip(timings, (12, 10, 10, 10))))
+    print(renderer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark: facet query parsing and search over a replicated catalog.
+
+    python -m benchmarks.bench_facets [--copies N] [--iterations N]
+"""
+import argparse
+import os
+import time
+import timeit
+
+from catalog import CatalogSnapshot, load_catalog
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'products.json')
+
+QUERIES = [
+    "perfumes under 20000",
+    "what's in stock",
+    "anything from Starky Shop",
+    "sweaters under 3k",
+    "shoes between 1000 and 4000",
+    "headphones over 2000 in stock",
+    "anything on sale",
+]
+
+# Store questions that use facet words; parse() must leave them to the other branches
+NON_FACET_QUERIES = [
+    "Is delivery available in Mumbai?",
+    "What payment methods are available",
+    "Is cash on delivery available",
+    "are returns available",
+    "is there a discount code",
+    "tell me more about offers",
+    "is shipping available",
+    "is it available",
+]
+
+
+def check_non_facet_queries(facets):
+    """Fail loudly if a store question is parsed as a product filter"""
+    parsed = [(query, facets.parse(query)) for query in NON_FACET_QUERIES]
+    wrong = [f"{query!r} -> {facet_query}" for query, facet_query in parsed if facet_query is not None]
+    if wrong:
+        raise SystemExit("Store questions parsed as facet queries:\n  " + "\n  ".join(wrong))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=500, help="times the sample catalog is replicated")
+    parser.add_argument("--iterations", type=int, default=200, help="passes over the query set")
+    args = parser.parse_args()
+
+    products = load_catalog(PRODUCTS_FILE, "https://example.myshopify.com") * args.copies
+    start_time = time.perf_counter()
+    facets = CatalogSnapshot(products).facet_index
+    print(f"{len(products)} products, indexes built in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+    check_non_facet_queries(facets)
+
+    print(f"{'query':<40} {'matches':>8} {'parse us':>10} {'search us':>10}")
+    for query in QUERIES:
+        facet_query = facets.parse(query)
+        parse_seconds = min(timeit.repeat(lambda: facets.parse(query), number=args.iterations, repeat=3))
+        search_seconds = min(timeit.repeat(lambda: facets.search_positions(facet_query),
+                                           number=args.iterations, repeat=3))
+        print(f"{query:<40} {len(facets.search_positions(facet_query)):>8} "
+              f"{parse_seconds / args.iterations * 1e6:>10.1f} {search_seconds / args.iterations * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
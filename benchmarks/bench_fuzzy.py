@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: typo-tolerant product lookups over a replicated catalog.
+
+    python -m benchmarks.bench_fuzzy [--copies N] [--iterations N] [--max-candidates N]
+"""
+import argparse
+import copy
+import os
+import random
+import string
+import time
+import timeit
+
+from catalog import load_catalog
+from fuzzy import MAX_CANDIDATES, TrigramIndex
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'products.json')
+
+QUERIES = [
+    "perfum",
+    "sweatre",
+    "tshirt",
+    "swetaer",
+    "headphnes",
+    "sunglases",
+    "fosil wach",
+    "qwxzvk",
+]
+
+
+def replicated_catalog(copies, seed=7):
+    """The sample catalog ``copies`` times, each copy's titles given a random extra word"""
+    rng = random.Random(seed)
+    products = load_catalog(PRODUCTS_FILE, "https://example.myshopify.com")
+    catalog = []
+    for _ in range(copies):
+        for product in products:
+            product = copy.copy(product)
+            product.title = f"{product.title} {''.join(rng.choices(string.ascii_lowercase, k=7))}"
+            catalog.append(product)
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=500, help="times the sample catalog is replicated")
+    parser.add_argument("--iterations", type=int, default=50, help="lookups timed per query")
+    parser.add_argument("--max-candidates", type=int, default=MAX_CANDIDATES, help="edit-distance checks per term")
+    args = parser.parse_args()
+
+    products = replicated_catalog(args.copies)
+    start_time = time.perf_counter()
+    index = TrigramIndex(products, max_candidates=args.max_candidates)
+    print(f"{len(products)} products, {len(index)} words, {len(index.postings)} trigrams, "
+          f"built in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+
+    print(f"{'query':<16} {'correction':<28} {'candidates':>10} {'matches':>8} {'us':>10}")
+    for query in QUERIES:
+        match = index.match(query)
+        seconds = min(timeit.repeat(lambda: index.match(query), number=args.iterations, repeat=3))
+        corrections = ', '.join(f"{term}->{word}" for term, word in match.corrections.items()) or '-'
+        print(f"{query:<16} {corrections[:28]:<28} {match.candidates:>10} {len(match.positions):>8} "
+              f"{seconds / args.iterations * 1e6:>10.1f}")
+    print(index.stats())
+
+
+if __name__ == "__main__":
+    main()
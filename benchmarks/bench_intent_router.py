@@ -0,0 +1,66 @@
+"""
+Micro-benchmark: compiled IntentRouter vs the old chain of substring scans.
+
+    python -m benchmarks.bench_intent_router [--iterations N]
+"""
+import argparse
+import timeit
+
+from intent_router import DEFAULT_INTENTS, IntentRouter
+
+QUERIES = [
+    "hi",
+    "hello there",
+    "show me products",
+    "what is this perfume made of",
+    "how much is the leather belt",
+    "do you offer delivery to my city",
+    "link for belts",
+    "buy t-shirt",
+    "goodbye",
+    "whatever, this thing looks nice",
+    "something with sandalwood notes for the evening",
+    "I need a gift for my father who likes watches and wallets",
+]
+
+
+def chained_intent(query):
+    """The routing checks exactly as route_chatbot_query used to do them"""
+    query_lower = query.lower()
+    if any(phrase in query_lower for phrase in DEFAULT_INTENTS['product_list']):
+        return 'product_list'
+    if any(word in query_lower for word in ['explain', 'what is', 'how does', 'why', 'tell me about', 'describe']):
+        return 'explanation'
+    if any(word in query_lower for word in ['hello', 'hi', 'hey']):
+        return 'greeting'
+    if any(word in query_lower for word in ['product', 'item', 'what']):
+        return 'product_info'
+    if any(word in query_lower for word in ['price', 'cost', 'how much']):
+        return 'price'
+    if any(word in query_lower for word in ['shipping', 'delivery']):
+        return 'shipping'
+    if any(word in query_lower for word in ['link', 'url', 'buy', 'purchase']):
+        return 'link'
+    if any(word in query_lower for word in ['bye', 'goodbye', 'exit']):
+        return 'goodbye'
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000, help="passes over the query set")
+    args = parser.parse_args()
+
+    router = IntentRouter()
+    print(f"{'query':<52} {'chain':<14} {'router':<14}")
+    for query in QUERIES:
+        print(f"{query[:50]:<52} {str(chained_intent(query)):<14} {str(router.classify(query)):<14}")
+
+    calls = args.iterations * len(QUERIES)
+    for name, classify in (("chain", chained_intent), ("router", router.classify)):
+        seconds = min(timeit.repeat(lambda: [classify(query) for query in QUERIES], number=args.iterations, repeat=3))
+        print(f"{name:<8} {seconds / calls * 1e6:8.3f} us/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Closed-loop load generator for the chat endpoints.
+
+    python -m benchmarks.load_generator --url http://127.0.0.1:5000 --concurrency 50 --duration 30
+
+Each of ``--concurrency`` virtual users sends one request at a time, mixing keyword
+queries (answered locally) with LLM-bound ones in the ratio ``--llm-ratio``. LLM
+prompts get a unique suffix unless ``--repeat-prompts`` is set, so the local response
+cache does not hide upstream latency. Reports throughput and p50/p95/p99 per route.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from benchmarks.report import LatencyRecorder, format_report, load_summary, save_summary
+
+# Short queries from a known user stay on the local keyword/catalog path
+KEYWORD_QUERIES = [
+    "hi",
+    "show products",
+    "shipping",
+    "how much",
+    "link for belts",
+    "buy headphones",
+    "goodbye",
+]
+# Explanations always go to Gemini
+LLM_QUERIES = [
+    "explain how your return policy works",
+    "describe the difference between your leather and canvas belts",
+    "tell me about gift options for a birthday",
+    "why would I choose wired headphones over wireless ones",
+]
+
+# Answers the chatbot sends when the LLM call failed; counted as errors
+ERROR_PREFIX = "Sorry,"
+
+
+def choose_request(rng, llm_ratio, stream_ratio, unique_id):
+    """(route label, endpoint, query) for the next request"""
+    endpoint = '/chat/stream' if rng.random() < stream_ratio else '/chat'
+    if rng.random() < llm_ratio:
+        query = rng.choice(LLM_QUERIES)
+        if unique_id is not None:
+            query = f"{query} (request {unique_id})"
+        return f"{endpoint} llm", endpoint, query
+    return f"{endpoint} keyword", endpoint, rng.choice(KEYWORD_QUERIES)
+
+
+async def send_request(session, base_url, recorder, route, endpoint, query, user_id):
+    start_time = time.perf_counter()
+    ok = False
+    try:
+        async with session.post(f"{base_url}{endpoint}", json={'message': query, 'user_id': user_id}) as response:
+            if endpoint == '/chat/stream':
+                first_event = None
+                body = []
+                async for chunk in response.content.iter_any():
+                    if first_event is None:
+                        first_event = time.perf_counter() - start_time
+                    body.append(chunk)
+                text = b''.join(body).decode('utf-8', 'replace')
+                if first_event is not None:
+                    recorder.record_timing(f"{route} (first event)", first_event)
+                ok = response.status == 200 and 'event: done' in text and ERROR_PREFIX not in text
+            else:
+                text = await response.text()
+                ok = response.status == 200 and ERROR_PREFIX not in text
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        ok = False
+    recorder.record(route, time.perf_counter() - start_time, ok)
+
+
+async def run_load(base_url, concurrency=20, duration=10.0, total_requests=None, llm_ratio=0.3,
+                   stream_ratio=0.0, unique_prompts=True, seed=None, timeout=60.0):
+    """Drive the server and return the run summary"""
+    recorder = LatencyRecorder()
+    rng = random.Random(seed)
+    counter = iter(range(total_requests if total_requests else 2 ** 62))
+    deadline = time.perf_counter() + duration
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        async def virtual_user(user_number):
+            user_id = f"bench-user-{user_number}"
+            while total_requests or time.perf_counter() < deadline:
+                request_number = next(counter, None)
+                if request_number is None:
+                    return
+                route, endpoint, query = choose_request(
+                    rng, llm_ratio, stream_ratio, request_number if unique_prompts else None
+                )
+                await send_request(session, base_url, recorder, route, endpoint, query, user_id)
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(virtual_user(number) for number in range(concurrency)))
+        elapsed = time.perf_counter() - start_time
+    return recorder.summary(elapsed)
+
+
+def add_load_arguments(parser):
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests instead")
+    parser.add_argument("--llm-ratio", type=float, default=0.3, help="share of LLM-bound queries")
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="share of requests sent to /chat/stream")
+    parser.add_argument("--repeat-prompts", action="store_true", help="reuse LLM prompts (exercises the cache)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_path", help="write the summary to this file")
+    parser.add_argument("--baseline", help="summary JSON from an earlier run to compare against")
+
+
+def run_from_args(base_url, args):
+    summary = asyncio.run(run_load(
+        base_url, concurrency=args.concurrency, duration=args.duration, total_requests=args.requests,
+        llm_ratio=args.llm_ratio, stream_ratio=args.stream_ratio,
+        unique_prompts=not args.repeat_prompts, seed=args.seed
+    ))
+    baseline = load_summary(args.baseline) if args.baseline else None
+    print(format_report(summary, baseline))
+    if args.json_path:
+        save_summary(summary, args.json_path)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for /chat and /chat/stream")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="chatbot base URL")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+    run_from_args(args.url.rstrip('/'), args)
+
+
+if __name__ == "__main__":
+    main()
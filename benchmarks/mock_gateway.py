@@ -0,0 +1,125 @@
+"""
+Local stand-in for the Helicone Gemini gateway.
+
+    python -m benchmarks.mock_gateway --port 8787 --latency 0.8 --jitter 0.2 --error-rate 0.01
+
+Serves ``generateContent`` and ``streamGenerateContent`` (``alt=sse``) for any model
+with Gemini-shaped payloads after a configurable delay. Point the chatbot at it with
+``HELICONE_GATEWAY_BASE=http://127.0.0.1:8787``.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+FILLER = "Our products are made from carefully selected materials and ship within two days. "
+
+
+def answer_text(prompt, size):
+    """Deterministic answer of about ``size`` characters that echoes the prompt"""
+    text = f"**Mock answer** to: {prompt[:80]}\n\n"
+    return (text + FILLER * (size // len(FILLER) + 1))[:max(size, len(text))]
+
+
+def gemini_payload(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+class MockGateway:
+    """
+    ``latency`` seconds (+/- uniform ``jitter``) per call; a share ``error_rate`` of
+    calls fail with ``error_status``; answers are ``response_size`` characters long and
+    streamed in ``stream_chunks`` pieces spread over the same latency
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, error_status=503,
+                 response_size=600, stream_chunks=8, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.response_size = response_size
+        self.stream_chunks = max(1, stream_chunks)
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    async def handle(self, request):
+        model, _, method = request.match_info['model_method'].partition(':')
+        body = await request.json()
+        prompt = body["contents"][-1]["parts"][0]["text"]
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                await asyncio.sleep(self._delay())
+                return web.json_response({"error": {"code": self.error_status, "message": "mock failure"}},
+                                         status=self.error_status)
+            text = answer_text(prompt, self.response_size)
+            if method == 'streamGenerateContent':
+                return await self._stream(request, text)
+            await asyncio.sleep(self._delay())
+            return web.json_response(gemini_payload(text))
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request, text):
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        chunk_size = len(text) // self.stream_chunks + 1
+        pause = self._delay() / self.stream_chunks
+        for start in range(0, len(text), chunk_size):
+            await asyncio.sleep(pause)
+            chunk = json.dumps(gemini_payload(text[start:start + chunk_size]))
+            await response.write(f"data: {chunk}\r\n\r\n".encode('utf-8'))
+        await response.write_eof()
+        return response
+
+    async def stats(self, request):
+        return web.json_response({
+            'requests': self.requests,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+        })
+
+
+def create_gateway_app(gateway):
+    app = web.Application()
+    app.router.add_post('/v1beta/models/{model_method}', gateway.handle)
+    app.router.add_get('/stats', gateway.stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Helicone/Gemini gateway for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- seconds of uniform jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--response-size", type=int, default=600, help="characters per answer")
+    parser.add_argument("--stream-chunks", type=int, default=8, help="SSE events per streamed answer")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    gateway = MockGateway(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+        response_size=args.response_size, stream_chunks=args.stream_chunks, seed=args.seed
+    )
+    print(f"Mock gateway on http://{args.host}:{args.port} (latency {args.latency}s, error rate {args.error_rate})")
+    web.run_app(create_gateway_app(gateway), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Latency and throughput reporting for benchmark runs
+"""
+import json
+import math
+from collections import defaultdict
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated ``q``-th percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+class LatencyRecorder:
+    """Latencies (seconds) and error counts per route label"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.timings = set()
+
+    def record(self, route, latency, ok=True):
+        self.latencies[route].append(latency)
+        if not ok:
+            self.errors[route] += 1
+
+    def record_timing(self, name, latency):
+        """A partial timing of a request (e.g. time to first event); not counted as a request"""
+        self.timings.add(name)
+        self.latencies[name].append(latency)
+
+    def summary(self, duration):
+        """Per-route requests, errors, throughput and latency percentiles (milliseconds)"""
+        routes = {}
+        for route in sorted(self.latencies):
+            values = sorted(self.latencies[route])
+            stats = {
+                'requests': len(values),
+                'errors': self.errors[route],
+                'throughput_rps': round(len(values) / duration, 2) if duration else 0.0,
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+            }
+            for q in PERCENTILES:
+                stats[f'p{q}_ms'] = round(percentile(values, q) * 1000, 2)
+            routes[route] = stats
+        total = sum(len(values) for route, values in self.latencies.items() if route not in self.timings)
+        return {
+            'duration_seconds': round(duration, 3),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'throughput_rps': round(total / duration, 2) if duration else 0.0,
+            'routes': routes,
+        }
+
+
+def format_report(summary, baseline=None):
+    """Plain-text table; with a baseline summary, p50/p99/throughput changes are appended"""
+    columns = ('requests', 'errors', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+    width = max([len(route) for route in summary['routes']] + [5])
+    lines = [f"{'route':<{width}} " + ' '.join(f"{column:>14}" for column in columns)]
+    for route, stats in summary['routes'].items():
+        line = f"{route:<{width}} " + ' '.join(f"{stats[column]:>14}" for column in columns)
+        previous = (baseline or {}).get('routes', {}).get(route)
+        if previous:
+            line += '   vs baseline: ' + ', '.join(
+                f"{column} {_change(previous[column], stats[column])}"
+                for column in ('p50_ms', 'p99_ms', 'throughput_rps')
+            )
+        lines.append(line)
+    lines.append(
+        f"total: {summary['requests']} requests, {summary['errors']} errors, "
+        f"{summary['throughput_rps']} req/s over {summary['duration_seconds']}s"
+    )
+    return '\n'.join(lines)
+
+
+def _change(before, after):
+    if not before:
+        return 'n/a'
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def save_summary(summary, path):
+    with open(path, 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+
+def load_summary(path):
+    with open(path, 'r') as summary_file:
+        return json.load(summary_file)
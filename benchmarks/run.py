@@ -0,0 +1,93 @@
+"""
+End-to-end benchmark: mock gateway + chatbot server + load generator.
+
+    python -m benchmarks.run --mode async --latency 0.5 --concurrency 50 --duration 20 --json baseline.json
+    python -m benchmarks.run --mode async --baseline baseline.json    # after a change
+
+Starts ``benchmarks.mock_gateway`` and ``data/app.py api`` as subprocesses (the server
+pointed at the mock through HELICONE_GATEWAY_BASE, rate limiting off), waits for
+/health, runs the load generator, prints the report and stops both processes.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.load_generator import add_load_arguments, run_from_args
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(url, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chatbot against a mock Gemini gateway")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async", help="chatbot serving mode")
+    parser.add_argument("--port", type=int, default=5055, help="chatbot port")
+    parser.add_argument("--gateway-port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.5, help="mock gateway seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--response-size", type=int, default=600)
+    parser.add_argument("--server-log", default=os.devnull, help="file for the chatbot's log output")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+
+    gateway_base = f"http://127.0.0.1:{args.gateway_port}"
+    env = dict(os.environ)
+    env.update({
+        'HELICONE_GATEWAY_BASE': gateway_base,
+        'HELICONE_API_KEY': env.get('HELICONE_API_KEY') or 'benchmark',
+        'GOOGLE_API_KEY': env.get('GOOGLE_API_KEY') or 'benchmark',
+        'PORT': str(args.port),
+        # The load comes from one IP at far more than a real client's rate
+        'RATE_LIMIT_ENABLED': 'false',
+        'PYTHONPATH': REPO_ROOT,
+    })
+
+    gateway = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.mock_gateway', '--port', str(args.gateway_port),
+         '--latency', str(args.latency), '--jitter', str(args.jitter), '--error-rate', str(args.error_rate),
+         '--response-size', str(args.response_size)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL
+    )
+    with open(args.server_log, 'w') as server_log:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join('data', 'app.py'), 'api', f'--{args.mode}'],
+            cwd=REPO_ROOT, env=env, stdout=server_log, stderr=subprocess.STDOUT
+        )
+        try:
+            wait_for(f"{gateway_base}/stats")
+            wait_for(f"http://127.0.0.1:{args.port}/health")
+            print(f"Benchmarking {args.mode} server, mock gateway latency {args.latency}s "
+                  f"(+/-{args.jitter}s), error rate {args.error_rate}")
+            run_from_args(f"http://127.0.0.1:{args.port}", args)
+            print(f"Gateway: {requests.get(f'{gateway_base}/stats', timeout=5).json()}")
+        finally:
+            stop(server)
+            stop(gateway)
+
+
+if __name__ == "__main__":
+    main()
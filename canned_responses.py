@@ -0,0 +1,119 @@
+"""
+Answers rendered once and reused: fixed replies and catalog listings as ready-to-send
+response bodies, and a bounded memo of markdown renders for everything else
+"""
+import json
+import threading
+import weakref
+from collections import OrderedDict
+
+import markdown
+
+from streaming import format_sse
+
+
+class MarkdownRenderer:
+    """
+    Markdown -> HTML through one reusable ``markdown.Markdown`` instance (building one
+    per call, as ``markdown.markdown`` does, costs more than converting a short answer),
+    memoizing the renders of up to ``max_entries`` texts of at most ``max_chars``
+    characters in LRU order. Keyword answers and cached LLM answers repeat; rendering
+    each once is enough.
+    """
+
+    def __init__(self, max_entries=2048, max_chars=8192):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._markdown = markdown.Markdown()
+        self._entries = OrderedDict()
+        # Markdown instances keep per-document state, so conversions can't overlap
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, text):
+        """Render without memoizing"""
+        with self._lock:
+            return self._markdown.reset().convert(text)
+
+    def render(self, text):
+        with self._lock:
+            html = self._entries.get(text)
+            if html is not None:
+                self._entries.move_to_end(text)
+                self.hits += 1
+                return html
+            self.misses += 1
+            html = self._markdown.reset().convert(text)
+            if len(text) <= self.max_chars and self.max_entries > 0:
+                self._entries[text] = html
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return html
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class CannedAnswer(str):
+    """
+    An answer text carrying its HTML plus the /chat JSON body and the /chat/stream
+    'done' event as bytes, so serving it needs neither rendering nor encoding. It is a
+    str, so it can go wherever an answer text goes (conversation memory, comparisons).
+    """
+
+    def __new__(cls, text, renderer):
+        answer = super().__new__(cls, text)
+        answer.html = renderer.convert(text)
+        answer.body = json.dumps({'response': answer.html}, separators=(',', ':')).encode('utf-8')
+        answer.sse = format_sse('done', {'html': answer.html}).encode('utf-8')
+        return answer
+
+
+class CannedResponses:
+    """
+    CannedAnswers derived from a catalog snapshot (e.g. the top products listing),
+    built once per snapshot and ``stamp`` (e.g. a stock version) and dropped together
+    with their snapshot when it is replaced by a reload or evicted.
+    """
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self._answers = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, snapshot, name, build, stamp=None):
+        """The ``name`` answer of ``snapshot`` as of ``stamp``, from ``build()`` on first use"""
+        try:
+            answers = self._answers.get(snapshot)
+        except TypeError:
+            # Not weak-referenceable (an ad-hoc product list): nothing to attach it to
+            return build()
+        entry = answers.get(name) if answers is not None else None
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            return entry[1]
+        answer = CannedAnswer(build(), self.renderer)
+        with self._lock:
+            self._answers.setdefault(snapshot, {})[name] = (stamp, answer)
+            self.builds += 1
+        return answer
+
+    def stats(self):
+        return {
+            'snapshots': len(self._answers),
+            'hits': self.hits,
+            'builds': self.builds,
+        }
@@ -0,0 +1,249 @@
+"""
+Compact product catalog records built from the raw Shopify export
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from html.parser import HTMLParser
+
+from facets import FacetIndex
+from fuzzy import TrigramIndex
+from inventory import InventoryIndex
+from product_index import ProductIndex
+from retrieval import ProductRetriever
+
+
+class _TextExtractor(HTMLParser):
+    """Collect the text nodes of an HTML fragment"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def strip_html(html):
+    """Return the plain text of an HTML fragment with whitespace collapsed"""
+    if not html:
+        return ''
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return ' '.join(' '.join(extractor.parts).split())
+
+
+def product_link(handle, shop_url):
+    if handle:
+        return f"{shop_url}/products/{handle}"
+    return None
+
+
+def _parse_price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _intern(value):
+    """Share repeated short strings (vendor, type, tags, option values) across records"""
+    return sys.intern(value) if value else ''
+
+
+class VariantRecord:
+    """The fields of one Shopify variant the chatbot answers from"""
+    __slots__ = (
+        'id', 'title', 'price', 'price_value', 'compare_at_price', 'inventory_quantity',
+        'inventory_policy', 'inventory_management', 'requires_shipping', 'options'
+    )
+
+    def __init__(self, id, title, price, compare_at_price, inventory_quantity,
+                 inventory_policy, requires_shipping, options, inventory_management=''):
+        self.id = id
+        self.title = title
+        self.price = price
+        self.price_value = _parse_price(price)
+        self.compare_at_price = _parse_price(compare_at_price)
+        self.inventory_quantity = inventory_quantity
+        self.inventory_policy = inventory_policy
+        self.inventory_management = inventory_management
+        self.requires_shipping = requires_shipping
+        self.options = options
+
+    @property
+    def available(self):
+        """Sellable now: stock on hand, overselling allowed, or inventory not tracked"""
+        return (
+            self.inventory_quantity > 0
+            or self.inventory_policy == 'continue'
+            or not self.inventory_management
+        )
+
+    @property
+    def on_sale(self):
+        """Priced below its compare-at price"""
+        return bool(self.compare_at_price and self.price_value is not None
+                    and self.price_value < self.compare_at_price)
+
+    @classmethod
+    def from_shopify(cls, variant):
+        options = tuple(
+            _intern(variant.get(key))
+            for key in ('option1', 'option2', 'option3')
+            if variant.get(key)
+        )
+        return cls(
+            id=variant.get('id'),
+            title=_intern(variant.get('title') or ''),
+            price=variant.get('price', 'N/A'),
+            compare_at_price=variant.get('compare_at_price'),
+            inventory_quantity=variant.get('inventory_quantity') or 0,
+            inventory_policy=_intern(variant.get('inventory_policy') or ''),
+            inventory_management=_intern(variant.get('inventory_management') or ''),
+            requires_shipping=bool(variant.get('requires_shipping', True)),
+            options=options,
+        )
+
+
+class ProductRecord:
+    """
+    Slim, precomputed view of one product.
+
+    Everything a response needs (link, display price, plain-text description) is
+    computed once at load time; the raw Shopify payload is not kept.
+    """
+    __slots__ = (
+        'id', 'title', 'handle', 'link', 'price', 'description',
+        'vendor', 'product_type', 'tags', 'variants', 'options'
+    )
+
+    def __init__(self, id, title, handle, link, price, description, vendor, product_type, tags, variants,
+                 options=()):
+        self.id = id
+        self.title = title
+        self.handle = handle
+        self.link = link
+        self.price = price
+        self.description = description
+        self.vendor = vendor
+        self.product_type = product_type
+        self.tags = tags
+        self.variants = variants
+        # Option names ("Size", "Color") in the order of VariantRecord.options
+        self.options = options
+
+    @classmethod
+    def from_shopify(cls, product, shop_url):
+        variants = tuple(VariantRecord.from_shopify(variant) for variant in product.get('variants') or ())
+        tags = product.get('tags') or ''
+        if isinstance(tags, str):
+            tags = [tag.strip() for tag in tags.split(',')]
+        handle = product.get('handle') or ''
+        return cls(
+            id=product.get('id'),
+            title=product.get('title', 'N/A'),
+            handle=handle,
+            link=product_link(handle, shop_url),
+            price=variants[0].price if variants else 'N/A',
+            description=strip_html(product.get('body_html')),
+            vendor=_intern(product.get('vendor') or ''),
+            product_type=_intern(product.get('product_type') or ''),
+            tags=tuple(_intern(tag) for tag in tags if tag),
+            variants=variants,
+            options=tuple(_intern(option.get('name') or '') for option in product.get('options') or ()),
+        )
+
+    def __repr__(self):
+        return f"ProductRecord(id={self.id!r}, title={self.title!r})"
+
+
+def build_catalog(product_data, shop_url):
+    """Convert raw Shopify product dicts into ProductRecords"""
+    return [ProductRecord.from_shopify(product, shop_url) for product in product_data]
+
+
+def load_catalog(path, shop_url):
+    """Load a products.json export as ProductRecords; the parsed JSON is discarded"""
+    with open(path, 'r') as json_file:
+        return build_catalog(json.load(json_file), shop_url)
+
+
+def file_checksum(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class CatalogSnapshot:
+    """
+    One immutable version of the catalog together with the search indexes built on it.
+
+    A request grabs the current snapshot once and uses it throughout, so a concurrent
+    reload never changes the data under it. Iterating, ``len()`` and slicing behave like
+    the product list, so a snapshot can be passed wherever product data is expected.
+    """
+
+    def __init__(self, products, version=1, checksum=None, load_duration=0.0,
+                 product_index=None, product_retriever=None, source='json'):
+        """Indexes are built unless prebuilt ones (e.g. from a binary snapshot) are passed in"""
+        self.products = products
+        self.version = version
+        self.checksum = checksum
+        self.loaded_at = time.time()
+        self.product_index = product_index or ProductIndex(products)
+        self.product_retriever = product_retriever or ProductRetriever(products)
+        self.inventory_index = InventoryIndex(products)
+        self.facet_index = FacetIndex(products, self.product_index, self.inventory_index)
+        self._fuzzy_index = None
+        self._fuzzy_lock = threading.Lock()
+        self.shared = False
+        self.load_duration = load_duration
+        self.source = source
+
+    @classmethod
+    def from_json_bytes(cls, data, shop_url, version=1, checksum=None):
+        """Parse a products.json payload and build records plus indexes"""
+        start_time = time.perf_counter()
+        products = build_catalog(json.loads(data), shop_url)
+        snapshot = cls(products, version=version, checksum=checksum or file_checksum(data))
+        snapshot.load_duration = time.perf_counter() - start_time
+        return snapshot
+
+    @classmethod
+    def load(cls, path, shop_url, version=1):
+        with open(path, 'rb') as json_file:
+            return cls.from_json_bytes(json_file.read(), shop_url, version=version)
+
+    @property
+    def fuzzy_index(self):
+        """Trigram index for misspelled product names, built on first use to keep loads fast"""
+        if self._fuzzy_index is None:
+            with self._fuzzy_lock:
+                if self._fuzzy_index is None:
+                    self._fuzzy_index = TrigramIndex(self.products)
+        return self._fuzzy_index
+
+    def prepare_for_fork(self):
+        """
+        Build the lazily built indexes and move stock levels into shared memory, so
+        forked worker processes share all of it with the parent (idempotent)
+        """
+        self.fuzzy_index
+        if not self.shared:
+            self.inventory_index.share()
+            self.facet_index.in_stock = self.inventory_index.product_in_stock
+            self.shared = True
+
+    def __len__(self):
+        return len(self.products)
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __getitem__(self, item):
+        return self.products[item]
+
+    def __repr__(self):
+        return f"CatalogSnapshot(version={self.version}, products={len(self.products)})"
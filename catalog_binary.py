@@ -0,0 +1,225 @@
+"""
+Versioned binary catalog snapshots for fast worker start-up.
+
+``sync_products.py`` writes data/products.snapshot after every sync (or alone with
+``--snapshot-only``). A snapshot holds the slim ProductRecords together with the
+prebuilt inverted index and BM25 arrays, so a worker loads the catalog without
+parsing the Shopify JSON or rebuilding any index. Layout::
+
+    header    magic, format version, metadata length (16 bytes)
+    metadata  JSON: source checksum, shop URL, index fingerprint, section offsets
+    sections  marshal-encoded records, postings and vocabulary, then the raw BM25
+              arrays, each 64-byte aligned so they are used straight from the mmap
+
+A snapshot is only used when it was built from a products.json with the same checksum,
+for the same shop URL, by the same Python version and with the same index settings;
+anything else counts as stale and the caller falls back to the JSON file.
+"""
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from catalog import CatalogSnapshot, ProductRecord, VariantRecord, file_checksum
+from product_index import FIELD_WEIGHTS, MIN_TERM_LENGTH, STOP_WORDS, ProductIndex
+from retrieval import RETRIEVAL_STOP_WORDS, BM25Retriever, ProductRetriever
+
+MAGIC = b'SHOPCAT\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHxxI')
+ALIGNMENT = 64
+
+_PRODUCT_FIELDS = ProductRecord.__slots__
+_VARIANT_FIELDS = VariantRecord.__slots__
+_ARRAY_FIELDS = ('indptr', 'doc_ids', 'weights')
+
+
+class StaleSnapshotError(ValueError):
+    """The snapshot is unreadable or does not match the current catalog and code"""
+
+
+def default_snapshot_path(json_path):
+    return os.path.splitext(json_path)[0] + '.snapshot'
+
+
+def index_fingerprint():
+    """Digest of every setting the prebuilt indexes depend on"""
+    settings = {
+        'field_weights': FIELD_WEIGHTS,
+        'min_term_length': MIN_TERM_LENGTH,
+        'stop_words': sorted(STOP_WORDS),
+        'retrieval_stop_words': sorted(RETRIEVAL_STOP_WORDS),
+        'product_fields': _PRODUCT_FIELDS,
+        'variant_fields': _VARIANT_FIELDS,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _pack_product(product):
+    values = [getattr(product, field) for field in _PRODUCT_FIELDS]
+    values[_PRODUCT_FIELDS.index('variants')] = tuple(
+        tuple(getattr(variant, field) for field in _VARIANT_FIELDS) for variant in product.variants
+    )
+    return tuple(values)
+
+
+def _unpack(cls, fields, values):
+    record = cls.__new__(cls)
+    for field, value in zip(fields, values):
+        setattr(record, field, value)
+    return record
+
+
+def _unpack_product(values):
+    product = _unpack(ProductRecord, _PRODUCT_FIELDS, values)
+    product.variants = tuple(_unpack(VariantRecord, _VARIANT_FIELDS, variant) for variant in product.variants)
+    return product
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(path, snapshot, shop_url):
+    """Write a CatalogSnapshot (built from products.json) atomically; returns the file size"""
+    engine = snapshot.product_retriever.engine
+    blobs = [
+        ('products', marshal.dumps([_pack_product(product) for product in snapshot.products])),
+        ('postings', marshal.dumps(snapshot.product_index.postings)),
+        ('vocabulary', marshal.dumps(engine.vocabulary)),
+    ]
+    arrays = [(name, np.ascontiguousarray(getattr(engine, name))) for name in _ARRAY_FIELDS]
+
+    sections = {}
+    arrays_meta = {}
+    offset = 0
+    for name, blob in blobs:
+        sections[name] = [offset, len(blob)]
+        offset = _aligned(offset + len(blob))
+    for name, array in arrays:
+        arrays_meta[name] = [offset, array.dtype.str, int(array.size)]
+        offset = _aligned(offset + array.nbytes)
+
+    metadata = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'python': sys.implementation.cache_tag,
+        'index_fingerprint': index_fingerprint(),
+        'shop_url': shop_url,
+        'source_checksum': snapshot.checksum,
+        'created_at': time.time(),
+        'products': len(snapshot),
+        'bm25': {'k1': engine.k1, 'b': engine.b, 'document_count': engine.document_count},
+        'sections': sections,
+        'arrays': arrays_meta,
+    }).encode('utf-8')
+    data_start = _aligned(HEADER.size + len(metadata))
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as snapshot_file:
+            snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(metadata)))
+            snapshot_file.write(metadata)
+            for name, blob in blobs:
+                snapshot_file.seek(data_start + sections[name][0])
+                snapshot_file.write(blob)
+            for name, array in arrays:
+                snapshot_file.seek(data_start + arrays_meta[name][0])
+                snapshot_file.write(array.tobytes())
+            snapshot_file.truncate(data_start + offset)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return data_start + offset
+
+
+def read_metadata(mapped):
+    magic, format_version, metadata_length = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise StaleSnapshotError("not a catalog snapshot")
+    if format_version != FORMAT_VERSION:
+        raise StaleSnapshotError(f"format version {format_version}, expected {FORMAT_VERSION}")
+    metadata = json.loads(bytes(mapped[HEADER.size:HEADER.size + metadata_length]))
+    return metadata, _aligned(HEADER.size + metadata_length)
+
+
+def read_snapshot(path, shop_url, checksum, version=1):
+    """
+    Load a snapshot as a CatalogSnapshot whose BM25 arrays are views on the mapped file.
+    Raises OSError when it is missing and StaleSnapshotError when it can't be used for
+    a products.json with ``checksum``.
+    """
+    start_time = time.perf_counter()
+    with open(path, 'rb') as snapshot_file:
+        mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        metadata, data_start = read_metadata(mapped)
+    except (struct.error, ValueError) as e:
+        raise StaleSnapshotError(f"unreadable snapshot: {e}")
+
+    expected = {
+        'python': sys.implementation.cache_tag,
+        'index_fingerprint': index_fingerprint(),
+        'shop_url': shop_url,
+        'source_checksum': checksum,
+    }
+    for key, value in expected.items():
+        if metadata.get(key) != value:
+            raise StaleSnapshotError(f"{key} mismatch")
+
+    view = memoryview(mapped)
+
+    def section(name):
+        offset, length = metadata['sections'][name]
+        return marshal.loads(view[data_start + offset:data_start + offset + length])
+
+    def array(name):
+        offset, dtype, count = metadata['arrays'][name]
+        return np.frombuffer(mapped, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+
+    try:
+        products = [_unpack_product(values) for values in section('products')]
+        postings = section('postings')
+        bm25 = metadata['bm25']
+        engine = BM25Retriever.from_arrays(
+            section('vocabulary'), array('indptr'), array('doc_ids'), array('weights'),
+            bm25['document_count'], k1=bm25['k1'], b=bm25['b']
+        )
+    except (KeyError, TypeError, ValueError, EOFError) as e:
+        raise StaleSnapshotError(f"corrupt snapshot: {e}")
+
+    snapshot = CatalogSnapshot(
+        products, version=version, checksum=checksum,
+        product_index=ProductIndex.from_postings(products, postings),
+        product_retriever=ProductRetriever(products, engine=engine),
+        source='snapshot'
+    )
+    snapshot.load_duration = time.perf_counter() - start_time
+    return snapshot
+
+
+def build_snapshot_file(json_path, shop_url, snapshot_path=None):
+    """Parse products.json, build the indexes and write the snapshot next to it"""
+    start_time = time.perf_counter()
+    snapshot_path = snapshot_path or default_snapshot_path(json_path)
+    with open(json_path, 'rb') as json_file:
+        data = json_file.read()
+    snapshot = CatalogSnapshot.from_json_bytes(data, shop_url, checksum=file_checksum(data))
+    size = write_snapshot(snapshot_path, snapshot, shop_url)
+    return {
+        'path': snapshot_path,
+        'products': len(snapshot),
+        'bytes': size,
+        'build_seconds': round(time.perf_counter() - start_time, 3),
+    }
+
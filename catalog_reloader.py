@@ -0,0 +1,149 @@
+"""
+Zero-downtime hot reload of products.json
+"""
+import logging
+import os
+import threading
+import time
+
+from catalog import CatalogSnapshot, file_checksum
+from catalog_binary import read_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogReloader:
+    """
+    Keep an up-to-date CatalogSnapshot for a products.json file.
+
+    A background thread polls the file's mtime and size; when they change the file
+    is checksummed, and only a changed checksum triggers a parse and index build. The
+    new snapshot is built entirely off the request path and then swapped in with a
+    single reference assignment, so requests holding the previous snapshot finish on
+    it undisturbed. A file that fails to parse (e.g. caught mid-write) leaves the
+    current snapshot in place and is retried once it changes again; so does one with
+    the wrong structure (a top-level object, a product missing a field).
+
+    With a ``snapshot_path`` (see catalog_binary) every load first tries the prebuilt
+    binary snapshot and only parses the JSON when it is missing or stale.
+    """
+
+    def __init__(self, path, shop_url, poll_interval=5.0, on_reload=None, snapshot_path=None):
+        self.path = path
+        self.shop_url = shop_url
+        self.snapshot_path = snapshot_path
+        self.poll_interval = poll_interval
+        self.on_reload = list(on_reload or [])
+        self.reloads = 0
+        self.reload_failures = 0
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._signature = self._stat_signature()
+        self._failed_signature = None
+        with open(path, 'rb') as json_file:
+            data = json_file.read()
+        self._snapshot = self._build(data, file_checksum(data), version=1)
+        logger.info(f"Catalog loaded - Version: 1, Products: {len(self._snapshot)}, Source: {self._snapshot.source}, Time: {self._snapshot.load_duration * 1000:.1f}ms")
+
+    def _build(self, data, checksum, version):
+        """Snapshot for products.json ``data``: from the binary snapshot when it is current, else parsed"""
+        if self.snapshot_path:
+            try:
+                return read_snapshot(self.snapshot_path, self.shop_url, checksum, version=version)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"Catalog snapshot not used - Path: {self.snapshot_path}, Reason: {e}")
+        return CatalogSnapshot.from_json_bytes(data, self.shop_url, version=version, checksum=checksum)
+
+    @property
+    def current(self):
+        """The active snapshot; read it once per request and keep using that reference"""
+        return self._snapshot
+
+    def _stat_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def check_for_changes(self):
+        """Reload if the file changed since the last check; returns True when a new snapshot was swapped in"""
+        try:
+            signature = self._stat_signature()
+        except OSError as e:
+            logger.error(f"Catalog stat failed - Path: {self.path}, Error: {e}")
+            return False
+        if signature in (self._signature, self._failed_signature):
+            return False
+        return self.reload(signature=signature)
+
+    def reload(self, signature=None, force=False):
+        """Parse and index the file, then atomically swap it in"""
+        with self._reload_lock:
+            try:
+                signature = signature or self._stat_signature()
+                with open(self.path, 'rb') as json_file:
+                    data = json_file.read()
+                checksum = file_checksum(data)
+                if checksum == self._snapshot.checksum and not force:
+                    self._signature = signature
+                    return False
+                snapshot = self._build(data, checksum, version=self._snapshot.version + 1)
+            except Exception as e:
+                # Malformed products raise KeyError/TypeError/AttributeError from the
+                # build; any of them must leave the poll thread and current snapshot alive
+                self._failed_signature = signature
+                self.reload_failures += 1
+                self.last_error = str(e)
+                logger.error(f"Catalog reload failed - Path: {self.path}, Error: {type(e).__name__}: {e}")
+                return False
+
+            self._snapshot = snapshot
+            self._signature = signature
+            self.reloads += 1
+            self.last_error = None
+
+        logger.info(f"Catalog reloaded - Version: {snapshot.version}, Products: {len(snapshot)}, Source: {snapshot.source}, Time: {snapshot.load_duration * 1000:.1f}ms")
+        for callback in self.on_reload:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Catalog reload callback failed - Error: {e}")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                logger.exception(f"Catalog poll failed - Path: {self.path}, Error: {e}")
+
+    def start(self):
+        """Start polling in a daemon thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='catalog-reloader', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version,
+            'checksum': snapshot.checksum[:12] if snapshot.checksum else None,
+            'products': len(snapshot),
+            'source': snapshot.source,
+            'loaded_at': snapshot.loaded_at,
+            'last_reload_duration_ms': round(snapshot.load_duration * 1000, 2),
+            'reloads': self.reloads,
+            'reload_failures': self.reload_failures,
+            'last_error': self.last_error,
+            'poll_interval': self.poll_interval,
+        }
@@ -0,0 +1,2 @@
+# test_helicone.py is a live integration script run directly (python3 test_helicone.py)
+collect_ignore = ['test_helicone.py']
@@ -0,0 +1,128 @@
+"""
+Bounded per-session conversation memory for multi-turn Gemini prompts
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+USER_ROLE = 'user'
+MODEL_ROLE = 'model'
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token), good enough for budgeting"""
+    return len(text) // 4 + 1
+
+
+class ConversationStore:
+    """
+    Recent turns per session, held in fixed-size ring buffers.
+
+    Each session keeps at most ``max_turns`` messages of at most ``max_turn_chars``
+    characters. Sessions are kept in LRU order; the least recently used ones are
+    evicted when there are more than ``max_sessions`` of them, when the stored text
+    exceeds ``max_chars`` in total, or once idle for ``idle_ttl`` seconds. Thread-safe.
+    """
+
+    def __init__(self, max_sessions=10000, max_turns=12, max_turn_chars=2000,
+                 max_chars=16 * 1024 * 1024, idle_ttl=1800, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_turn_chars = max_turn_chars
+        self.max_chars = max_chars
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_chars = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, session_id):
+        _, turns = self._sessions.pop(session_id)
+        self.total_chars -= sum(len(text) for _, text in turns)
+
+    def _expire(self, now):
+        # Oldest sessions sit at the front, so stop at the first live one
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._drop(session_id)
+            self.expirations += 1
+
+    def add_turn(self, session_id, role, text):
+        """Append one message to a session, evicting old turns and sessions as needed"""
+        if not session_id or not text or self.max_turns <= 0:
+            return
+        text = text[:self.max_turn_chars]
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            entry = self._sessions.pop(session_id, None)
+            turns = entry[1] if entry else deque(maxlen=self.max_turns)
+            if len(turns) == turns.maxlen:
+                self.total_chars -= len(turns[0][1])
+            turns.append((role, text))
+            self.total_chars += len(text)
+            self._sessions[session_id] = (now, turns)
+            while len(self._sessions) > self.max_sessions or (
+                self.total_chars > self.max_chars and len(self._sessions) > 1
+            ):
+                self._drop(next(iter(self._sessions)))
+                self.evictions += 1
+
+    def add_exchange(self, session_id, user_text, model_text):
+        self.add_turn(session_id, USER_ROLE, user_text)
+        self.add_turn(session_id, MODEL_ROLE, model_text)
+
+    def history(self, session_id):
+        """The session's (role, text) turns, oldest first"""
+        if not session_id:
+            return []
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if self._clock() - entry[0] >= self.idle_ttl:
+                self._drop(session_id)
+                self.expirations += 1
+                return []
+            return list(entry[1])
+
+    def build_history_contents(self, session_id, token_budget):
+        """
+        Gemini ``contents`` entries for the most recent turns that fit ``token_budget``.
+
+        Turns are taken newest first until the budget is spent; the result always
+        starts with a user turn, as Gemini expects.
+        """
+        selected = []
+        remaining = token_budget
+        for role, text in reversed(self.history(session_id)):
+            remaining -= estimate_tokens(text)
+            if remaining < 0:
+                break
+            selected.append((role, text))
+        while selected and selected[-1][0] != USER_ROLE:
+            selected.pop()
+        return [{"role": role, "parts": [{"text": text}]} for role, text in reversed(selected)]
+
+    def clear(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'stored_chars': self.total_chars,
+                'max_chars': self.max_chars,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -1,16 +1,42 @@
+import hmac
+import math
 import os
-import json
 import requests
 import time
 import uuid
-from flask import Flask, request, jsonify
+from collections import namedtuple
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import markdown
 from dotenv import load_dotenv
 import logging
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from helicone_config import HeliconeConfig, get_helicone_headers, get_request_data
+from catalog import CatalogSnapshot
+from catalog_binary import default_snapshot_path
+from catalog_reloader import CatalogReloader
+from shop_registry import ShopRegistry, UnknownShopError
+from facets import FacetIndex, describe_facet_query
+from fuzzy import TrigramIndex
+from inventory import InventoryIndex, describe_availability, named_option
+from product_index import ProductIndex
+from retrieval import ProductRetriever
+from llm_cache import LLMResponseCache, make_cache_key
+from canned_responses import CannedAnswer, CannedResponses, MarkdownRenderer
+import http_client
+import prefork
+from streaming import MarkdownStreamRenderer, format_sse, parse_gemini_sse_line
+from singleflight import SingleFlight
+from intent_router import DEFAULT_INTENTS, IntentRouter, load_intents
+from conversation_memory import ConversationStore
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, FAST_BUCKETS, MetricsRegistry
+from admission import QUEUE_FULL, QUEUE_TIMEOUT, AdmissionController
+from rate_limit import TokenBucketLimiter
+from resilience import CircuitBreaker, Deadline, LatencyWindow, RetryPolicy, hedged_call
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Start of process-level initialisation, for the cold-start time reported by /health
+STARTUP_STARTED = time.perf_counter()
 
 load_dotenv()
 
@@ -18,26 +44,342 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load the product data
+# Default storefront, served from data/products.json; other shops come from SHOPS_DIR
+SHOP_NAME = os.environ.get("SHOP_NAME", "mffws4-kk")
+SHOP_URL = f"https://{SHOP_NAME}.myshopify.com"
+
+# Seconds between checks of products.json for changes (0 disables hot reload)
+CATALOG_RELOAD_INTERVAL = float(os.environ.get("CATALOG_RELOAD_INTERVAL", "5"))
+
+# Load the product data as compact records (links, prices and plain-text
+# descriptions precomputed; the raw Shopify JSON is not kept in memory) together
+# with the inverted search index and the BM25 retriever over titles and descriptions.
+# Changes to products.json are picked up and swapped in without a restart. When
+# sync_products.py has written a matching binary snapshot (records plus prebuilt
+# indexes) it is loaded instead of parsing the JSON; CATALOG_SNAPSHOT_FILE="" disables it.
 script_dir = os.path.dirname(os.path.abspath(__file__))
 products_file = os.path.join(script_dir, 'products.json')
-with open(products_file, 'r') as json_file:
-    products = json.load(json_file)
+catalog_snapshot_file = os.environ.get("CATALOG_SNAPSHOT_FILE", default_snapshot_path(products_file)) or None
+catalog_reloader = CatalogReloader(
+    products_file, SHOP_URL, poll_interval=CATALOG_RELOAD_INTERVAL, snapshot_path=catalog_snapshot_file
+)
 
-SHOP_NAME = "mffws4-kk"
-SHOP_URL = f"https://{SHOP_NAME}.myshopify.com"
+# Further storefronts served by the same process: SHOPS_DIR/<shop>/products.json (and its
+# snapshot) is loaded on the shop's first request with links to its own myshopify.com
+# URL; the least recently used shops are dropped once their catalogs are estimated to
+# take more than SHOP_CATALOG_MEMORY_MB
+SHOPS_DIR = os.environ.get("SHOPS_DIR", os.path.join(script_dir, 'shops'))
+SHOP_CATALOG_MEMORY_MB = float(os.environ.get("SHOP_CATALOG_MEMORY_MB", "512"))
+shop_registry = ShopRegistry(
+    SHOP_NAME, catalog_reloader, SHOPS_DIR, max_bytes=int(SHOP_CATALOG_MEMORY_MB * 1024 * 1024),
+    poll_interval=CATALOG_RELOAD_INTERVAL, use_snapshots=catalog_snapshot_file is not None
+)
+
+def get_catalog(shop=None):
+    """
+    Current CatalogSnapshot of a shop (the default one when None); take it once per
+    request so a reload can't change it mid-answer. Raises UnknownShopError.
+    """
+    if shop is None or shop == SHOP_NAME:
+        return catalog_reloader.current
+    return shop_registry.catalog(shop)
+
+def request_shop(shop, headers, args):
+    """
+    Shop a request is for: ``shop`` from the JSON body, else the ``shop`` query
+    parameter or X-Shop-Domain header, else the default shop. Raises UnknownShopError.
+    """
+    return shop_registry.resolve(shop or args.get('shop') or headers.get('X-Shop-Domain'))
+
+UNKNOWN_SHOP_MESSAGE = "Unknown shop"
+
+# In-process cache of successful Gemini answers; identical prompts skip the network entirely
+llm_cache = LLMResponseCache(
+    max_entries=HeliconeConfig.LOCAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=HeliconeConfig.LOCAL_CACHE_TTL
+)
+
+# Answers are rendered to HTML through one reusable markdown instance with a bounded
+# memo; fixed replies and catalog listings are rendered once, to ready-to-send bodies
+markdown_renderer = MarkdownRenderer(
+    max_entries=HeliconeConfig.MARKDOWN_MEMO_MAX_ENTRIES,
+    max_chars=HeliconeConfig.MARKDOWN_MEMO_MAX_CHARS
+)
+canned_responses = CannedResponses(markdown_renderer)
+
+# Coalesces concurrent identical Gemini prompts (sync and async paths) into one upstream call
+llm_flights = SingleFlight()
+
+def invalidate_llm_cache():
+    """Hook to call whenever the product catalog changes"""
+    llm_cache.invalidate()
+    logger.info("LLM response cache invalidated")
+
+catalog_reloader.on_reload.append(lambda snapshot: invalidate_llm_cache())
+shop_registry.on_reload.append(lambda snapshot: invalidate_llm_cache())
+if CATALOG_RELOAD_INTERVAL > 0:
+    catalog_reloader.start()
+    shop_registry.start()
+
+# Recent turns per session, replayed to Gemini so follow-up questions have context
+conversation_memory = ConversationStore(
+    max_sessions=HeliconeConfig.MEMORY_MAX_SESSIONS,
+    max_turns=HeliconeConfig.MEMORY_MAX_TURNS,
+    max_turn_chars=HeliconeConfig.MEMORY_MAX_TURN_CHARS,
+    max_chars=HeliconeConfig.MEMORY_MAX_CHARS,
+    idle_ttl=HeliconeConfig.MEMORY_IDLE_TTL
+) if HeliconeConfig.MEMORY_ENABLED else None
+
+# Resilience of the upstream Gemini call (see HeliconeConfig.LLM_* / BREAKER_*): retries
+# within a per-request deadline, optional hedging after the recent p95 latency, and a
+# circuit breaker that makes LLM-bound queries fall back to catalog answers while open
+retry_policy = RetryPolicy(
+    max_attempts=HeliconeConfig.LLM_MAX_ATTEMPTS,
+    base_delay=HeliconeConfig.LLM_RETRY_BASE_DELAY,
+    max_delay=HeliconeConfig.LLM_RETRY_MAX_DELAY
+)
+gemini_breaker = CircuitBreaker(
+    failure_threshold=HeliconeConfig.BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=HeliconeConfig.BREAKER_RECOVERY_TIMEOUT,
+    half_open_max_calls=HeliconeConfig.BREAKER_HALF_OPEN_MAX_CALLS
+)
+gemini_latency_window = LatencyWindow()
+hedge_executor = ThreadPoolExecutor(max_workers=HeliconeConfig.HTTP_POOL_MAXSIZE, thread_name_prefix='gemini-hedge')
+
+# Bounds the Gemini calls in flight (and the requests queued for one) so a burst of
+# LLM-bound questions can't tie up every worker; local answers never pass through it
+llm_admission = AdmissionController(
+    max_concurrent=HeliconeConfig.LLM_MAX_CONCURRENCY,
+    max_queue=HeliconeConfig.LLM_MAX_QUEUE,
+    queue_timeout=HeliconeConfig.LLM_QUEUE_TIMEOUT
+)
+
+# Per-user, per-session and per-IP request budgets, one for Gemini-backed answers and
+# one for local answers (see HeliconeConfig.RATE_LIMIT_*)
+IP_BUDGET_MULTIPLIER = HeliconeConfig.RATE_LIMIT_IP_MULTIPLIER
+rate_limiter = TokenBucketLimiter({
+    'llm': (HeliconeConfig.RATE_LIMIT_LLM_RATE, HeliconeConfig.RATE_LIMIT_LLM_BURST),
+    'local': (HeliconeConfig.RATE_LIMIT_LOCAL_RATE, HeliconeConfig.RATE_LIMIT_LOCAL_BURST),
+    'llm_ip': (HeliconeConfig.RATE_LIMIT_LLM_RATE * IP_BUDGET_MULTIPLIER,
+               HeliconeConfig.RATE_LIMIT_LLM_BURST * IP_BUDGET_MULTIPLIER),
+    'local_ip': (HeliconeConfig.RATE_LIMIT_LOCAL_RATE * IP_BUDGET_MULTIPLIER,
+                 HeliconeConfig.RATE_LIMIT_LOCAL_BURST * IP_BUDGET_MULTIPLIER),
+}, max_keys=HeliconeConfig.RATE_LIMIT_MAX_KEYS)
+
+# Prometheus metrics served at /metrics. Series used on every request are resolved to
+# their label values once here, so recording is a bisect and an add under a tiny lock.
+metrics_registry = MetricsRegistry()
+CHAT_LATENCY = metrics_registry.histogram(
+    'chatbot_chat_request_duration_seconds', 'End-to-end chat request latency.', ['route']
+)
+CHAT_LATENCY_BLOCKING = CHAT_LATENCY.labels('/chat')
+CHAT_LATENCY_STREAM = CHAT_LATENCY.labels('/chat/stream')
+CHAT_REQUESTS = metrics_registry.counter(
+    'chatbot_chat_requests_total', 'Chat requests by route and HTTP status.', ['route', 'status']
+)
+CHAT_OK_BLOCKING = CHAT_REQUESTS.labels('/chat', 200)
+CHAT_OK_STREAM = CHAT_REQUESTS.labels('/chat/stream', 200)
+ANSWER_PATHS = metrics_registry.counter(
+    'chatbot_answers_total', 'Answers by pipeline path: local keyword/catalog answers or Gemini.', ['path']
+)
+KEYWORD_ANSWERS = ANSWER_PATHS.labels('keyword')
+LLM_ANSWERS = ANSWER_PATHS.labels('llm')
+FALLBACK_ANSWERS = ANSWER_PATHS.labels('fallback')
+GEMINI_LATENCY = metrics_registry.histogram(
+    'chatbot_gemini_request_duration_seconds', 'Upstream Gemini call latency through Helicone.', ['mode']
+)
+GEMINI_LATENCY_BLOCKING = GEMINI_LATENCY.labels('blocking')
+GEMINI_LATENCY_STREAM = GEMINI_LATENCY.labels('stream')
+GEMINI_ERRORS = metrics_registry.counter(
+    'chatbot_gemini_errors_total', 'Failed Gemini calls by HTTP status or failure kind.', ['status']
+)
+GEMINI_RETRIES = metrics_registry.counter(
+    'chatbot_gemini_retries_total', 'Gemini attempts retried after a retryable failure.'
+)
+GEMINI_HEDGES = metrics_registry.counter(
+    'chatbot_gemini_hedged_requests_total', 'Gemini calls that sent a hedge request.'
+)
+metrics_registry.callback(
+    'chatbot_gemini_circuit_open', 'Whether the Gemini circuit breaker rejects calls (1) or not (0).',
+    lambda: int(gemini_breaker.is_open())
+)
+LLM_QUEUE_WAIT = metrics_registry.histogram(
+    'chatbot_llm_queue_wait_seconds', 'Time LLM-bound requests waited for an admission slot.'
+)
+metrics_registry.callback(
+    'chatbot_llm_queue_depth', 'LLM-bound requests waiting for an admission slot.',
+    lambda: llm_admission.queue_depth
+)
+metrics_registry.callback(
+    'chatbot_llm_in_flight', 'Admitted Gemini calls in flight.', lambda: llm_admission.in_flight
+)
+metrics_registry.callback(
+    'chatbot_llm_shed_total', 'LLM-bound requests shed by admission control, by reason.',
+    lambda: {(QUEUE_FULL,): llm_admission.shed[QUEUE_FULL], (QUEUE_TIMEOUT,): llm_admission.shed[QUEUE_TIMEOUT]},
+    'counter', ['reason']
+)
+RATE_LIMITED = metrics_registry.counter(
+    'chatbot_rate_limited_total', 'Chat requests rejected by the rate limiter, by budget.', ['budget']
+)
+metrics_registry.callback(
+    'chatbot_rate_limit_buckets', 'Token buckets held by the rate limiter.', lambda: len(rate_limiter)
+)
+FUZZY_CANDIDATES = metrics_registry.histogram(
+    'chatbot_fuzzy_candidates', 'Vocabulary words edit-distance checked per fuzzy product lookup.',
+    buckets=(0, 4, 16, 64, 128, 256, 512)
+)
+FUZZY_LATENCY = metrics_registry.histogram(
+    'chatbot_fuzzy_lookup_seconds', 'Time spent in fuzzy product lookups.', buckets=FAST_BUCKETS
+)
+MARKDOWN_RENDER = metrics_registry.histogram(
+    'chatbot_markdown_render_seconds', 'Time spent rendering answers to HTML.', buckets=FAST_BUCKETS
+)
+metrics_registry.callback(
+    'chatbot_llm_cache_requests_total', 'Local LLM cache lookups by result.',
+    lambda: {('hit',): llm_cache.hits, ('miss',): llm_cache.misses}, 'counter', ['result']
+)
+metrics_registry.callback(
+    'chatbot_llm_cache_hit_ratio', 'Share of local LLM cache lookups that were hits.',
+    lambda: llm_cache.stats()['hit_ratio']
+)
+metrics_registry.callback(
+    'chatbot_llm_cache_entries', 'Entries in the local LLM cache.', lambda: len(llm_cache)
+)
+metrics_registry.callback(
+    'chatbot_llm_coalesced_total', 'Gemini calls that joined an identical in-flight call.',
+    lambda: llm_flights.coalesced, 'counter'
+)
+metrics_registry.callback(
+    'chatbot_catalog_products', 'Products in the active catalog snapshot.', lambda: len(get_catalog())
+)
+metrics_registry.callback(
+    'chatbot_catalog_version', 'Version of the active catalog snapshot.', lambda: get_catalog().version
+)
+metrics_registry.callback(
+    'chatbot_catalog_load_seconds', 'Time the active catalog snapshot took to load.',
+    lambda: get_catalog().load_duration
+)
+metrics_registry.callback(
+    'chatbot_startup_seconds', 'Time the chatbot module took to initialise (catalog, indexes, clients).', lambda: STARTUP_DURATION
+)
+metrics_registry.callback(
+    'chatbot_shop_catalogs_resident', 'Shop catalogs held in memory.', lambda: shop_registry.stats()['resident']
+)
+metrics_registry.callback(
+    'chatbot_shop_catalog_bytes', 'Estimated memory of the resident shop catalogs.',
+    lambda: shop_registry.stats()['resident_bytes']
+)
+metrics_registry.callback(
+    'chatbot_shop_catalog_evictions_total', 'Shop catalogs dropped to stay under the memory cap.',
+    lambda: shop_registry.evictions, 'counter'
+)
+metrics_registry.callback(
+    'chatbot_shop_requests_total', 'Chat requests per resident shop.',
+    lambda: {(shop,): requests for shop, requests in shop_registry.request_counts().items()}, 'counter', ['shop']
+)
+metrics_registry.callback(
+    'chatbot_catalog_products_in_stock', 'Products of the active catalog with a variant in stock.',
+    lambda: int(get_catalog().inventory_index.product_in_stock.sum())
+)
+INVENTORY_UPDATES = metrics_registry.counter(
+    'chatbot_inventory_updates_total', 'Variant inventory changes applied in place via /inventory.'
+)
+metrics_registry.callback(
+    'chatbot_markdown_memo_requests_total', 'Markdown render memo lookups by result.',
+    lambda: {('hit',): markdown_renderer.hits, ('miss',): markdown_renderer.misses}, 'counter', ['result']
+)
+metrics_registry.callback(
+    'chatbot_canned_responses_total', 'Prerendered catalog answers served, by whether they were reused or built.',
+    lambda: {('hit',): canned_responses.hits, ('build',): canned_responses.builds}, 'counter', ['result']
+)
+metrics_registry.callback(
+    'chatbot_conversation_sessions', 'Sessions held in conversation memory.',
+    lambda: len(conversation_memory) if conversation_memory else 0
+)
+
+def render_markdown(text):
+    if isinstance(text, CannedAnswer):
+        return text.html
+    start_time = time.perf_counter()
+    html = markdown_renderer.render(text)
+    MARKDOWN_RENDER.observe(time.perf_counter() - start_time)
+    return html
+
+# Fixed replies of the keyword intents, rendered once
+GREETING_ANSWER = CannedAnswer("Hello! Welcome to Starky Shop. How can I help you today?", markdown_renderer)
+PRICE_ANSWER = CannedAnswer(
+    "I can help you find product prices. Could you specify which product you're interested in?", markdown_renderer
+)
+SHIPPING_ANSWER = CannedAnswer(
+    "Shipping information varies by product. Most items require shipping. Would you like to know about a specific product?",
+    markdown_renderer
+)
+LINK_PROMPT_ANSWER = CannedAnswer(
+    "Please specify which product you'd like the link for. For example: 'link for belts' or 'buy t-shirt'",
+    markdown_renderer
+)
+GOODBYE_ANSWER = CannedAnswer("Thank you for visiting Starky Shop! Have a great day!", markdown_renderer)
+
+def record_answer_path(answer):
+    (LLM_ANSWERS if isinstance(answer, LLMRequest) else KEYWORD_ANSWERS).inc()
+
+def record_gemini_error(status):
+    GEMINI_ERRORS.labels(status).inc()
+
+def observe_stream_latency(events, start_time, shop=None):
+    """Pass SSE events through, recording /chat/stream latency (overall and per shop) once the stream ends"""
+    try:
+        yield from events
+    finally:
+        elapsed = time.perf_counter() - start_time
+        CHAT_LATENCY_STREAM.observe(elapsed)
+        if shop:
+            shop_registry.record_request(shop, elapsed)
+
+# Requests without their own session_id all share this one; it is never remembered
+DEFAULT_SESSION_ID = 'default'
+
+# Query intents are classified in one regex pass; CHAT_INTENTS_FILE may point to a
+# JSON file of {"intent": ["phrase", ...]} overriding or extending the defaults
+intent_definitions = dict(DEFAULT_INTENTS)
+if os.environ.get("CHAT_INTENTS_FILE"):
+    intent_definitions.update(load_intents(os.environ["CHAT_INTENTS_FILE"]))
+intent_router = IntentRouter(intent_definitions)
 
 # Validate Helicone configuration
 config_errors = HeliconeConfig.validate_config()
 for error in config_errors:
     logger.error(f"Configuration error: {error}")
 
-def call_gemini_via_helicone(prompt, user_id=None, session_id=None):
+# User-facing messages for failed LLM calls, shared by the sync and async paths
+GEMINI_PARSE_ERROR_MESSAGE = "Sorry, I couldn't parse the response from Gemini."
+GEMINI_TIMEOUT_MESSAGE = "Sorry, the request timed out. Please try again."
+GEMINI_CONNECTION_ERROR_MESSAGE = "Sorry, I couldn't connect to the AI service. Please try again."
+GEMINI_UNEXPECTED_ERROR_MESSAGE = "Sorry, an unexpected error occurred. Please try again."
+# Returned when the circuit breaker refuses the call; callers answer from the catalog instead
+GEMINI_UNAVAILABLE_MESSAGE = "Sorry, our AI assistant is temporarily unavailable. Please try again shortly."
+# Returned when admission control sheds the call (see HeliconeConfig.LLM_SHED_RESPONSE)
+GEMINI_OVERLOADED_MESSAGE = "Sorry, our AI assistant is handling too many requests right now. Please try again in a moment."
+
+GEMINI_ERROR_MESSAGES = frozenset([
+    GEMINI_PARSE_ERROR_MESSAGE, GEMINI_TIMEOUT_MESSAGE,
+    GEMINI_CONNECTION_ERROR_MESSAGE, GEMINI_UNEXPECTED_ERROR_MESSAGE, GEMINI_UNAVAILABLE_MESSAGE,
+    GEMINI_OVERLOADED_MESSAGE
+])
+GEMINI_STATUS_ERROR_PREFIX = "Sorry, I encountered an error (Status:"
+
+def gemini_status_error_message(status_code):
+    return f"{GEMINI_STATUS_ERROR_PREFIX} {status_code}). Please try again."
+
+def is_gemini_error_message(text):
+    return text in GEMINI_ERROR_MESSAGES or text.startswith(GEMINI_STATUS_ERROR_PREFIX)
+
+def prepare_gemini_request(prompt, user_id=None, session_id=None, history=None):
     """
-    Enhanced Helicone integration with better observability
+    Build the request id, Helicone headers, payload and local cache key for a prompt;
+    ``history`` holds earlier conversation turns as Gemini ``contents`` entries
     """
     request_id = str(uuid.uuid4())
-    start_time = time.time()
     
     # Use the configuration helper functions
     headers = get_helicone_headers(
@@ -47,17 +389,100 @@ def call_gemini_via_helicone(prompt, user_id=None, session_id=None):
         prompt_length=len(prompt)
     )
     
-    data = get_request_data(prompt)
+    data = get_request_data(prompt, history=history)
+    return request_id, headers, data, make_cache_key(prompt, data)
+
+def get_cached_gemini_response(cache_key, request_id, user_id):
+    cached_text = llm_cache.get(cache_key) if HeliconeConfig.LOCAL_CACHE_ENABLED else None
+    if cached_text is not None:
+        logger.info(f"LLM cache hit - ID: {request_id}, User: {user_id}")
+    return cached_text
+
+def extract_gemini_text(response_data, request_id, cache_key):
+    """Pull the answer out of a successful Gemini payload and cache it"""
+    try:
+        response_text = response_data["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError) as e:
+        logger.error(f"Failed to parse Helicone response - ID: {request_id}, Error: {e}")
+        record_gemini_error('parse')
+        return GEMINI_PARSE_ERROR_MESSAGE
+    
+    # Log success metrics
+    logger.info(f"Helicone success - ID: {request_id}, Response length: {len(response_text)}")
     
+    if HeliconeConfig.LOCAL_CACHE_ENABLED:
+        llm_cache.set(cache_key, response_text)
+    return response_text
+
+def hedge_delay():
+    """Seconds to wait before hedging: recent p95 upstream latency, at least LLM_HEDGE_MIN_DELAY"""
+    recent = gemini_latency_window.percentile(
+        HeliconeConfig.LLM_HEDGE_PERCENTILE, default=HeliconeConfig.LLM_HEDGE_MIN_DELAY
+    )
+    return max(HeliconeConfig.LLM_HEDGE_MIN_DELAY, recent)
+
+def attempt_timeout(deadline):
+    """Read timeout of one attempt: READ_TIMEOUT, cut short by the request deadline"""
+    return min(HeliconeConfig.READ_TIMEOUT, deadline.remaining())
+
+def with_gemini_retries(attempt_fn, request_id, deadline, rejected_result):
+    """
+    Call ``attempt_fn(attempt)`` -> (result, retryable) until it gives a final result or
+    the attempts or the deadline run out, sleeping a jittered backoff between tries.
+    Each try needs the circuit breaker's permission; ``rejected_result`` is returned
+    when the very first one is refused, or when queueing left less than
+    LLM_MIN_ATTEMPT_TIME of the deadline for it.
+    """
+    result = rejected_result
+    for attempt in range(retry_policy.max_attempts):
+        if attempt:
+            delay = retry_policy.delay(attempt - 1)
+            if not retry_policy.should_retry(attempt - 1, delay, deadline, HeliconeConfig.LLM_MIN_ATTEMPT_TIME):
+                break
+            logger.warning(f"Retrying Helicone request - ID: {request_id}, Attempt: {attempt + 1}, Delay: {delay:.2f}s")
+            GEMINI_RETRIES.inc()
+            time.sleep(delay)
+        elif deadline.remaining() <= HeliconeConfig.LLM_MIN_ATTEMPT_TIME:
+            logger.warning(f"Deadline nearly spent, skipping Helicone request - ID: {request_id}")
+            break
+        if not gemini_breaker.allow_request():
+            logger.warning(f"Circuit breaker open, skipping Helicone request - ID: {request_id}")
+            break
+        result, retryable = attempt_fn(attempt)
+        if not retryable:
+            break
+    return result
+
+def record_gemini_status(status_code):
+    """Feed a gateway status to the breaker; True when the status is worth retrying"""
+    retryable = retry_policy.is_retryable(status_code)
+    if retryable:
+        gemini_breaker.record_failure()
+    else:
+        # Client errors mean the gateway is up; they must not trip the breaker
+        gemini_breaker.record_success()
+    return retryable
+
+def send_gemini_request(headers, data, deadline):
+    """One gateway round trip, hedged with a second copy when enabled and slow"""
+    timeout = http_client.get_timeout(attempt_timeout(deadline))
+    send = lambda: http_client.post(HeliconeConfig.get_gateway_url(), headers=headers, json=data, timeout=timeout)
+    if not HeliconeConfig.LLM_HEDGING_ENABLED:
+        return send()
+    response, hedged = hedged_call(
+        hedge_executor, send, hedge_delay(), deadline.remaining(), lambda response: response.status_code == 200
+    )
+    if hedged:
+        GEMINI_HEDGES.inc()
+    return response
+
+def attempt_gemini_request(prompt, request_id, headers, data, cache_key, user_id, deadline, attempt):
+    """One upstream attempt; returns (answer or apology message, retryable)"""
+    start_time = time.time()
     try:
-        logger.info(f"Making Helicone request - ID: {request_id}, User: {user_id}, Prompt length: {len(prompt)}")
+        logger.info(f"Making Helicone request - ID: {request_id}, User: {user_id}, Prompt length: {len(prompt)}, Attempt: {attempt + 1}")
         
-        response = requests.post(
-            HeliconeConfig.get_gateway_url(),
-            headers=headers,
-            json=data,
-            timeout=HeliconeConfig.REQUEST_TIMEOUT
-        )
+        response = send_gemini_request(headers, data, deadline)
         
         end_time = time.time()
         response_time = end_time - start_time
@@ -66,147 +491,558 @@ def call_gemini_via_helicone(prompt, user_id=None, session_id=None):
         logger.info(f"Helicone response - ID: {request_id}, Status: {response.status_code}, Time: {response_time:.2f}s")
         
         if response.status_code == 200:
-            response_data = response.json()
-            
-            # Extract response text
-            try:
-                response_text = response_data["candidates"][0]["content"]["parts"][0]["text"]
-                
-                # Log success metrics
-                logger.info(f"Helicone success - ID: {request_id}, Response length: {len(response_text)}")
-                
-                return response_text
-                
-            except (KeyError, IndexError) as e:
-                logger.error(f"Failed to parse Helicone response - ID: {request_id}, Error: {e}")
-                return "Sorry, I couldn't parse the response from Gemini."
-                
+            gemini_breaker.record_success()
+            gemini_latency_window.record(response_time)
+            return extract_gemini_text(response.json(), request_id, cache_key), False
         else:
             logger.error(f"Helicone API error - ID: {request_id}, Status: {response.status_code}, Response: {response.text}")
-            return f"Sorry, I encountered an error (Status: {response.status_code}). Please try again."
+            record_gemini_error(response.status_code)
+            return gemini_status_error_message(response.status_code), record_gemini_status(response.status_code)
+            
+    except (requests.exceptions.Timeout, FutureTimeoutError):
+        logger.error(f"Helicone request timeout - ID: {request_id}")
+        record_gemini_error('timeout')
+        gemini_breaker.record_failure()
+        return GEMINI_TIMEOUT_MESSAGE, True
+        
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Helicone request failed - ID: {request_id}, Error: {e}")
+        record_gemini_error('connection')
+        gemini_breaker.record_failure()
+        return GEMINI_CONNECTION_ERROR_MESSAGE, True
+        
+    except Exception as e:
+        logger.error(f"Unexpected error in Helicone call - ID: {request_id}, Error: {e}")
+        record_gemini_error('unexpected')
+        gemini_breaker.record_failure()
+        return GEMINI_UNEXPECTED_ERROR_MESSAGE, False
+        
+    finally:
+        GEMINI_LATENCY_BLOCKING.observe(time.time() - start_time)
+
+def record_admission(admitted, request_id, wait_start):
+    """Observe the queue wait of an admission attempt; returns ``admitted``"""
+    LLM_QUEUE_WAIT.observe(time.perf_counter() - wait_start)
+    if not admitted:
+        logger.warning(f"Shedding Helicone request, LLM admission queue saturated - ID: {request_id}")
+    return admitted
+
+def admit_gemini_call(request_id, deadline):
+    """Wait (within the queue budget and the deadline) for an admission slot; False when shed"""
+    wait_start = time.perf_counter()
+    return record_admission(llm_admission.acquire(deadline.remaining()), request_id, wait_start)
+
+def request_gemini_via_helicone(prompt, request_id, headers, data, cache_key, user_id=None):
+    """
+    Make the Gemini round trip for a prepared request, retried within LLM_DEADLINE
+    (queueing for an admission slot included); errors become apology messages
+    """
+    deadline = Deadline(HeliconeConfig.LLM_DEADLINE)
+    if not admit_gemini_call(request_id, deadline):
+        return GEMINI_OVERLOADED_MESSAGE
+    try:
+        return with_gemini_retries(
+            lambda attempt: attempt_gemini_request(prompt, request_id, headers, data, cache_key, user_id, deadline, attempt),
+            request_id, deadline, GEMINI_UNAVAILABLE_MESSAGE
+        )
+    finally:
+        llm_admission.release()
+
+def call_gemini_via_helicone(prompt, user_id=None, session_id=None, history=None):
+    """
+    Enhanced Helicone integration with better observability
+    """
+    request_id, headers, data, cache_key = prepare_gemini_request(prompt, user_id, session_id, history)
+    
+    cached_text = get_cached_gemini_response(cache_key, request_id, user_id)
+    if cached_text is not None:
+        return cached_text
+    
+    # Identical prompts already in flight share that upstream call and its outcome
+    return llm_flights.do(
+        cache_key,
+        lambda: request_gemini_via_helicone(prompt, request_id, headers, data, cache_key, user_id)
+    )
+
+def attempt_gemini_stream(request_id, headers, data, deadline):
+    """Open the streaming call; returns ((response, None) or (None, apology message), retryable)"""
+    start_time = time.time()
+    try:
+        response = http_client.post(
+            HeliconeConfig.get_stream_gateway_url(),
+            headers=headers,
+            json=data,
+            timeout=http_client.get_timeout(attempt_timeout(deadline)),
+            stream=True
+        )
+    except requests.exceptions.Timeout:
+        logger.error(f"Helicone request timeout - ID: {request_id}")
+        record_gemini_error('timeout')
+        gemini_breaker.record_failure()
+        return (None, GEMINI_TIMEOUT_MESSAGE), True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Helicone request failed - ID: {request_id}, Error: {e}")
+        record_gemini_error('connection')
+        gemini_breaker.record_failure()
+        return (None, GEMINI_CONNECTION_ERROR_MESSAGE), True
+    
+    logger.info(f"Helicone stream opened - ID: {request_id}, Status: {response.status_code}, Time: {time.time() - start_time:.2f}s")
+    if response.status_code == 200:
+        return (response, None), False
+    with response:
+        logger.error(f"Helicone API error - ID: {request_id}, Status: {response.status_code}, Response: {response.text}")
+    record_gemini_error(response.status_code)
+    return (None, gemini_status_error_message(response.status_code)), record_gemini_status(response.status_code)
+
+def stream_gemini_via_helicone(prompt, user_id=None, session_id=None, history=None):
+    """
+    Stream a Gemini answer through Helicone, yielding text deltas as they arrive.
+    Errors are yielded as the same apology messages call_gemini_via_helicone returns.
+    Opening the stream is retried like the blocking call; once text flows it is not.
+    The admission slot is held until the stream ends.
+    """
+    start_time = time.time()
+    request_id, headers, data, cache_key = prepare_gemini_request(prompt, user_id, session_id, history)
+    
+    cached_text = get_cached_gemini_response(cache_key, request_id, user_id)
+    if cached_text is not None:
+        yield cached_text
+        return
+    
+    deadline = Deadline(HeliconeConfig.LLM_DEADLINE)
+    if not admit_gemini_call(request_id, deadline):
+        yield GEMINI_OVERLOADED_MESSAGE
+        return
+    
+    try:
+        logger.info(f"Making streaming Helicone request - ID: {request_id}, User: {user_id}, Prompt length: {len(prompt)}")
+        
+        response, error_message = with_gemini_retries(
+            lambda attempt: attempt_gemini_stream(request_id, headers, data, deadline),
+            request_id, deadline, (None, GEMINI_UNAVAILABLE_MESSAGE)
+        )
+        if response is None:
+            yield error_message
+            return
+        
+        with response:
+            parts = []
+            for line in response.iter_lines():
+                delta = parse_gemini_sse_line(line)
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        
+        response_text = ''.join(parts)
+        logger.info(f"Helicone stream finished - ID: {request_id}, Response length: {len(response_text)}, Time: {time.time() - start_time:.2f}s")
+        gemini_breaker.record_success()
+        if response_text:
+            gemini_latency_window.record(time.time() - start_time)
+            if HeliconeConfig.LOCAL_CACHE_ENABLED:
+                llm_cache.set(cache_key, response_text)
+        else:
+            record_gemini_error('parse')
+            yield GEMINI_PARSE_ERROR_MESSAGE
             
     except requests.exceptions.Timeout:
         logger.error(f"Helicone request timeout - ID: {request_id}")
-        return "Sorry, the request timed out. Please try again."
+        record_gemini_error('timeout')
+        gemini_breaker.record_failure()
+        yield GEMINI_TIMEOUT_MESSAGE
         
     except requests.exceptions.RequestException as e:
         logger.error(f"Helicone request failed - ID: {request_id}, Error: {e}")
-        return "Sorry, I couldn't connect to the AI service. Please try again."
+        record_gemini_error('connection')
+        gemini_breaker.record_failure()
+        yield GEMINI_CONNECTION_ERROR_MESSAGE
         
     except Exception as e:
         logger.error(f"Unexpected error in Helicone call - ID: {request_id}, Error: {e}")
-        return "Sorry, an unexpected error occurred. Please try again."
+        record_gemini_error('unexpected')
+        gemini_breaker.record_failure()
+        yield GEMINI_UNEXPECTED_ERROR_MESSAGE
+        
+    finally:
+        llm_admission.release()
+        GEMINI_LATENCY_STREAM.observe(time.time() - start_time)
 
 def find_product_by_name(query, product_data):
-    query_lower = query.lower()
-    matching_products = []
-    stop_words = ['the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'link', 'url', 'buy', 'purchase', 'provide', 'give', 'me', 'please', 'can', 'you']
-    words = query_lower.split()
-    search_terms = [word for word in words if word not in stop_words and len(word) > 2]
-    for product in product_data:
-        title_lower = product.get('title', '').lower()
-        for term in search_terms:
-            if term in title_lower:
-                matching_products.append(product)
-                break
-    return matching_products
+    # Reuse the prebuilt index of a catalog snapshot; index ad-hoc product lists on demand
+    index = product_data.product_index if isinstance(product_data, CatalogSnapshot) else ProductIndex(product_data)
+    matching_products = index.search(query)
+    if matching_products:
+        return matching_products
+    return fuzzy_find_products(query, product_data)
+
+def fuzzy_find_products(query, product_data):
+    """Typo-tolerant fallback ("perfum", "tshirt") over title and handle words"""
+    fuzzy = product_data.fuzzy_index if isinstance(product_data, CatalogSnapshot) else TrigramIndex(product_data)
+    match = fuzzy.match(query)
+    FUZZY_CANDIDATES.observe(match.candidates)
+    FUZZY_LATENCY.observe(match.elapsed)
+    if match.corrections:
+        logger.info(f"Fuzzy product match: {match.corrections} ({match.candidates} candidates, {match.elapsed * 1000:.2f}ms)")
+    return [fuzzy.products[position] for position in match.positions]
+
+def retrieve_products(query, product_data, k=3):
+    """BM25 search over titles and descriptions; returns [] when nothing is relevant enough"""
+    retriever = product_data.product_retriever if isinstance(product_data, CatalogSnapshot) else ProductRetriever(product_data)
+    return retriever.search(query, k=k)
+
+def inventory_of(product_data):
+    """Stock levels of a catalog snapshot, or of an ad-hoc product list"""
+    return product_data.inventory_index if isinstance(product_data, CatalogSnapshot) else InventoryIndex(product_data)
+
+def price_label(product, inventory):
+    """Price to quote in a listing: the first variant in stock, flagged when sold out or low"""
+    return f"${inventory.display_price(product)}{inventory.stock_note(product)}"
+
+def answer_stock_question(query, product_data, limit=3):
+    """
+    Answer "is X in stock?" / "which sizes are left?" from the inventory index, or None
+    when the question names no product (e.g. "what's in stock" is a facet question)
+    """
+    search_terms = intent_router.strip(query, 'stock')
+    if not search_terms:
+        return None
+    facet_query = facet_index_of(product_data).parse(query)
+    if facet_query and (facet_query.min_price is not None or facet_query.max_price is not None
+                        or facet_query.on_sale or facet_query.vendors):
+        return None
+    matching_products = find_product_by_name(search_terms, product_data)
+    if not matching_products:
+        return None
+    inventory = inventory_of(product_data)
+    # "the blue shirt" / "which sizes of the shirt": prefer products with that option
+    named = [product for product in matching_products
+             if inventory.named_variants(product, query) is not None or named_option(product, query)]
+    matching_products = (named or matching_products)[:limit]
+    logger.info(f"Answered from inventory: {query[:50]}...")
+    return "\n".join(f"- {describe_availability(inventory, product, query)}" for product in matching_products)
+
+def answer_from_catalog(query, product_data):
+    """Answer a descriptive query from the catalog descriptions, or None to defer to the LLM"""
+    matching_products = retrieve_products(query, product_data)
+    if not matching_products:
+        return None
+    inventory = inventory_of(product_data)
+    response = "These products match what you're looking for:\n"
+    for i, product in enumerate(matching_products):
+        title = product.title
+        price = price_label(product, inventory)
+        link = product.link
+        if link:
+            response += f"{i+1}. [{title}]({link}) - {price}\n"
+        else:
+            response += f"{i+1}. {title} - {price}\n"
+    return response
+
+def facet_index_of(product_data):
+    if isinstance(product_data, CatalogSnapshot):
+        return product_data.facet_index
+    return FacetIndex(product_data, ProductIndex(product_data))
+
+def answer_from_facets(query, product_data, limit=10):
+    """Answer price-range / stock / sale / vendor questions from the facet indexes, or None"""
+    facets = facet_index_of(product_data)
+    facet_query = facets.parse(query)
+    if facet_query is None:
+        return None
+    matches = facets.search(facet_query)
+    description = describe_facet_query(facet_query)
+    logger.info(f"Answered from facets ({description}): {len(matches)} products")
+    if not matches:
+        return f"I couldn't find any products matching: {description}. Try a wider price range or fewer filters."
+    inventory = inventory_of(product_data)
+    response = f"Here's what I found ({description}):\n"
+    for i, (product, price) in enumerate(matches[:limit]):
+        note = inventory.stock_note(product)
+        if product.link:
+            response += f"{i+1}. [{product.title}]({product.link}) - ${price:.2f}{note}\n"
+        else:
+            response += f"{i+1}. {product.title} - ${price:.2f}{note}\n"
+    if len(matches) > limit:
+        response += f"...and {len(matches) - limit} more.\n"
+    return response
+
+def catalog_fallback_answer(query, product_data):
+    """Best local answer to an LLM-bound query while Gemini is unavailable"""
+    FALLBACK_ANSWERS.inc()
+    logger.info(f"Answering from catalog while Gemini is unavailable: {query[:50]}...")
+    catalog_answer = answer_from_catalog(query, product_data)
+    if catalog_answer:
+        return catalog_answer
+    inventory = inventory_of(product_data)
+    matching_products = find_product_by_name(query, product_data)[:3] or inventory.in_stock_products(3)
+    response = "Our AI assistant is busy right now, but these products might interest you:\n"
+    for i, product in enumerate(matching_products):
+        if product.link:
+            response += f"{i+1}. [{product.title}]({product.link}) - {price_label(product, inventory)}\n"
+        else:
+            response += f"{i+1}. {product.title} - {price_label(product, inventory)}\n"
+    return response
+
+def shed_fallback_enabled():
+    """Whether shed LLM requests get a catalog answer (else the caller answers 503)"""
+    return HeliconeConfig.LLM_SHED_RESPONSE == 'fallback'
+
+# Returned by route_chatbot_query when the answer has to come from Gemini
+LLMRequest = namedtuple('LLMRequest', ['prompt', 'user_id', 'session_id', 'history'])
+# Returned instead of an answer when the client is over its rate limit
+RateLimited = namedtuple('RateLimited', ['retry_after'])
+RATE_LIMITED_MESSAGE = "You're sending messages too quickly. Please wait a moment and try again."
+
+def rate_limit_wait(budget, user_id, session_id, client_ip):
+    """
+    Charge a request to its user, session and IP buckets of ``budget``; returns 0.0
+    when allowed, else seconds to wait. Every request is charged to 'local' before it
+    is routed, so local answers are limited too, and one routed to Gemini also to
+    'llm'. Only HTTP requests (with a client IP) are limited; the shared anonymous
+    user and default session are covered by the IP bucket alone.
+    """
+    if not HeliconeConfig.RATE_LIMIT_ENABLED or not client_ip:
+        return 0.0
+    bucket_keys = [(budget + '_ip', client_ip)]
+    if user_id and user_id != 'anonymous':
+        bucket_keys.append((budget, 'user:' + user_id))
+    if session_id and session_id != DEFAULT_SESSION_ID:
+        bucket_keys.append((budget, 'session:' + session_id))
+    wait = rate_limiter.try_acquire(bucket_keys)
+    if wait:
+        RATE_LIMITED.labels(budget).inc()
+        logger.warning(f"Rate limited - User: {user_id}, Session: {session_id}, IP: {client_ip}, Budget: {budget}")
+    return wait
+
+def conversation_history(memory, session_id):
+    """Earlier turns of the session as Gemini contents, trimmed to the token budget"""
+    if memory is None or not session_id or session_id == DEFAULT_SESSION_ID:
+        return None
+    return memory.build_history_contents(session_id, HeliconeConfig.MEMORY_TOKEN_BUDGET) or None
 
-def generate_product_link(product):
-    handle = product.get('handle', '')
-    if handle:
-        return f"{SHOP_URL}/products/{handle}"
-    return None
+def remember_exchange(memory, session_id, query, answer):
+    """Record a question and its answer; failed LLM calls are not remembered"""
+    if memory is None or not session_id or session_id == DEFAULT_SESSION_ID:
+        return
+    if answer and not is_gemini_error_message(answer):
+        memory.add_exchange(session_id, query, answer)
 
-def generate_chatbot_response(query, product_data, memory=None, user_id=None, session_id=None):
-    query_lower = query.lower()
+def product_list_answer(product_data):
+    product_info = []
+    inventory = inventory_of(product_data)
+    for i, product in enumerate(inventory.in_stock_products(10)):  # Show up to 10 products in stock
+        title = product.title
+        price = price_label(product, inventory)
+        link = product.link
+        if link:
+            product_info.append(f'<a href="{link}">{title}</a> - {price}')
+        else:
+            product_info.append(f'{title} - {price}')
+    return "Here are some of our products:<br>" + "<br>".join(product_info)
+
+def product_info_answer(product_data):
+    product_info = []
+    inventory = inventory_of(product_data)
+    for i, product in enumerate(inventory.in_stock_products(3)):
+        title = product.title
+        price = price_label(product, inventory)
+        link = product.link
+        if link:
+            product_info.append(f"{i+1}. [{title}]({link}) - {price}")
+        else:
+            product_info.append(f"{i+1}. {title} - {price}")
+    return f"Here are some of our products:\n" + "\n".join(product_info)
+
+def canned_catalog_answer(product_data, name, build):
+    """
+    Answer built from the catalog alone by ``build(product_data)``, rendered once per
+    catalog snapshot and stock version (a stock update rebuilds it)
+    """
+    stamp = int(inventory_of(product_data).stock_version[0]) if isinstance(product_data, CatalogSnapshot) else None
+    return canned_responses.get(product_data, name, lambda: build(product_data), stamp)
+
+def warm_canned_answers(product_data):
+    """Render the catalog listings ahead of their first request"""
+    canned_catalog_answer(product_data, 'product_list', product_list_answer)
+    canned_catalog_answer(product_data, 'product_info', product_info_answer)
+
+def route_chatbot_query(query, product_data, memory=None, user_id=None, session_id=None):
+    """
+    Answer a query from the local branches, or return an LLMRequest describing the
+    Gemini call needed. Never blocks on the network, so both the sync and the async
+    serving paths share it.
+    """
     
     # Log user query for observability
     logger.info(f"Processing query - User: {user_id}, Session: {session_id}, Query: {query[:100]}...")
     
+    intents = intent_router.intents(query)
+    
     # Intercept direct product list queries before any LLM/Helicone logic
-    product_list_phrases = [
-        "product list", "list products", "show me products", "give me product list",
-        "show products", "all products", "products list"
-    ]
-    if any(phrase in query_lower for phrase in product_list_phrases):
-        product_info = []
-        for i, product in enumerate(product_data[:10]):  # Show up to 10 products
-            title = product.get('title', 'N/A')
-            price = product.get('variants', [{}])[0].get('price', 'N/A')
-            link = generate_product_link(product)
-            if link:
-                product_info.append(f'<a href="{link}">{title}</a> - ${price}')
-            else:
-                product_info.append(f'{title} - ${price}')
-        return "Here are some of our products:<br>" + "<br>".join(product_info)
+    if 'product_list' in intents:
+        return canned_catalog_answer(product_data, 'product_list', product_list_answer)
+    
+    # Stock of named products ("is the perfume in stock?", "which sizes are left?") is
+    # answered from the inventory index; price ranges, stock, sales and vendors
+    # ("perfumes under 2000", "what's in stock") from the facet indexes. Shipping
+    # questions ("is shipping available", "is shipping free over 500") keep their own
+    # answer. Of the explanation phrases only "what is" ("what is in stock") may still
+    # be such a question; "why" or "explain" go to Gemini.
+    explanation_phrases = intent_router.matched_phrases(query, 'explanation')
+    if explanation_phrases <= {'what is'} and 'shipping' not in intents:
+        if 'stock' in intents:
+            stock_answer = answer_stock_question(query, product_data)
+            if stock_answer:
+                return stock_answer
+        facet_answer = answer_from_facets(query, product_data)
+        if facet_answer:
+            return facet_answer
     
     # Always use Helicone for complex queries or when no user_id is provided (Shopify requests)
+    wants_explanation = 'explanation' in intents
     should_use_helicone = (
         user_id is None or 
         user_id == 'anonymous' or 
         len(query.split()) > 3 or  # Complex queries
-        any(word in query_lower for word in ['explain', 'what is', 'how does', 'why', 'tell me about', 'describe'])
+        wants_explanation
     )
     
     if should_use_helicone:
+        # Descriptive product searches ("something with sandalwood notes") are answered
+        # from the catalog; explanations still go to Gemini
+        if not wants_explanation:
+            catalog_answer = answer_from_catalog(query, product_data)
+            if catalog_answer:
+                logger.info(f"Answered from catalog retrieval: {query[:50]}...")
+                return catalog_answer
         logger.info(f"Using Helicone for query: {query[:50]}... (user_id: {user_id})")
-        return call_gemini_via_helicone(query, user_id or 'shopify-user', session_id or 'shopify-session')
+        return LLMRequest(query, user_id or 'shopify-user', session_id or 'shopify-session',
+                          conversation_history(memory, session_id))
     
-    if any(word in query_lower for word in ['hello', 'hi', 'hey']):
-        return "Hello! Welcome to Starky Shop. How can I help you today?"
-    elif any(word in query_lower for word in ['product', 'item', 'what']):
-        product_info = []
-        for i, product in enumerate(product_data[:3]):
-            title = product.get('title', 'N/A')
-            price = product.get('variants', [{}])[0].get('price', 'N/A')
-            link = generate_product_link(product)
-            if link:
-                product_info.append(f"{i+1}. [{title}]({link}) - ${price}")
-            else:
-                product_info.append(f"{i+1}. {title} - ${price}")
-        return f"Here are some of our products:\n" + "\n".join(product_info)
-    elif any(word in query_lower for word in ['price', 'cost', 'how much']):
-        return "I can help you find product prices. Could you specify which product you're interested in?"
-    elif any(word in query_lower for word in ['shipping', 'delivery']):
-        return "Shipping information varies by product. Most items require shipping. Would you like to know about a specific product?"
-    elif any(word in query_lower for word in ['link', 'url', 'buy', 'purchase']):
-        search_terms = query_lower.replace('link', '').replace('url', '').replace('buy', '').replace('purchase', '').strip()
+    # A stock question that named no product has no answer of its own; the next intent
+    # ("is shipping available" -> shipping) or the product search takes it
+    intent = next((name for name in intents if name != 'stock'), None)
+    if intent == 'greeting':
+        return GREETING_ANSWER
+    elif intent == 'product_info':
+        return canned_catalog_answer(product_data, 'product_info', product_info_answer)
+    elif intent == 'price':
+        return PRICE_ANSWER
+    elif intent == 'shipping':
+        return SHIPPING_ANSWER
+    elif intent == 'link':
+        search_terms = intent_router.strip(query, 'link')
         if search_terms:
             matching_products = find_product_by_name(search_terms, product_data)
             if matching_products:
+                inventory = inventory_of(product_data)
                 response = "Here are the products I found:\n"
                 for i, product in enumerate(matching_products[:5]):
-                    title = product.get('title', 'N/A')
-                    price = product.get('variants', [{}])[0].get('price', 'N/A')
-                    link = generate_product_link(product)
+                    title = product.title
+                    price = price_label(product, inventory)
+                    link = product.link
                     if link:
-                        response += f"{i+1}. [{title}]({link}) - ${price}\n"
+                        response += f"{i+1}. [{title}]({link}) - {price}\n"
                     else:
-                        response += f"{i+1}. {title} - ${price}\n"
+                        response += f"{i+1}. {title} - {price}\n"
                 return response
             else:
                 return f"I couldn't find any products matching '{search_terms}'. Try searching for a different product name."
         else:
-            return "Please specify which product you'd like the link for. For example: 'link for belts' or 'buy t-shirt'"
-    elif any(word in query_lower for word in ['bye', 'goodbye', 'exit']):
-        return "Thank you for visiting Starky Shop! Have a great day!"
+            return LINK_PROMPT_ANSWER
+    elif intent == 'goodbye':
+        return GOODBYE_ANSWER
     else:
         matching_products = find_product_by_name(query, product_data)
         if matching_products:
+            inventory = inventory_of(product_data)
             response = f"I found some products that might interest you:\n"
             for i, product in enumerate(matching_products[:3]):
-                title = product.get('title', 'N/A')
-                price = product.get('variants', [{}])[0].get('price', 'N/A')
-                link = generate_product_link(product)
+                title = product.title
+                price = price_label(product, inventory)
+                link = product.link
                 if link:
-                    response += f"{i+1}. [{title}]({link}) - ${price}\n"
+                    response += f"{i+1}. [{title}]({link}) - {price}\n"
                 else:
-                    response += f"{i+1}. {title} - ${price}\n"
+                    response += f"{i+1}. {title} - {price}\n"
             response += "You can ask me for product links, prices, or shipping information!"
             return response
         else:
+            catalog_answer = answer_from_catalog(query, product_data)
+            if catalog_answer:
+                return catalog_answer
             # Fallback: ask Gemini for a general answer with enhanced observability
-            return call_gemini_via_helicone(query, user_id or 'shopify-user', session_id or 'shopify-session')
+            return LLMRequest(query, user_id or 'shopify-user', session_id or 'shopify-session',
+                              conversation_history(memory, session_id))
+
+def generate_chatbot_response(query, product_data, memory=None, user_id=None, session_id=None, client_ip=None):
+    """
+    Answer a query; with a ConversationStore as ``memory`` the session's earlier turns
+    are used and extended. Returns RateLimited when ``client_ip`` is over its budget.
+    """
+    wait = rate_limit_wait('local', user_id, session_id, client_ip)
+    if wait:
+        return RateLimited(wait)
+    answer = route_chatbot_query(query, product_data, memory=memory, user_id=user_id, session_id=session_id)
+    wait = isinstance(answer, LLMRequest) and rate_limit_wait('llm', user_id, session_id, client_ip)
+    if wait:
+        return RateLimited(wait)
+    record_answer_path(answer)
+    if isinstance(answer, LLMRequest):
+        # Fail fast to the catalog while the circuit breaker is open
+        if gemini_breaker.is_open():
+            answer = GEMINI_UNAVAILABLE_MESSAGE
+        else:
+            answer = call_gemini_via_helicone(answer.prompt, answer.user_id, answer.session_id, answer.history)
+        if answer == GEMINI_UNAVAILABLE_MESSAGE or (answer == GEMINI_OVERLOADED_MESSAGE and shed_fallback_enabled()):
+            answer = catalog_fallback_answer(query, product_data)
+    remember_exchange(memory, session_id, query, answer)
+    return answer
+
+def shed_stream_event(query, product_data):
+    """SSE answer to a shed streaming request: the catalog fallback, or an error event"""
+    if shed_fallback_enabled():
+        return format_sse('done', {'html': render_markdown(catalog_fallback_answer(query, product_data))})
+    return format_sse('error', {'error': GEMINI_OVERLOADED_MESSAGE})
+
+def stream_chatbot_response(query, product_data, memory=None, user_id=None, session_id=None, client_ip=None):
+    """
+    Route the query and return a generator of its SSE events (local answers arrive as
+    a single 'done' event), or RateLimited before anything is streamed
+    """
+    wait = rate_limit_wait('local', user_id, session_id, client_ip)
+    if wait:
+        return RateLimited(wait)
+    answer = route_chatbot_query(query, product_data, memory=memory, user_id=user_id, session_id=session_id)
+    wait = isinstance(answer, LLMRequest) and rate_limit_wait('llm', user_id, session_id, client_ip)
+    if wait:
+        return RateLimited(wait)
+    record_answer_path(answer)
+    if isinstance(answer, LLMRequest) and gemini_breaker.is_open():
+        answer = catalog_fallback_answer(query, product_data)
+    return stream_answer_events(answer, query, product_data, memory, session_id)
+
+def done_event(answer):
+    """The final SSE event of a local answer; prerendered for a CannedAnswer"""
+    if isinstance(answer, CannedAnswer):
+        return answer.sse
+    return format_sse('done', {'html': render_markdown(answer)})
+
+def stream_answer_events(answer, query, product_data, memory, session_id):
+    """SSE events for a routed answer, streaming Gemini's text as it arrives"""
+    if not isinstance(answer, LLMRequest):
+        remember_exchange(memory, session_id, query, answer)
+        yield done_event(answer)
+        return
+    renderer = MarkdownStreamRenderer(render_markdown)
+    parts = []
+    for delta in stream_gemini_via_helicone(answer.prompt, answer.user_id, answer.session_id, answer.history):
+        if not parts and delta == GEMINI_OVERLOADED_MESSAGE:
+            yield shed_stream_event(query, product_data)
+            return
+        parts.append(delta)
+        yield from renderer.feed(delta)
+    yield from renderer.finish()
+    remember_exchange(memory, session_id, query, ''.join(parts))
 
 app = Flask(__name__, template_folder='templates')
 CORS(app)
@@ -275,6 +1111,30 @@ def index():
             chatMessages.scrollTop = chatMessages.scrollHeight;
         }
         
+        function handleStreamEvent(messageDiv, state, eventName, payload) {
+            if (eventName === 'block') {
+                state.html += payload.html;
+                state.pending = '';
+            } else if (eventName === 'delta') {
+                state.pending = payload.text;
+            } else if (eventName === 'done') {
+                state.html = payload.html;
+                state.pending = '';
+            } else if (eventName === 'error') {
+                state.html = 'Error: ' + payload.error;
+                state.pending = '';
+            }
+            // Completed blocks are rendered HTML; the open block is shown as plain text
+            messageDiv.innerHTML = state.html;
+            if (state.pending) {
+                const pendingSpan = document.createElement('span');
+                pendingSpan.textContent = state.pending;
+                messageDiv.appendChild(pendingSpan);
+            }
+            const chatMessages = document.getElementById('chatMessages');
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+        
         async function sendMessage() {
             const messageInput = document.getElementById('messageInput');
             const message = messageInput.value.trim();
@@ -284,7 +1144,7 @@ def index():
             messageInput.value = '';
             
             try {
-                const response = await fetch('/chat', {
+                const response = await fetch('/chat/stream', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
@@ -294,11 +1154,36 @@ def index():
                     })
                 });
                 
-                const data = await response.json();
-                if (data.error) {
-                    addMessage('Error: ' + data.error);
-                } else {
-                    addMessage(data.response);
+                if (!response.ok) {
+                    const data = await response.json();
+                    addMessage('Error: ' + (data.error || response.status));
+                    return;
+                }
+                
+                addMessage('');
+                const messageDiv = document.getElementById('chatMessages').lastElementChild;
+                const state = { html: '', pending: '' };
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                        const rawEvent = buffer.slice(0, boundary);
+                        buffer = buffer.slice(boundary + 2);
+                        let eventName = 'message';
+                        let dataLines = [];
+                        for (const line of rawEvent.split('\\n')) {
+                            if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                        }
+                        if (dataLines.length) {
+                            handleStreamEvent(messageDiv, state, eventName, JSON.parse(dataLines.join('\\n')));
+                        }
+                    }
                 }
             } catch (error) {
                 addMessage('Error: Could not connect to the server.');
@@ -315,44 +1200,257 @@ def index():
 </html>'''
     return html_content
 
+# Sent with 503s for shed requests
+OVERLOADED_HEADERS = {'Retry-After': '1'}
+
+# Set once a forwarded request was seen without RATE_LIMIT_CLIENT_IP_HEADER configured
+proxy_header_warned = False
+
+def client_ip_of(headers, remote_addr):
+    """Client address for rate limiting: RATE_LIMIT_CLIENT_IP_HEADER's first entry behind a proxy"""
+    global proxy_header_warned
+    header = HeliconeConfig.RATE_LIMIT_CLIENT_IP_HEADER
+    forwarded = headers.get(header) if header else None
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    if not header and not proxy_header_warned and HeliconeConfig.RATE_LIMIT_ENABLED and headers.get('X-Forwarded-For'):
+        proxy_header_warned = True
+        logger.warning("Request forwarded by a proxy but RATE_LIMIT_CLIENT_IP_HEADER is unset: every client "
+                       "shares the proxy's per-IP rate limit. Set RATE_LIMIT_CLIENT_IP_HEADER=X-Forwarded-For")
+    return remote_addr or 'unknown'
+
+def rate_limit_headers(limited):
+    return {'Retry-After': str(max(1, math.ceil(limited.retry_after)))}
+
+def rate_limited_response(route, limited):
+    CHAT_REQUESTS.labels(route, 429).inc()
+    return jsonify({'error': RATE_LIMITED_MESSAGE}), 429, rate_limit_headers(limited)
+
+def apply_inventory_updates(data, authorization, shop=None):
+    """
+    Apply a POST /inventory body to the live catalog's stock levels in place:
+    ``{"updates": [{"variant_id": 1, "delta": -2}, {"variant_id": 2, "quantity": 5}]}``.
+    Returns (body, status) for the sync and async views. The next reload of
+    products.json replaces these levels with the synced ones. Under pre-fork only
+    the default shop's stock is shared between workers, so other shops are refused
+    rather than updated in one worker's private copy.
+    """
+    token = HeliconeConfig.INVENTORY_UPDATE_TOKEN
+    if not token:
+        return {'error': 'Inventory updates are disabled'}, 404
+    if not hmac.compare_digest(authorization or '', f"Bearer {token}"):
+        return {'error': 'Unauthorized'}, 401
+    if prefork.in_worker() and shop not in (None, SHOP_NAME):
+        return {'error': 'Inventory updates for other shops are not supported with pre-fork workers'}, 409
+    updates = data.get('updates') if isinstance(data, dict) else None
+    if not isinstance(updates, list):
+        return {'error': 'Expected {"updates": [...]}'}, 400
+    deltas = []
+    levels = []
+    try:
+        for update in updates:
+            if 'quantity' in update:
+                levels.append((update['variant_id'], int(update['quantity'])))
+            else:
+                deltas.append((update['variant_id'], int(update['delta'])))
+    except (KeyError, TypeError, ValueError):
+        return {'error': 'Each update needs variant_id and an integer delta or quantity'}, 400
+    inventory = get_catalog(shop).inventory_index
+    applied = inventory.apply(deltas) + inventory.apply(levels, absolute=True)
+    INVENTORY_UPDATES.inc(applied)
+    logger.info(f"Applied {applied} of {len(updates)} inventory updates")
+    return {'applied': applied, 'unknown': len(updates) - applied}, 200
+
+@app.route('/inventory', methods=['POST'])
+def inventory_update():
+    """In-place stock level updates, e.g. from a Shopify inventory webhook relay"""
+    data = request.get_json(silent=True)
+    try:
+        shop = request_shop(data.get('shop') if isinstance(data, dict) else None, request.headers, request.args)
+        body, status = apply_inventory_updates(data, request.headers.get('Authorization'), shop)
+    except UnknownShopError:
+        body, status = {'error': UNKNOWN_SHOP_MESSAGE}, 404
+    return jsonify(body), status
+
 @app.route('/chat', methods=['POST'])
 def chat():
+    start_time = time.perf_counter()
     data = request.json
     user_query = data.get('message', '') if data else ''
     user_id = data.get('user_id', 'anonymous') if data else 'anonymous'
     session_id = data.get('session_id', 'default') if data else 'default'
+    try:
+        shop = request_shop(data.get('shop') if data else None, request.headers, request.args)
+        catalog = get_catalog(shop)
+    except UnknownShopError:
+        CHAT_REQUESTS.labels('/chat', 404).inc()
+        return jsonify({'error': UNKNOWN_SHOP_MESSAGE}), 404
     
     # Log incoming request
     logger.info(f"Chat request - User: {user_id}, Session: {session_id}, Query: {user_query[:50]}...")
     
     if not user_query:
+        CHAT_REQUESTS.labels('/chat', 400).inc()
         return jsonify({'error': 'No message provided'}), 400
     
     # Log incoming request
     logger.info(f"Chat request received - User: {user_id}, Session: {session_id}")
     
-    answer = generate_chatbot_response(user_query, products, user_id=user_id, session_id=session_id)
-    html_answer = markdown.markdown(answer)
-    
+    answer = generate_chatbot_response(
+        user_query, catalog, memory=conversation_memory, user_id=user_id, session_id=session_id,
+        client_ip=client_ip_of(request.headers, request.remote_addr)
+    )
+    if isinstance(answer, RateLimited):
+        return rate_limited_response('/chat', answer)
+    if answer == GEMINI_OVERLOADED_MESSAGE:
+        CHAT_REQUESTS.labels('/chat', 503).inc()
+        return jsonify({'error': answer}), 503, OVERLOADED_HEADERS
     # Log response
     logger.info(f"Chat response sent - User: {user_id}, Response length: {len(answer)}")
     
-    return jsonify({'response': html_answer})
+    if isinstance(answer, CannedAnswer):
+        response = Response(answer.body, mimetype='application/json')
+    else:
+        response = jsonify({'response': render_markdown(answer)})
+    CHAT_OK_BLOCKING.inc()
+    elapsed = time.perf_counter() - start_time
+    CHAT_LATENCY_BLOCKING.observe(elapsed)
+    shop_registry.record_request(shop, elapsed)
+    return response
+
+# Headers that keep proxies from buffering the event stream
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same request body as /chat, answered as Server-Sent Events"""
+    start_time = time.perf_counter()
+    data = request.json
+    user_query = data.get('message', '') if data else ''
+    user_id = data.get('user_id', 'anonymous') if data else 'anonymous'
+    session_id = data.get('session_id', 'default') if data else 'default'
+    try:
+        shop = request_shop(data.get('shop') if data else None, request.headers, request.args)
+        catalog = get_catalog(shop)
+    except UnknownShopError:
+        CHAT_REQUESTS.labels('/chat/stream', 404).inc()
+        return jsonify({'error': UNKNOWN_SHOP_MESSAGE}), 404
+    
+    logger.info(f"Chat stream request - User: {user_id}, Session: {session_id}, Query: {user_query[:50]}...")
+    
+    if not user_query:
+        CHAT_REQUESTS.labels('/chat/stream', 400).inc()
+        return jsonify({'error': 'No message provided'}), 400
+    
+    events = stream_chatbot_response(
+        user_query, catalog, memory=conversation_memory, user_id=user_id, session_id=session_id,
+        client_ip=client_ip_of(request.headers, request.remote_addr)
+    )
+    if isinstance(events, RateLimited):
+        return rate_limited_response('/chat/stream', events)
+    CHAT_OK_STREAM.inc()
+    events = observe_stream_latency(events, start_time, shop)
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+def get_health_status():
+    """Health payload shared by the sync and async servers"""
+    breaker = gemini_breaker.stats()
+    return {
+        'status': 'degraded' if breaker['state'] == CircuitBreaker.OPEN else 'healthy',
+        'helicone_configured': HeliconeConfig.is_configured(),
+        'google_api_configured': bool(HeliconeConfig.GOOGLE_API_KEY),
+        'products_loaded': len(get_catalog()),
+        'startup_seconds': round(STARTUP_DURATION, 4),
+        'catalog': catalog_reloader.stats(),
+        'inventory': get_catalog().inventory_index.stats(),
+        'fuzzy_search': get_catalog().fuzzy_index.stats(),
+        'llm_cache': llm_cache.stats(),
+        'markdown_memo': markdown_renderer.stats(),
+        'canned_responses': canned_responses.stats(),
+        'llm_coalescing': llm_flights.stats(),
+        'llm_circuit_breaker': breaker,
+        'llm_admission': llm_admission.stats(),
+        'rate_limiter': rate_limiter.stats(),
+        'shops': shop_registry.stats(),
+        'worker': prefork.worker_stats(),
+        'conversation_memory': conversation_memory.stats() if conversation_memory else None
+    }
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for monitoring"""
-    return jsonify({
-        'status': 'healthy',
-        'helicone_configured': HeliconeConfig.is_configured(),
-        'google_api_configured': bool(HeliconeConfig.GOOGLE_API_KEY),
-        'products_loaded': len(products) if products else 0
-    })
+    return jsonify(get_health_status())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+STARTUP_DURATION = time.perf_counter() - STARTUP_STARTED
+logger.info(f"Chatbot initialised in {STARTUP_DURATION * 1000:.1f}ms (catalog from {get_catalog().source} in {get_catalog().load_duration * 1000:.1f}ms)")
+
+def run_prefork_server(serving_mode, host, port, workers, max_requests=0):
+    """
+    Serve with ``workers`` forked processes (see prefork.PreforkServer). This process
+    keeps the catalog, indexes and shared stock levels and only supervises: it polls
+    products.json itself and re-forks the workers when the catalog changes or on
+    SIGHUP. Each worker has its own LLM cache, conversation memory, rate limits and
+    metrics, and loads other shops' catalogs (SHOPS_DIR) on its own.
+    """
+    sock = prefork.create_listen_socket(host, port)
+    # No thread may be running while forking; the workers start their own after the fork
+    catalog_reloader.stop()
+    shop_registry.stop()
+
+    def before_fork():
+        http_client.close_session()
+        get_catalog().prepare_for_fork()
+        warm_canned_answers(get_catalog())
+
+    def after_fork(worker_id):
+        if CATALOG_RELOAD_INTERVAL > 0:
+            shop_registry.start()
+
+    # Imported here rather than in each worker, so the modules are shared too
+    from async_app import run_async_server
+
+    def serve(sock, worker_id):
+        if serving_mode == 'async':
+            run_async_server(sys.modules[__name__], sock=sock)
+        else:
+            prefork.serve_wsgi(app, sock)
+
+    logger.info(f"Starting pre-fork {serving_mode} chat server on {host}:{port} with {workers} workers")
+    prefork.PreforkServer(
+        sock, serve, workers, before_fork=before_fork, after_fork=after_fork,
+        check=catalog_reloader.check_for_changes if CATALOG_RELOAD_INTERVAL > 0 else None,
+        reload=catalog_reloader.reload, poll_interval=CATALOG_RELOAD_INTERVAL,
+        max_requests=max_requests, max_requests_jitter=max_requests // 10
+    ).run()
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1 and sys.argv[1] == 'api':
-        app.run(host="0.0.0.0", port=5000)
+        port = int(os.environ.get("PORT", "5000"))
+        # --sync / --async override CHAT_SERVING_MODE; async is the default
+        serving_mode = os.environ.get("CHAT_SERVING_MODE", "async")
+        if '--sync' in sys.argv[2:]:
+            serving_mode = 'sync'
+        elif '--async' in sys.argv[2:]:
+            serving_mode = 'async'
+        # --workers N (or CHAT_WORKERS, "auto" for one per CPU) forks N worker processes
+        workers = os.environ.get("CHAT_WORKERS", "0")
+        if '--workers' in sys.argv[2:-1]:
+            workers = sys.argv[sys.argv.index('--workers') + 1]
+        workers = (os.cpu_count() or 1) if workers == 'auto' else int(workers)
+        if workers > 0:
+            run_prefork_server(serving_mode, "0.0.0.0", port, workers,
+                               max_requests=int(os.environ.get("CHAT_WORKER_MAX_REQUESTS", "0")))
+        elif serving_mode == 'async':
+            from async_app import run_async_server
+            run_async_server(sys.modules[__name__], host="0.0.0.0", port=port)
+        else:
+            app.run(host="0.0.0.0", port=port)
     else:
         print("Welcome to Starky Shop Chatbot! Type 'quit' to exit.\n")
         while True:
@@ -360,5 +1458,7 @@ if __name__ == "__main__":
             if user_query.lower() in ['quit', 'exit', 'bye']:
                 print("Goodbye!")
                 break
-            answer = generate_chatbot_response(user_query, products)
+            answer = generate_chatbot_response(
+                user_query, get_catalog(), memory=conversation_memory, session_id='cli-session'
+            )
             print(f"Bot: {answer}\n")
@@ -0,0 +1,516 @@
+"""
+asyncio serving mode for the chatbot.
+
+An in-flight Gemini call is just a suspended coroutine here, so one process can keep
+hundreds of LLM requests open without a worker thread per request. Local keyword
+answers never touch the network and are returned straight from the event loop.
+Start with ``python data/app.py api`` (or ``--sync`` for the Flask server).
+"""
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prefork
+from helicone_config import HeliconeConfig
+from resilience import Deadline, hedged_call_async
+from streaming import MarkdownStreamRenderer, parse_gemini_sse_line
+
+CHATBOT_KEY = web.AppKey('chatbot', object)
+CLIENT_SESSION_KEY = web.AppKey('client_session', aiohttp.ClientSession)
+
+
+def create_client_session():
+    """Pooled keep-alive client sized for many concurrent gateway requests"""
+    connector = aiohttp.TCPConnector(
+        limit=HeliconeConfig.ASYNC_POOL_MAXSIZE,
+        limit_per_host=HeliconeConfig.ASYNC_POOL_MAXSIZE,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        sock_connect=HeliconeConfig.CONNECT_TIMEOUT,
+        sock_read=HeliconeConfig.READ_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def with_gemini_retries_async(chatbot, attempt_fn, request_id, deadline, rejected_result):
+    """Async counterpart of ``with_gemini_retries``"""
+    result = rejected_result
+    for attempt in range(chatbot.retry_policy.max_attempts):
+        if attempt:
+            delay = chatbot.retry_policy.delay(attempt - 1)
+            if not chatbot.retry_policy.should_retry(attempt - 1, delay, deadline, HeliconeConfig.LLM_MIN_ATTEMPT_TIME):
+                break
+            chatbot.logger.warning(f"Retrying Helicone request - ID: {request_id}, Attempt: {attempt + 1}, Delay: {delay:.2f}s")
+            chatbot.GEMINI_RETRIES.inc()
+            await asyncio.sleep(delay)
+        elif deadline.remaining() <= HeliconeConfig.LLM_MIN_ATTEMPT_TIME:
+            chatbot.logger.warning(f"Deadline nearly spent, skipping Helicone request - ID: {request_id}")
+            break
+        if not chatbot.gemini_breaker.allow_request():
+            chatbot.logger.warning(f"Circuit breaker open, skipping Helicone request - ID: {request_id}")
+            break
+        result, retryable = await attempt_fn(attempt)
+        if not retryable:
+            break
+    return result
+
+
+async def send_gemini_request_async(chatbot, session, headers, data, deadline):
+    """One gateway round trip, hedged when enabled; returns (status, JSON payload or error text)"""
+    timeout = aiohttp.ClientTimeout(
+        total=chatbot.attempt_timeout(deadline), sock_connect=HeliconeConfig.CONNECT_TIMEOUT
+    )
+
+    async def send():
+        async with session.post(HeliconeConfig.get_gateway_url(), headers=headers, json=data, timeout=timeout) as response:
+            if response.status == 200:
+                return response.status, await response.json(content_type=None)
+            return response.status, await response.text()
+
+    if not HeliconeConfig.LLM_HEDGING_ENABLED:
+        return await send()
+    result, hedged = await hedged_call_async(
+        send, chatbot.hedge_delay(), deadline.remaining(), lambda result: result[0] == 200
+    )
+    if hedged:
+        chatbot.GEMINI_HEDGES.inc()
+    return result
+
+
+async def attempt_gemini_request_async(chatbot, session, prompt, request_id, headers, data, cache_key, user_id, deadline, attempt):
+    """Async counterpart of ``attempt_gemini_request``"""
+    logger = chatbot.logger
+    start_time = time.time()
+    try:
+        logger.info(f"Making async Helicone request - ID: {request_id}, User: {user_id}, Prompt length: {len(prompt)}, Attempt: {attempt + 1}")
+
+        status, body = await send_gemini_request_async(chatbot, session, headers, data, deadline)
+        response_time = time.time() - start_time
+        logger.info(f"Helicone response - ID: {request_id}, Status: {status}, Time: {response_time:.2f}s")
+
+        if status == 200:
+            chatbot.gemini_breaker.record_success()
+            chatbot.gemini_latency_window.record(response_time)
+            return chatbot.extract_gemini_text(body, request_id, cache_key), False
+        logger.error(f"Helicone API error - ID: {request_id}, Status: {status}, Response: {body}")
+        chatbot.record_gemini_error(status)
+        return chatbot.gemini_status_error_message(status), chatbot.record_gemini_status(status)
+
+    except asyncio.TimeoutError:
+        logger.error(f"Helicone request timeout - ID: {request_id}")
+        chatbot.record_gemini_error('timeout')
+        chatbot.gemini_breaker.record_failure()
+        return chatbot.GEMINI_TIMEOUT_MESSAGE, True
+
+    except aiohttp.ClientError as e:
+        logger.error(f"Helicone request failed - ID: {request_id}, Error: {e}")
+        chatbot.record_gemini_error('connection')
+        chatbot.gemini_breaker.record_failure()
+        return chatbot.GEMINI_CONNECTION_ERROR_MESSAGE, True
+
+    except Exception as e:
+        logger.error(f"Unexpected error in Helicone call - ID: {request_id}, Error: {e}")
+        chatbot.record_gemini_error('unexpected')
+        chatbot.gemini_breaker.record_failure()
+        return chatbot.GEMINI_UNEXPECTED_ERROR_MESSAGE, False
+
+    finally:
+        chatbot.GEMINI_LATENCY_BLOCKING.observe(time.time() - start_time)
+
+
+async def admit_gemini_call_async(chatbot, request_id, deadline):
+    """Async counterpart of ``admit_gemini_call``"""
+    wait_start = time.perf_counter()
+    admitted = await chatbot.llm_admission.acquire_async(deadline.remaining())
+    return chatbot.record_admission(admitted, request_id, wait_start)
+
+
+async def request_gemini_via_helicone_async(chatbot, session, prompt, request_id, headers, data, cache_key, user_id=None):
+    """Async counterpart of ``request_gemini_via_helicone``"""
+    deadline = Deadline(HeliconeConfig.LLM_DEADLINE)
+    if not await admit_gemini_call_async(chatbot, request_id, deadline):
+        return chatbot.GEMINI_OVERLOADED_MESSAGE
+    try:
+        return await with_gemini_retries_async(
+            chatbot,
+            lambda attempt: attempt_gemini_request_async(
+                chatbot, session, prompt, request_id, headers, data, cache_key, user_id, deadline, attempt
+            ),
+            request_id, deadline, chatbot.GEMINI_UNAVAILABLE_MESSAGE
+        )
+    finally:
+        chatbot.llm_admission.release()
+
+
+async def call_gemini_via_helicone_async(chatbot, session, prompt, user_id=None, session_id=None, history=None):
+    """
+    Async counterpart of ``call_gemini_via_helicone``, sharing its headers, local cache,
+    request coalescing and error messages
+    """
+    request_id, headers, data, cache_key = chatbot.prepare_gemini_request(prompt, user_id, session_id, history)
+
+    cached_text = chatbot.get_cached_gemini_response(cache_key, request_id, user_id)
+    if cached_text is not None:
+        return cached_text
+
+    return await chatbot.llm_flights.do_async(
+        cache_key,
+        lambda: request_gemini_via_helicone_async(chatbot, session, prompt, request_id, headers, data, cache_key, user_id)
+    )
+
+
+async def attempt_gemini_stream_async(chatbot, session, request_id, headers, data, deadline):
+    """Async counterpart of ``attempt_gemini_stream``"""
+    logger = chatbot.logger
+    start_time = time.time()
+    timeout = aiohttp.ClientTimeout(
+        total=None, sock_connect=HeliconeConfig.CONNECT_TIMEOUT, sock_read=chatbot.attempt_timeout(deadline)
+    )
+    try:
+        response = await session.post(HeliconeConfig.get_stream_gateway_url(), headers=headers, json=data, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Helicone request timeout - ID: {request_id}")
+        chatbot.record_gemini_error('timeout')
+        chatbot.gemini_breaker.record_failure()
+        return (None, chatbot.GEMINI_TIMEOUT_MESSAGE), True
+    except aiohttp.ClientError as e:
+        logger.error(f"Helicone request failed - ID: {request_id}, Error: {e}")
+        chatbot.record_gemini_error('connection')
+        chatbot.gemini_breaker.record_failure()
+        return (None, chatbot.GEMINI_CONNECTION_ERROR_MESSAGE), True
+
+    logger.info(f"Helicone stream opened - ID: {request_id}, Status: {response.status}, Time: {time.time() - start_time:.2f}s")
+    if response.status == 200:
+        return (response, None), False
+    async with response:
+        logger.error(f"Helicone API error - ID: {request_id}, Status: {response.status}, Response: {await response.text()}")
+    chatbot.record_gemini_error(response.status)
+    return (None, chatbot.gemini_status_error_message(response.status)), chatbot.record_gemini_status(response.status)
+
+
+async def stream_gemini_via_helicone_async(chatbot, session, prompt, user_id=None, session_id=None, history=None):
+    """Async counterpart of ``stream_gemini_via_helicone``, yielding text deltas"""
+    logger = chatbot.logger
+    start_time = time.time()
+    request_id, headers, data, cache_key = chatbot.prepare_gemini_request(prompt, user_id, session_id, history)
+
+    cached_text = chatbot.get_cached_gemini_response(cache_key, request_id, user_id)
+    if cached_text is not None:
+        yield cached_text
+        return
+
+    deadline = Deadline(HeliconeConfig.LLM_DEADLINE)
+    if not await admit_gemini_call_async(chatbot, request_id, deadline):
+        yield chatbot.GEMINI_OVERLOADED_MESSAGE
+        return
+
+    try:
+        logger.info(f"Making async streaming Helicone request - ID: {request_id}, User: {user_id}, Prompt length: {len(prompt)}")
+
+        response, error_message = await with_gemini_retries_async(
+            chatbot,
+            lambda attempt: attempt_gemini_stream_async(chatbot, session, request_id, headers, data, deadline),
+            request_id, deadline, (None, chatbot.GEMINI_UNAVAILABLE_MESSAGE)
+        )
+        if response is None:
+            yield error_message
+            return
+
+        async with response:
+            parts = []
+            async for line in response.content:
+                delta = parse_gemini_sse_line(line)
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+        response_text = ''.join(parts)
+        logger.info(f"Helicone stream finished - ID: {request_id}, Response length: {len(response_text)}, Time: {time.time() - start_time:.2f}s")
+        chatbot.gemini_breaker.record_success()
+        if response_text:
+            chatbot.gemini_latency_window.record(time.time() - start_time)
+            if HeliconeConfig.LOCAL_CACHE_ENABLED:
+                chatbot.llm_cache.set(cache_key, response_text)
+        else:
+            chatbot.record_gemini_error('parse')
+            yield chatbot.GEMINI_PARSE_ERROR_MESSAGE
+
+    except asyncio.TimeoutError:
+        logger.error(f"Helicone request timeout - ID: {request_id}")
+        chatbot.record_gemini_error('timeout')
+        chatbot.gemini_breaker.record_failure()
+        yield chatbot.GEMINI_TIMEOUT_MESSAGE
+
+    except aiohttp.ClientError as e:
+        logger.error(f"Helicone request failed - ID: {request_id}, Error: {e}")
+        chatbot.record_gemini_error('connection')
+        chatbot.gemini_breaker.record_failure()
+        yield chatbot.GEMINI_CONNECTION_ERROR_MESSAGE
+
+    except Exception as e:
+        logger.error(f"Unexpected error in Helicone call - ID: {request_id}, Error: {e}")
+        chatbot.record_gemini_error('unexpected')
+        chatbot.gemini_breaker.record_failure()
+        yield chatbot.GEMINI_UNEXPECTED_ERROR_MESSAGE
+
+    finally:
+        chatbot.llm_admission.release()
+        chatbot.GEMINI_LATENCY_STREAM.observe(time.time() - start_time)
+
+
+async def generate_chatbot_response_async(chatbot, session, query, product_data, memory=None, user_id=None,
+                                          session_id=None, client_ip=None):
+    wait = chatbot.rate_limit_wait('local', user_id, session_id, client_ip)
+    if wait:
+        return chatbot.RateLimited(wait)
+    answer = chatbot.route_chatbot_query(query, product_data, memory=memory, user_id=user_id, session_id=session_id)
+    wait = isinstance(answer, chatbot.LLMRequest) and chatbot.rate_limit_wait('llm', user_id, session_id, client_ip)
+    if wait:
+        return chatbot.RateLimited(wait)
+    chatbot.record_answer_path(answer)
+    if isinstance(answer, chatbot.LLMRequest):
+        if chatbot.gemini_breaker.is_open():
+            answer = chatbot.GEMINI_UNAVAILABLE_MESSAGE
+        else:
+            answer = await call_gemini_via_helicone_async(
+                chatbot, session, answer.prompt, answer.user_id, answer.session_id, answer.history
+            )
+        if answer == chatbot.GEMINI_UNAVAILABLE_MESSAGE or (
+            answer == chatbot.GEMINI_OVERLOADED_MESSAGE and chatbot.shed_fallback_enabled()
+        ):
+            answer = chatbot.catalog_fallback_answer(query, product_data)
+    chatbot.remember_exchange(memory, session_id, query, answer)
+    return answer
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Same permissive CORS policy as flask_cors.CORS(app) on the sync server"""
+    if request.method == 'OPTIONS':
+        response = web.Response()
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get('Access-Control-Request-Headers', '*')
+    else:
+        response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@web.middleware
+async def prefork_middleware(request, handler):
+    """Counts requests toward a pre-fork worker's recycling budget"""
+    prefork.count_request()
+    return await handler(request)
+
+
+def client_ip(request):
+    return request.app[CHATBOT_KEY].client_ip_of(request.headers, request.remote)
+
+
+def rate_limited_response(chatbot, route, limited):
+    chatbot.CHAT_REQUESTS.labels(route, 429).inc()
+    return web.json_response({'error': chatbot.RATE_LIMITED_MESSAGE}, status=429,
+                             headers=chatbot.rate_limit_headers(limited))
+
+
+async def read_chat_request(request):
+    """(message, user_id, session_id, shop) from a /chat body, with the Flask view's defaults"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        data = None
+    user_query = data.get('message', '') if data else ''
+    user_id = data.get('user_id', 'anonymous') if data else 'anonymous'
+    session_id = data.get('session_id', 'default') if data else 'default'
+    return user_query, user_id, session_id, data.get('shop') if data else None
+
+
+async def shop_catalog(chatbot, request, shop):
+    """
+    (shop name, CatalogSnapshot) for a request; a shop that isn't resident yet is
+    loaded in the default executor so the event loop keeps serving. Raises UnknownShopError.
+    """
+    shop = chatbot.request_shop(shop, request.headers, request.query)
+    if chatbot.shop_registry.is_resident(shop):
+        return shop, chatbot.get_catalog(shop)
+    return shop, await asyncio.get_running_loop().run_in_executor(None, chatbot.get_catalog, shop)
+
+
+def unknown_shop_response(chatbot, route):
+    chatbot.CHAT_REQUESTS.labels(route, 404).inc()
+    return web.json_response({'error': chatbot.UNKNOWN_SHOP_MESSAGE}, status=404)
+
+
+async def index(request):
+    return web.Response(text=request.app[CHATBOT_KEY].index(), content_type='text/html')
+
+
+async def chat(request):
+    start_time = time.perf_counter()
+    chatbot = request.app[CHATBOT_KEY]
+    logger = chatbot.logger
+    user_query, user_id, session_id, shop = await read_chat_request(request)
+    try:
+        shop, catalog = await shop_catalog(chatbot, request, shop)
+    except chatbot.UnknownShopError:
+        return unknown_shop_response(chatbot, '/chat')
+
+    logger.info(f"Chat request - User: {user_id}, Session: {session_id}, Query: {user_query[:50]}...")
+
+    if not user_query:
+        chatbot.CHAT_REQUESTS.labels('/chat', 400).inc()
+        return web.json_response({'error': 'No message provided'}, status=400)
+
+    answer = await generate_chatbot_response_async(
+        chatbot, request.app[CLIENT_SESSION_KEY], user_query, catalog,
+        memory=chatbot.conversation_memory, user_id=user_id, session_id=session_id, client_ip=client_ip(request)
+    )
+    if isinstance(answer, chatbot.RateLimited):
+        return rate_limited_response(chatbot, '/chat', answer)
+    if answer == chatbot.GEMINI_OVERLOADED_MESSAGE:
+        chatbot.CHAT_REQUESTS.labels('/chat', 503).inc()
+        return web.json_response({'error': answer}, status=503, headers=chatbot.OVERLOADED_HEADERS)
+    logger.info(f"Chat response sent - User: {user_id}, Response length: {len(answer)}")
+
+    if isinstance(answer, chatbot.CannedAnswer):
+        response = web.Response(body=answer.body, content_type='application/json')
+    else:
+        response = web.json_response({'response': chatbot.render_markdown(answer)})
+    chatbot.CHAT_OK_BLOCKING.inc()
+    elapsed = time.perf_counter() - start_time
+    chatbot.CHAT_LATENCY_BLOCKING.observe(elapsed)
+    chatbot.shop_registry.record_request(shop, elapsed)
+    return response
+
+
+async def chat_stream(request):
+    """Same request body as /chat, answered as Server-Sent Events"""
+    start_time = time.perf_counter()
+    chatbot = request.app[CHATBOT_KEY]
+    logger = chatbot.logger
+    user_query, user_id, session_id, shop = await read_chat_request(request)
+    try:
+        shop, catalog = await shop_catalog(chatbot, request, shop)
+    except chatbot.UnknownShopError:
+        return unknown_shop_response(chatbot, '/chat/stream')
+
+    logger.info(f"Chat stream request - User: {user_id}, Session: {session_id}, Query: {user_query[:50]}...")
+
+    if not user_query:
+        chatbot.CHAT_REQUESTS.labels('/chat/stream', 400).inc()
+        return web.json_response({'error': 'No message provided'}, status=400)
+
+    memory = chatbot.conversation_memory
+    ip = client_ip(request)
+    wait = chatbot.rate_limit_wait('local', user_id, session_id, ip)
+    if wait:
+        return rate_limited_response(chatbot, '/chat/stream', chatbot.RateLimited(wait))
+    answer = chatbot.route_chatbot_query(
+        user_query, catalog, memory=memory, user_id=user_id, session_id=session_id
+    )
+    wait = isinstance(answer, chatbot.LLMRequest) and chatbot.rate_limit_wait('llm', user_id, session_id, ip)
+    if wait:
+        return rate_limited_response(chatbot, '/chat/stream', chatbot.RateLimited(wait))
+
+    chatbot.CHAT_OK_STREAM.inc()
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', **chatbot.SSE_HEADERS})
+    await response.prepare(request)
+
+    chatbot.record_answer_path(answer)
+    if isinstance(answer, chatbot.LLMRequest) and chatbot.gemini_breaker.is_open():
+        answer = chatbot.catalog_fallback_answer(user_query, catalog)
+    if isinstance(answer, chatbot.LLMRequest):
+        renderer = MarkdownStreamRenderer(chatbot.render_markdown)
+        deltas = stream_gemini_via_helicone_async(
+            chatbot, request.app[CLIENT_SESSION_KEY], answer.prompt, answer.user_id, answer.session_id, answer.history
+        )
+        parts = []
+        events = None
+        async for delta in deltas:
+            if not parts and delta == chatbot.GEMINI_OVERLOADED_MESSAGE:
+                events = [chatbot.shed_stream_event(user_query, catalog)]
+                break
+            parts.append(delta)
+            for event in renderer.feed(delta):
+                await response.write(event.encode('utf-8'))
+        if events is None:
+            events = renderer.finish()
+            chatbot.remember_exchange(memory, session_id, user_query, ''.join(parts))
+    else:
+        chatbot.remember_exchange(memory, session_id, user_query, answer)
+        events = [chatbot.done_event(answer)]
+    for event in events:
+        await response.write(event if isinstance(event, bytes) else event.encode('utf-8'))
+    await response.write_eof()
+    elapsed = time.perf_counter() - start_time
+    chatbot.CHAT_LATENCY_STREAM.observe(elapsed)
+    chatbot.shop_registry.record_request(shop, elapsed)
+    return response
+
+
+async def inventory_update(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    chatbot = request.app[CHATBOT_KEY]
+    try:
+        shop = chatbot.request_shop(data.get('shop') if isinstance(data, dict) else None, request.headers, request.query)
+        body, status = chatbot.apply_inventory_updates(data, request.headers.get('Authorization'), shop)
+    except chatbot.UnknownShopError:
+        body, status = {'error': chatbot.UNKNOWN_SHOP_MESSAGE}, 404
+    return web.json_response(body, status=status)
+
+
+async def health_check(request):
+    return web.json_response(request.app[CHATBOT_KEY].get_health_status())
+
+
+async def metrics(request):
+    chatbot = request.app[CHATBOT_KEY]
+    return web.Response(body=chatbot.metrics_registry.render().encode('utf-8'),
+                        headers={'Content-Type': chatbot.METRICS_CONTENT_TYPE})
+
+
+async def _client_session_context(app):
+    app[CLIENT_SESSION_KEY] = create_client_session()
+    yield
+    await app[CLIENT_SESSION_KEY].close()
+
+
+def create_async_app(chatbot, prefork_worker=False):
+    """Build the aiohttp application around the loaded chatbot module (data/app.py)"""
+    middlewares = [prefork_middleware, cors_middleware] if prefork_worker else [cors_middleware]
+    app = web.Application(middlewares=middlewares)
+    app[CHATBOT_KEY] = chatbot
+    app.cleanup_ctx.append(_client_session_context)
+    app.router.add_get('/', index)
+    app.router.add_post('/chat', chat)
+    app.router.add_post('/chat/stream', chat_stream)
+    app.router.add_post('/inventory', inventory_update)
+    app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+
+def run_async_server(chatbot, host="0.0.0.0", port=5000, sock=None):
+    """Serve until SIGINT/SIGTERM; with ``sock`` (a pre-fork worker) on that inherited listening socket"""
+    if sock is not None:
+        web.run_app(create_async_app(chatbot, prefork_worker=True), sock=sock, print=None,
+                    shutdown_timeout=prefork.GRACEFUL_TIMEOUT)
+        return
+    chatbot.logger.info(f"Starting async chat server on {host}:{port}")
+    web.run_app(create_async_app(chatbot), host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    import app as chatbot_app
+    run_async_server(chatbot_app)
@@ -1,54 +1,66 @@
-import requests
 import json
 import sys
 import os
 from urllib.parse import quote
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import SHOPIFY_API_KEY, SHOP_NAME
+from shopify_sync import JSONArrayWriter, ShopifyAPIError, ShopifyClient, stream_products
 
-def fetch_products_from_api():
+PRODUCTS_PATH = "data/products.json"
+
+def save_products_from_api(path=PRODUCTS_PATH):
+    """
+    Stream every product of the shop to ``path`` without holding the catalog in
+    memory; returns the number of products saved (0 on failure)
+    """
     # Convert shop name to proper Shopify subdomain format
     shop_subdomain = SHOP_NAME.lower().replace(' ', '-').replace('_', '-')
-    url = f"https://{shop_subdomain}.myshopify.com/admin/api/2024-01/products.json"
+    base_url = f"https://{shop_subdomain}.myshopify.com/admin/api/2024-01"
     headers = {
         "X-Shopify-Access-Token": SHOPIFY_API_KEY,
         "Content-Type": "application/json"
     }
+    client = ShopifyClient(base_url, headers)
     
     try:
-        response = requests.get(url, headers=headers)
-        print(f"Response status: {response.status_code}")
-        
-        if response.status_code != 200:
-            print(f"Failed to fetch products: {response.status_code}")
-            print(f"Response text: {response.text}")
-            print("Please check your Shopify API key and permissions.")
-            return []
-
-        data = response.json()
-        products = []
-        for product in data.get("products", []):
-            products.append({
-                "id": product.get("id"),
-                "title": product.get("title"),
-                "body_html": product.get("body_html"),
-                "vendor": product.get("vendor"),
-                "product_type": product.get("product_type"),
-                "handle": product.get("handle"),
-                "tags": product.get("tags"),
-                "variants": product.get("variants"),
-                "images": product.get("images"),
-                "image": product.get("image"),
-            })
+        # Follow every page (rate limited, with retries) and stream products to disk
+        with JSONArrayWriter(path) as writer:
+            for product in stream_products(client, workers=1):
+                writer.write({
+                    "id": product.get("id"),
+                    "title": product.get("title"),
+                    "body_html": product.get("body_html"),
+                    "vendor": product.get("vendor"),
+                    "product_type": product.get("product_type"),
+                    "handle": product.get("handle"),
+                    "tags": product.get("tags"),
+                    "variants": product.get("variants"),
+                    "images": product.get("images"),
+                    "image": product.get("image"),
+                })
 
-        with open("data/products.json", "w") as f:
-            json.dump(products, f, indent=4)
-        print(f"Successfully saved {len(products)} products to data/shopify_products.json")
-        return products
+        print(f"Successfully saved {writer.count} products to {path}")
+        return writer.count
+        
+    except ShopifyAPIError as e:
+        print(f"Failed to fetch products: {e}")
+        print("Please check your Shopify API key and permissions.")
+        return 0
         
     except Exception as e:
         print(f"Error fetching products: {e}")
+        return 0
+
+def fetch_products_from_api(path=PRODUCTS_PATH):
+    """
+    Save the shop's products like save_products_from_api and return them as a list
+    ([] on failure). Only for callers that need the records in memory: the list is
+    read back from ``path`` after the streamed write.
+    """
+    if not save_products_from_api(path):
         return []
+    with open(path, 'r') as products_file:
+        return json.load(products_file)
 
 if __name__ == "__main__":
-    fetch_products_from_api()
\ No newline at end of file
+    save_products_from_api()
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+route_chatbot_query: which questions are answered locally and which go to Gemini
+"""
+import logging
+
+import pytest
+
+import app
+
+logging.getLogger('app').setLevel(logging.WARNING)
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return app.get_catalog()
+
+
+def route(query, catalog, user_id='user-1'):
+    return app.route_chatbot_query(query, catalog, user_id=user_id)
+
+
+@pytest.mark.parametrize('query', [
+    "Is delivery available in Mumbai?",
+    "What payment methods are available",
+    "is there a discount code",
+    "tell me more about offers",
+    "shipping takes up to 5 days?",
+    "is shipping free over 500",
+    "what is sandalwood",
+    "why is the perfume out of stock",
+    "cool",
+    "short",
+])
+def test_goes_to_gemini(catalog, query):
+    assert isinstance(route(query, catalog), app.LLMRequest)
+
+
+@pytest.mark.parametrize('query', ["is shipping available", "is delivery available"])
+def test_shipping_wins_over_stock(catalog, query):
+    assert route(query, catalog) is app.SHIPPING_ANSWER
+
+
+@pytest.mark.parametrize('query, expected', [
+    ("what is in stock", "Here's what I found (in stock)"),
+    ("what's in stock", "Here's what I found (in stock)"),
+    ("what is on sale", "Here's what I found (on sale)"),
+    ("perfumes under 20000", "Here's what I found (perfumes, under 20000)"),
+    ("is the perfume in stock?", "- BDC Pour Homme - Perfume: in stock."),
+])
+def test_answered_locally(catalog, query, expected):
+    answer = route(query, catalog, user_id=None)
+    assert not isinstance(answer, app.LLMRequest)
+    assert answer.startswith(expected)
@@ -0,0 +1,244 @@
+"""
+Facet indexes over price, vendor, product type, tags and stock, plus a small parser
+that turns questions like "perfumes under 2000", "what's in stock" or "anything from
+Starky Shop" into facet filters answered from the catalog
+"""
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from retrieval import tokenize
+
+FacetQuery = namedtuple(
+    'FacetQuery', ['min_price', 'max_price', 'vendors', 'product_types', 'tags', 'in_stock', 'on_sale', 'terms']
+)
+
+_AMOUNT = r"(?:rs\.?|inr|₹|\$)?\s*(\d[\d,]*(?:\.\d+)?)\s*(k\b)?"
+_BETWEEN_PATTERN = re.compile(rf"\b(?:between|from)\s+{_AMOUNT}\s*(?:and|to|-)\s*{_AMOUNT}")
+_MAX_PRICE_PATTERN = re.compile(
+    rf"\b(?:under|below|less than|cheaper than|up to|upto|at most|no more than|max(?:imum)?)\s+{_AMOUNT}"
+)
+_MIN_PRICE_PATTERN = re.compile(
+    rf"\b(?:over|above|more than|at least|starting (?:at|from)|min(?:imum)?)\s+{_AMOUNT}"
+)
+_IN_STOCK_PATTERN = re.compile(r"\bin[ -]stock\b")
+_ON_SALE_PATTERN = re.compile(r"\bon sale\b")
+# Also used of delivery, payment or returns ("is cash on delivery available", "any
+# offers?"), so these only filter when the question names products or has a bound
+_AVAILABLE_PATTERN = re.compile(r"\b(?:available|availability)\b")
+_DEALS_PATTERN = re.compile(r"\b(?:discount(?:ed|s)?|deals?|offers?)\b")
+
+# Words of a facet question that say nothing about which products are wanted
+FILLER_WORDS = frozenset([
+    'product', 'products', 'item', 'items', 'stuff', 'thing', 'things', 'everything',
+    'price', 'prices', 'priced', 'cost', 'costs', 'costing', 'rs', 'inr', 'cheap', 'stock',
+    'currently', 'right', 'now', 'today', 'sell', 'selling', 'shop', 'store',
+])
+
+
+def _amount(number, thousands):
+    value = float(number.replace(',', ''))
+    return value * 1000 if thousands else value
+
+
+def _value_pattern(values, prefix=''):
+    """Whole-word alternation of facet values (longest first), tolerating plurals"""
+    alternatives = sorted((re.escape(value) for value in values if value), key=len, reverse=True)
+    if not alternatives:
+        return None
+    return re.compile(prefix + r"\b(" + '|'.join(alternatives) + r")(?:e?s)?\b")
+
+
+def _positions_by_value(values_per_product):
+    """Lowercased facet value -> sorted int32 array of product positions"""
+    postings = {}
+    for position, values in enumerate(values_per_product):
+        for value in values:
+            if value:
+                postings.setdefault(value.lower(), []).append(position)
+    return {value: np.array(positions, dtype=np.int32) for value, positions in postings.items()}
+
+
+class FacetIndex:
+    """
+    Precomputed facets of a product list.
+
+    Prices (the cheapest variant of each product) are kept as an argsort order plus the
+    sorted values, so a price range is two ``np.searchsorted`` calls. Vendor, product
+    type and tag map to position arrays; in-stock and on-sale are boolean masks. A query
+    combines them into one mask over the catalog.
+    """
+
+    def __init__(self, product_data, product_index=None, inventory_index=None):
+        """
+        Index a list of catalog.ProductRecord; ``product_index`` serves free-text terms.
+        With an InventoryIndex the in-stock mask is its live one, so stock updates apply
+        """
+        self.products = list(product_data)
+        self.product_index = product_index
+        self.min_prices = np.array([
+            min((variant.price_value for variant in product.variants if variant.price_value is not None),
+                default=np.nan)
+            for product in self.products
+        ], dtype=np.float64)
+        priced = np.flatnonzero(~np.isnan(self.min_prices))
+        self.price_order = priced[np.argsort(self.min_prices[priced], kind='stable')].astype(np.int32)
+        self.sorted_prices = self.min_prices[self.price_order]
+        if inventory_index is not None:
+            self.in_stock = inventory_index.product_in_stock
+        else:
+            self.in_stock = np.array(
+                [any(variant.available for variant in product.variants) for product in self.products], dtype=bool
+            )
+        self.on_sale = np.array(
+            [any(variant.on_sale for variant in product.variants) for product in self.products], dtype=bool
+        )
+        self.vendors = _positions_by_value((product.vendor,) for product in self.products)
+        self.product_types = _positions_by_value((product.product_type,) for product in self.products)
+        self.tags = _positions_by_value(product.tags for product in self.products)
+        self._vendor_pattern = _value_pattern(self.vendors, prefix=r"\b(?:from|by)\s+(?:the\s+)?")
+        self._value_patterns = [
+            ('product_types', _value_pattern(self.product_types)),
+            ('tags', _value_pattern(self.tags)),
+        ]
+
+    def __len__(self):
+        return len(self.products)
+
+    def parse(self, query):
+        """
+        FacetQuery for a question with a price bound, stock, sale or "from <vendor>"
+        constraint, or None when it has none (plain product searches stay elsewhere).
+        Product types and tags named in such a question narrow it further; any other
+        words must match the products' titles, types, tags or vendor: words that match no
+        catalog token make it a store question ("is delivery available?", "shipping takes
+        up to 5 days") rather than a filter, and None is returned.
+        """
+        text = query.lower()
+        min_price = max_price = None
+        vendors = ()
+
+        match = _BETWEEN_PATTERN.search(text)
+        if match:
+            low, high = _amount(*match.group(1, 2)), _amount(*match.group(3, 4))
+            min_price, max_price = min(low, high), max(low, high)
+            text = text[:match.start()] + ' ' + text[match.end():]
+        else:
+            match = _MAX_PRICE_PATTERN.search(text)
+            if match:
+                max_price = _amount(*match.group(1, 2))
+                text = text[:match.start()] + ' ' + text[match.end():]
+            match = _MIN_PRICE_PATTERN.search(text)
+            if match:
+                min_price = _amount(*match.group(1, 2))
+                text = text[:match.start()] + ' ' + text[match.end():]
+
+        in_stock = bool(_IN_STOCK_PATTERN.search(text))
+        on_sale = bool(_ON_SALE_PATTERN.search(text))
+        available = bool(_AVAILABLE_PATTERN.search(text))
+        deals = bool(_DEALS_PATTERN.search(text))
+        for pattern in (_IN_STOCK_PATTERN, _ON_SALE_PATTERN, _AVAILABLE_PATTERN, _DEALS_PATTERN):
+            text = pattern.sub(' ', text)
+
+        if self._vendor_pattern:
+            vendors = [match.group(1) for match in self._vendor_pattern.finditer(text)]
+            text = self._vendor_pattern.sub(' ', text)
+
+        bounded = min_price is not None or max_price is not None or bool(vendors)
+        if not bounded and not (in_stock or on_sale or available or deals):
+            return None
+
+        values = {'product_types': [], 'tags': []}
+        for facet, pattern in self._value_patterns:
+            if pattern:
+                values[facet] = [match.group(1) for match in pattern.finditer(text)]
+                text = pattern.sub(' ', text)
+
+        terms = tuple(term for term in tokenize(text) if term not in FILLER_WORDS and len(term) > 2)
+        # Only a question about the catalog's own products is a filter; "is delivery
+        # available in mumbai" and "shipping takes up to 5 days" are not
+        if any(self._resolve_term(term) is None for term in terms):
+            return None
+        if not bounded:
+            named = bool(terms or values['product_types'] or values['tags'])
+            if not named and not (in_stock or on_sale):
+                return None
+        in_stock = in_stock or available
+        on_sale = on_sale or deals
+        return FacetQuery(min_price, max_price, tuple(vendors), tuple(values['product_types']),
+                          tuple(values['tags']), in_stock, on_sale, terms)
+
+    def _values_mask(self, postings, values):
+        mask = np.zeros(len(self.products), dtype=bool)
+        for value in values:
+            mask[postings.get(value, [])] = True
+        return mask
+
+    def _resolve_term(self, term):
+        """The catalog token a free-text term (or its singular) matches, or None"""
+        if self.product_index is None:
+            return None
+        postings = self.product_index.postings
+        if term in postings:
+            return term
+        if term.endswith('s') and term[:-1] in postings:
+            return term[:-1]
+        return None
+
+    def _terms_mask(self, terms):
+        """Products whose title/type/tag/vendor tokens contain every term (or its singular)"""
+        mask = np.zeros(len(self.products), dtype=bool)
+        if self.product_index is None:
+            return mask
+        resolved = [self._resolve_term(term) or term for term in terms]
+        mask[self.product_index.search_positions(resolved, require_all=True)] = True
+        return mask
+
+    def search_positions(self, facet_query):
+        """Positions of the matching products, cheapest first"""
+        mask = np.ones(len(self.products), dtype=bool)
+        if facet_query.min_price is not None or facet_query.max_price is not None:
+            low = 0 if facet_query.min_price is None else np.searchsorted(
+                self.sorted_prices, facet_query.min_price, side='left')
+            high = len(self.sorted_prices) if facet_query.max_price is None else np.searchsorted(
+                self.sorted_prices, facet_query.max_price, side='right')
+            price_mask = np.zeros(len(self.products), dtype=bool)
+            price_mask[self.price_order[low:high]] = True
+            mask &= price_mask
+        if facet_query.in_stock:
+            mask &= self.in_stock
+        if facet_query.on_sale:
+            mask &= self.on_sale
+        for postings, values in ((self.vendors, facet_query.vendors),
+                                 (self.product_types, facet_query.product_types),
+                                 (self.tags, facet_query.tags)):
+            if values:
+                mask &= self._values_mask(postings, values)
+        if facet_query.terms:
+            mask &= self._terms_mask(facet_query.terms)
+        positions = np.flatnonzero(mask)
+        return positions[np.argsort(self.min_prices[positions], kind='stable')]
+
+    def search(self, facet_query):
+        """(product, cheapest price) pairs for a FacetQuery, cheapest first"""
+        return [(self.products[position], float(self.min_prices[position]))
+                for position in self.search_positions(facet_query)]
+
+
+def describe_facet_query(facet_query):
+    """Human-readable summary of a FacetQuery, e.g. "perfume, in stock, under 2000" """
+    parts = list(facet_query.terms) + list(facet_query.product_types) + list(facet_query.tags)
+    if facet_query.on_sale:
+        parts.append('on sale')
+    if facet_query.in_stock:
+        parts.append('in stock')
+    if facet_query.min_price is not None and facet_query.max_price is not None:
+        parts.append(f"between {facet_query.min_price:g} and {facet_query.max_price:g}")
+    elif facet_query.max_price is not None:
+        parts.append(f"under {facet_query.max_price:g}")
+    elif facet_query.min_price is not None:
+        parts.append(f"over {facet_query.min_price:g}")
+    if facet_query.vendors:
+        parts.append('from ' + ' or '.join(facet_query.vendors))
+    return ', '.join(parts)
@@ -0,0 +1,206 @@
+"""
+Typo-tolerant product lookup: a character trigram index over the words of product titles
+and handles, with candidates re-ranked by a bounded edit distance
+"""
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from retrieval import tokenize
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Shortest query term that is corrected; shorter words are too ambiguous
+MIN_FUZZY_TERM_LENGTH = 4
+# Most vocabulary words per query term that get an edit-distance check
+MAX_CANDIDATES = 64
+# Longest query term corrected by only one inserted, dropped or swapped letter. Changing
+# a letter of a short word mostly gives another real word ("short" -> "shirt", "good" ->
+# "gold") rather than fixing a typo, so such terms are not corrected by substitution
+SHORT_TERM_LENGTH = 6
+# Wall-clock limit for one lookup; terms not reached in time are left uncorrected
+TIME_BUDGET = 0.005
+
+FuzzyMatch = namedtuple('FuzzyMatch', ['positions', 'corrections', 'candidates', 'elapsed', 'exhausted'])
+
+
+def max_edits(term):
+    """Edits tolerated for a query term: one up to SHORT_TERM_LENGTH characters, two beyond"""
+    return 1 if len(term) <= SHORT_TERM_LENGTH else 2
+
+
+def substitution_cost(term):
+    """Cost of replacing one letter of ``term``: over the edit limit for short terms"""
+    return 2 if len(term) <= SHORT_TERM_LENGTH else 1
+
+
+def trigrams(word):
+    """Character trigrams of a word padded with a space on both sides"""
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a, b, bound, substitution=1):
+    """
+    Optimal string alignment distance (adjacent swaps count once, replacing a letter
+    costs ``substitution``) between two words, or ``bound + 1`` as soon as it is
+    certain to exceed ``bound``
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else substitution
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > bound:
+            return bound + 1
+        previous2, previous = previous, current
+    return min(previous[-1], bound + 1)
+
+
+def _product_words(product):
+    """Words of a title and handle, plus adjacent pairs joined ("t shirt" -> "tshirt")"""
+    words = set()
+    for text in (product.title, (product.handle or '').replace('-', ' ')):
+        tokens = _WORD_PATTERN.findall((text or '').lower())
+        words.update(token for token in tokens if len(token) >= 3)
+        words.update(first + second for first, second in zip(tokens, tokens[1:]))
+    return words
+
+
+class TrigramIndex:
+    """
+    Trigram -> word postings over the vocabulary of product titles and handles.
+
+    A misspelled query term is looked up by its trigrams: the words sharing the most of
+    them (at most ``max_candidates``, and only those the q-gram bound allows within the
+    edit limit) are checked with a bounded edit distance, and the products of the
+    closest words are returned. One lookup stops at ``time_budget`` seconds however
+    large the catalog; ``stats()`` reports the candidate-set sizes seen (mean and max).
+    """
+
+    def __init__(self, product_data, max_candidates=MAX_CANDIDATES, time_budget=TIME_BUDGET):
+        self.products = list(product_data)
+        self.max_candidates = max_candidates
+        self.time_budget = time_budget
+
+        word_products = {}
+        for position, product in enumerate(self.products):
+            for word in _product_words(product):
+                word_products.setdefault(word, []).append(position)
+        self.words = sorted(word_products)
+        self.word_lengths = np.array([len(word) for word in self.words], dtype=np.int32)
+        self.word_products = [np.array(word_products[word], dtype=np.int32) for word in self.words]
+        postings = {}
+        for word_id, word in enumerate(self.words):
+            for gram in trigrams(word):
+                postings.setdefault(gram, []).append(word_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.corrected = 0
+        self.exhausted = 0
+        self.candidates_total = 0
+        self.candidates_max = 0
+
+    def __len__(self):
+        return len(self.words)
+
+    def candidates(self, term, bound):
+        """Word ids that may lie within ``bound`` edits of ``term``, most shared trigrams first"""
+        grams = trigrams(term)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.words))
+        # An edit changes at most three padded trigrams (an adjacent swap four); both lengths
+        # must be within bound too
+        keep = (shared >= max(1, len(grams) - 4 * bound)) & (np.abs(self.word_lengths - len(term)) <= bound)
+        word_ids = np.flatnonzero(keep)
+        shared = shared[word_ids]
+        if len(word_ids) > self.max_candidates:
+            top = np.argpartition(-shared, self.max_candidates - 1)[:self.max_candidates]
+            word_ids, shared = word_ids[top], shared[top]
+        return word_ids[np.argsort(-shared, kind='stable')]
+
+    def match(self, query):
+        """
+        FuzzyMatch for a query: product positions ranked by how many terms they match
+        and how closely, the ``{term: word}`` corrections made, the number of candidate
+        words checked, the time taken and whether the time budget ran out
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + self.time_budget
+        matched = []
+        weights = []
+        corrections = {}
+        checked = 0
+        exhausted = False
+        for term in dict.fromkeys(tokenize(query)):
+            if len(term) < MIN_FUZZY_TERM_LENGTH:
+                continue
+            if time.perf_counter() > deadline:
+                exhausted = True
+                break
+            bound = max_edits(term)
+            substitution = substitution_cost(term)
+            best = bound + 1
+            best_words = []
+            for word_id in self.candidates(term, bound):
+                checked += 1
+                distance = bounded_edit_distance(term, self.words[word_id], min(bound, best), substitution)
+                if distance < best:
+                    best, best_words = distance, [word_id]
+                elif distance == best and distance <= bound:
+                    best_words.append(word_id)
+                if checked % 16 == 0 and time.perf_counter() > deadline:
+                    exhausted = True
+                    break
+            if best_words:
+                corrections[term] = self.words[best_words[0]]
+                for word_id in best_words:
+                    matched.append(self.word_products[word_id])
+                    weights.append(np.full(len(self.word_products[word_id]), bound + 1 - best))
+            if exhausted:
+                break
+        positions = np.empty(0, dtype=np.int64)
+        if matched:
+            scores = np.bincount(np.concatenate(matched), weights=np.concatenate(weights), minlength=len(self.products))
+            positions = np.flatnonzero(scores)
+            positions = positions[np.argsort(-scores[positions], kind='stable')]
+        result = FuzzyMatch(positions, corrections, checked, time.perf_counter() - start_time, exhausted)
+        self._record(result)
+        return result
+
+    def search(self, query):
+        """Products matching a possibly misspelled query, best match first"""
+        return [self.products[position] for position in self.match(query).positions]
+
+    def _record(self, result):
+        with self._lock:
+            self.lookups += 1
+            self.corrected += bool(result.corrections)
+            self.exhausted += result.exhausted
+            self.candidates_total += result.candidates
+            self.candidates_max = max(self.candidates_max, result.candidates)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'words': len(self.words),
+                'trigrams': len(self.postings),
+                'lookups': self.lookups,
+                'corrected': self.corrected,
+                'budget_exhausted': self.exhausted,
+                'candidates_mean': round(self.candidates_total / self.lookups, 2) if self.lookups else 0.0,
+                'candidates_max': self.candidates_max,
+            }
@@ -13,8 +13,12 @@ class HeliconeConfig:
     HELICONE_API_KEY = os.environ.get("HELICONE_API_KEY")
     GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY") or os.environ.get("GEMINI_API_KEY")
     
-    # Helicone Gateway URL (no key yet)
-    BASE_GATEWAY_URL = "https://gateway.helicone.ai/v1beta/models/gemini-2.0-flash:generateContent"
+    # Helicone Gateway URL (no key yet); HELICONE_GATEWAY_BASE points it elsewhere,
+    # e.g. at the local mock gateway in benchmarks/
+    GATEWAY_BASE = os.environ.get("HELICONE_GATEWAY_BASE", "https://gateway.helicone.ai").rstrip("/")
+    BASE_GATEWAY_URL = f"{GATEWAY_BASE}/v1beta/models/gemini-2.0-flash:generateContent"
+    # Streaming variant of the same model endpoint (Server-Sent Events)
+    BASE_STREAM_GATEWAY_URL = f"{GATEWAY_BASE}/v1beta/models/gemini-2.0-flash:streamGenerateContent"
     # Target API URL
     TARGET_URL = "https://generativelanguage.googleapis.com"
     # Application settings
@@ -27,12 +31,74 @@ class HeliconeConfig:
     ENABLE_CACHE = True
     ENABLE_LOGGING = True
     REQUEST_TIMEOUT = 30
+    # Pooled HTTP client settings (timeouts split out of REQUEST_TIMEOUT)
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = REQUEST_TIMEOUT
+    HTTP_POOL_CONNECTIONS = 10
+    HTTP_POOL_MAXSIZE = 32
+    # Connection limit for the asyncio serving mode, where hundreds of calls can be in flight
+    ASYNC_POOL_MAXSIZE = 256
+    # Process-local response cache (in front of Helicone's own cache)
+    LOCAL_CACHE_ENABLED = True
+    LOCAL_CACHE_MAX_ENTRIES = 1024
+    LOCAL_CACHE_TTL = 300
+    # Memo of rendered answer HTML (one reusable markdown instance); longer texts aren't kept
+    MARKDOWN_MEMO_MAX_ENTRIES = 2048
+    MARKDOWN_MEMO_MAX_CHARS = 8192
+    # Resilience of the Gemini call: total time per chat turn (retries included),
+    # jittered retries of 429/5xx/timeouts, optional hedging and the circuit breaker
+    LLM_DEADLINE = 20
+    LLM_MAX_ATTEMPTS = 3
+    LLM_RETRY_BASE_DELAY = 0.25
+    LLM_RETRY_MAX_DELAY = 2.0
+    LLM_MIN_ATTEMPT_TIME = 1.0
+    LLM_HEDGING_ENABLED = False
+    LLM_HEDGE_PERCENTILE = 95
+    LLM_HEDGE_MIN_DELAY = 1.0
+    BREAKER_FAILURE_THRESHOLD = 5
+    BREAKER_RECOVERY_TIMEOUT = 30
+    BREAKER_HALF_OPEN_MAX_CALLS = 1
+    # Admission control: Gemini calls in flight, requests allowed to queue for a slot and
+    # how long they may wait. Shed requests get a catalog answer ("fallback") or a 503 ("error")
+    LLM_MAX_CONCURRENCY = 64
+    LLM_MAX_QUEUE = 64
+    LLM_QUEUE_TIMEOUT = 2.0
+    LLM_SHED_RESPONSE = "fallback"
+    # Token-bucket rate limits per user, session and client IP: requests per second and
+    # burst size, with separate budgets for Gemini-backed and locally answered requests.
+    # An IP's buckets are RATE_LIMIT_IP_MULTIPLIER times larger (several users may share it)
+    RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+    RATE_LIMIT_LLM_RATE = 0.2
+    RATE_LIMIT_LLM_BURST = 10
+    RATE_LIMIT_LOCAL_RATE = 2.0
+    RATE_LIMIT_LOCAL_BURST = 30
+    RATE_LIMIT_IP_MULTIPLIER = 4
+    RATE_LIMIT_MAX_KEYS = 100000
+    # Header carrying the real client IP when running behind a trusted proxy (e.g. "X-Forwarded-For").
+    # Must be set behind a reverse proxy: unset, every request has the proxy's IP and the
+    # per-IP limit throttles all users together (a warning is logged on the first forwarded request)
+    RATE_LIMIT_CLIENT_IP_HEADER = os.environ.get("RATE_LIMIT_CLIENT_IP_HEADER")
+    # Shared secret for POST /inventory (in-place stock updates); the route is off when unset
+    INVENTORY_UPDATE_TOKEN = os.environ.get("INVENTORY_UPDATE_TOKEN")
+    # Per-session conversation memory sent to Gemini as earlier turns
+    MEMORY_ENABLED = True
+    MEMORY_MAX_SESSIONS = 10000
+    MEMORY_MAX_TURNS = 12
+    MEMORY_MAX_TURN_CHARS = 2000
+    MEMORY_MAX_CHARS = 16 * 1024 * 1024
+    MEMORY_IDLE_TTL = 1800
+    MEMORY_TOKEN_BUDGET = 1500
 
     @classmethod
     def get_gateway_url(cls):
         """Return the full Helicone proxy URL with Google API key as query param"""
         return f"{cls.BASE_GATEWAY_URL}?key={cls.GOOGLE_API_KEY}"
 
+    @classmethod
+    def get_stream_gateway_url(cls):
+        """Return the streaming Helicone proxy URL, asking Gemini for SSE output"""
+        return f"{cls.BASE_STREAM_GATEWAY_URL}?alt=sse&key={cls.GOOGLE_API_KEY}"
+
     @classmethod
     def get_base_headers(cls, request_id=None, user_id=None, session_id=None):
         """Get base headers for Helicone requests (per docs)"""
@@ -76,9 +142,10 @@ def get_helicone_headers(request_id=None, user_id=None, session_id=None, prompt_
         headers["helicone-property-prompt-length"] = str(prompt_length)
     return headers
 
-def get_request_data(prompt, temperature=None, max_tokens=None):
+def get_request_data(prompt, temperature=None, max_tokens=None, history=None):
+    """Gemini payload for a prompt, preceded by earlier ``contents`` turns if given"""
     return {
-        "contents": [
+        "contents": list(history or []) + [
             {"role": "user", "parts": [{"text": prompt}]}
         ],
         "generationConfig": HeliconeConfig.get_generation_config(temperature, max_tokens)
@@ -0,0 +1,65 @@
+"""
+Shared pooled HTTP client for the Helicone gateway and the Shopify Admin API
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from helicone_config import HeliconeConfig
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_timeout(read_timeout=None):
+    """(connect, read) timeout tuple; the read part defaults to HeliconeConfig.READ_TIMEOUT"""
+    return (HeliconeConfig.CONNECT_TIMEOUT, HeliconeConfig.READ_TIMEOUT if read_timeout is None else read_timeout)
+
+
+def create_session(pool_connections=None, pool_maxsize=None):
+    """
+    Build a keep-alive session.
+
+    ``pool_connections`` is the number of per-host pools kept open and ``pool_maxsize``
+    the number of reusable connections to each host, so concurrent chat turns share
+    warm TLS connections to the gateway instead of handshaking on every request.
+    """
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections or HeliconeConfig.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize or HeliconeConfig.HTTP_POOL_MAXSIZE,
+        pool_block=False,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Process-wide pooled session, created on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def close_session():
+    """Close pooled connections, e.g. before forking worker processes"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def post(url, timeout=None, **kwargs):
+    """POST through the pooled session with split connect/read timeouts"""
+    return get_session().post(url, timeout=timeout or get_timeout(), **kwargs)
+
+
+def get(url, timeout=None, **kwargs):
+    """GET through the pooled session with split connect/read timeouts"""
+    return get_session().get(url, timeout=timeout or get_timeout(), **kwargs)
@@ -0,0 +1,96 @@
+"""
+Single-pass intent classification for chatbot queries
+"""
+import json
+import re
+
+# Intent name -> trigger phrases, in priority order: when a query matches several
+# intents the one listed first wins. Phrases match whole words only, so "this" is not
+# a greeting and "whatever" is not a product question; list inflections explicitly.
+DEFAULT_INTENTS = {
+    'product_list': [
+        'product list', 'list products', 'show me products', 'give me product list',
+        'show products', 'all products', 'products list'
+    ],
+    'explanation': ['explain', 'what is', 'how does', 'why', 'tell me about', 'describe'],
+    'stock': ['in stock', 'out of stock', 'stock', 'sold out', 'available', 'availability', 'left'],
+    'greeting': ['hello', 'hi', 'hey'],
+    'product_info': ['product', 'products', 'item', 'items', 'what'],
+    'price': ['price', 'prices', 'cost', 'costs', 'how much'],
+    'shipping': ['shipping', 'delivery'],
+    'link': ['link', 'links', 'url', 'urls', 'buy', 'purchase'],
+    'goodbye': ['bye', 'goodbye', 'exit'],
+}
+
+
+def load_intents(path):
+    """Read intent definitions from a JSON object of ``{"intent": ["phrase", ...]}``"""
+    with open(path, 'r') as intents_file:
+        intents = json.load(intents_file)
+    if not isinstance(intents, dict) or not all(isinstance(phrases, list) for phrases in intents.values()):
+        raise ValueError(f"Invalid intent definitions in {path}")
+    return intents
+
+
+class IntentRouter:
+    """
+    Classify a query against every intent with one compiled regular expression.
+
+    All trigger phrases are joined into a single word-bounded alternation (longest
+    phrase first, so "how much" wins over a shorter phrase at the same position) and
+    scanned once; the matched phrases map back to their intents, and the highest
+    priority intent is reported.
+    """
+
+    def __init__(self, intents=None):
+        intents = DEFAULT_INTENTS if intents is None else intents
+        self.priorities = {name: rank for rank, name in enumerate(intents)}
+        self.phrase_intents = {}
+        for name, phrases in intents.items():
+            for phrase in phrases:
+                # The first (highest priority) intent to claim a phrase keeps it
+                self.phrase_intents.setdefault(' '.join(phrase.lower().split()), name)
+        self.pattern = self._compile(self.phrase_intents)
+        self.intent_patterns = {
+            name: self._compile([phrase for phrase, owner in self.phrase_intents.items() if owner == name])
+            for name in intents
+        }
+
+    @staticmethod
+    def _compile(phrases):
+        alternatives = [
+            r'\s+'.join(re.escape(word) for word in phrase.split())
+            for phrase in sorted(phrases, key=len, reverse=True)
+        ]
+        if not alternatives:
+            return None
+        return re.compile(r'\b(?:' + '|'.join(alternatives) + r')\b')
+
+    def intents(self, query):
+        """Every intent the query triggers, highest priority first"""
+        if self.pattern is None:
+            return []
+        found = {
+            self.phrase_intents[' '.join(match.group(0).split())]
+            for match in self.pattern.finditer(query.lower())
+        }
+        return sorted(found, key=self.priorities.__getitem__)
+
+    def classify(self, query):
+        """The highest priority intent of the query, or None"""
+        found = self.intents(query)
+        return found[0] if found else None
+
+    def matched_phrases(self, query, intent):
+        """The trigger phrases of ``intent`` found in a query"""
+        pattern = self.intent_patterns.get(intent)
+        if pattern is None:
+            return set()
+        return {' '.join(match.group(0).split()) for match in pattern.finditer(query.lower())}
+
+    def strip(self, query, intent):
+        """Remove the trigger phrases of ``intent`` from a query"""
+        pattern = self.intent_patterns.get(intent)
+        if pattern is None:
+            return query
+        return ' '.join(pattern.sub(' ', query.lower()).split())
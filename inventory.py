@@ -0,0 +1,302 @@
+"""
+Per-variant stock levels of the catalog, kept in flat arrays so availability questions
+("is the perfume in stock?", "which sizes are left?") are answered locally and inventory
+changes are applied in place, without reloading the catalog
+"""
+import mmap
+import multiprocessing
+import re
+import threading
+
+import numpy as np
+
+# At or below this many units a tracked variant is reported as "only N left"
+LOW_STOCK_THRESHOLD = 5
+
+# Option value Shopify gives the single variant of a product without options
+DEFAULT_OPTION_VALUE = 'default title'
+
+_OPTION_WORD_PATTERN = re.compile(r"[\w'-]+")
+
+
+def option_words(text):
+    """Lowercased words of an option value or a query; "Navy  Blue" -> ('navy', 'blue')"""
+    return tuple(_OPTION_WORD_PATTERN.findall(text.lower()))
+
+
+class InventoryIndex:
+    """
+    Availability of every variant of a product list.
+
+    Variants are laid out product by product: those of product ``i`` occupy
+    ``offsets[i]:offsets[i + 1]`` of the ``quantities``, ``tracked``, ``oversell`` and
+    ``available`` arrays. ``in_stock_counts`` holds each product's number of available
+    variants and ``product_in_stock`` whether it has any; both are kept current by
+    ``apply``, so FacetIndex shares ``product_in_stock`` as its in-stock mask. Option
+    values map ``(product position, value)`` to the positions of the variants carrying
+    them, e.g. every "M" variant of a shirt; a value of several words ("Navy Blue") is
+    keyed by its words joined with single spaces.
+    """
+
+    def __init__(self, product_data, low_stock_threshold=LOW_STOCK_THRESHOLD):
+        self.products = list(product_data)
+        self.low_stock_threshold = low_stock_threshold
+        self.variants = [variant for product in self.products for variant in product.variants]
+        counts = np.array([len(product.variants) for product in self.products], dtype=np.int64)
+        self.offsets = np.zeros(len(self.products) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.product_of = np.repeat(np.arange(len(self.products), dtype=np.int32), counts)
+
+        self.quantities = np.array([variant.inventory_quantity for variant in self.variants], dtype=np.int64)
+        self.tracked = np.array([bool(variant.inventory_management) for variant in self.variants], dtype=bool)
+        self.oversell = np.array([variant.inventory_policy == 'continue' for variant in self.variants], dtype=bool)
+        self.available = (self.quantities > 0) | self.oversell | ~self.tracked
+        self.in_stock_counts = np.bincount(
+            self.product_of[self.available], minlength=len(self.products)
+        ).astype(np.int32)
+        self.product_in_stock = self.in_stock_counts > 0
+        # Bumped by every apply() that changes something, so answers built from the
+        # stock levels (see canned_responses) know when to rebuild
+        self.stock_version = np.zeros(1, dtype=np.int64)
+
+        self.position_of_variant = {variant.id: position for position, variant in enumerate(self.variants)}
+        # Keyed by identity: replicated or re-synced lists may repeat product ids
+        self.position_of_product = {id(product): position for position, product in enumerate(self.products)}
+        option_positions = {}
+        # Most words in any option value: the longest phrase a query is checked for
+        self.max_option_words = 1
+        for position, variant in enumerate(self.variants):
+            for value in variant.options:
+                words = option_words(value)
+                if words and ' '.join(words) != DEFAULT_OPTION_VALUE:
+                    self.max_option_words = max(self.max_option_words, len(words))
+                    option_positions.setdefault((int(self.product_of[position]), ' '.join(words)), []).append(position)
+        self.option_positions = {
+            key: np.array(positions, dtype=np.int32) for key, positions in option_positions.items()
+        }
+
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.unknown_variants = 0
+
+    def __len__(self):
+        return len(self.variants)
+
+    def product_position(self, product):
+        return self.position_of_product.get(id(product))
+
+    def _variant_range(self, product):
+        position = self.product_position(product)
+        if position is None:
+            return None
+        return range(self.offsets[position], self.offsets[position + 1])
+
+    def is_in_stock(self, product):
+        """Whether any variant of the product is in stock"""
+        position = self.product_position(product)
+        if position is None:
+            return any(variant.available for variant in product.variants)
+        return bool(self.product_in_stock[position])
+
+    def units_left(self, variant_position):
+        """Units on hand of a variant, or None when its stock isn't limited"""
+        if not self.tracked[variant_position] or self.oversell[variant_position]:
+            return None
+        return max(0, int(self.quantities[variant_position]))
+
+    def is_low_stock(self, variant_position):
+        units = self.units_left(variant_position)
+        return units is not None and 0 < units <= self.low_stock_threshold
+
+    def display_variant(self, product):
+        """Position of the variant to quote: the first one in stock, else the first one"""
+        variants = self._variant_range(product)
+        if not variants:
+            return None
+        for position in variants:
+            if self.available[position]:
+                return position
+        return variants[0]
+
+    def display_price(self, product):
+        """Price of the first variant in stock (not just the first variant)"""
+        position = self.display_variant(product)
+        if position is None:
+            return product.price
+        return self.variants[position].price
+
+    def stock_note(self, product):
+        """' (sold out)', ' (only N left)' or '' to follow a product in a listing"""
+        position = self.display_variant(product)
+        if position is None:
+            return ''
+        if not self.available[position]:
+            return ' (sold out)'
+        if self.in_stock_counts[self.product_position(product)] == 1 and self.is_low_stock(position):
+            return f" (only {self.units_left(position)} left)"
+        return ''
+
+    def in_stock_products(self, limit=None):
+        """Products with at least one variant in stock, in catalog order"""
+        positions = np.flatnonzero(self.product_in_stock)[:limit]
+        return [self.products[position] for position in positions]
+
+    def option_values(self, product, option_name):
+        """(value, available) for each value of a named option ("Size"), in catalog order"""
+        position = self.product_position(product)
+        names = [name.lower() for name in product.options]
+        if position is None or option_name.lower() not in names:
+            return []
+        index = names.index(option_name.lower())
+        values = {}
+        for variant_position in self._variant_range(product):
+            options = self.variants[variant_position].options
+            if index < len(options):
+                value = options[index]
+                values[value] = values.get(value, False) or bool(self.available[variant_position])
+        return list(values.items())
+
+    def named_variants(self, product, text):
+        """
+        Positions of the variants whose option values ("blue", "xl", "navy blue") all
+        appear in ``text``, or None. Values are matched as whole phrases, longest first,
+        so "navy blue" is not also read as "blue".
+        """
+        position = self.product_position(product)
+        if position is None:
+            return None
+        words = option_words(text)
+        selected = None
+        start = 0
+        while start < len(words):
+            for length in range(min(self.max_option_words, len(words) - start), 0, -1):
+                positions = self.option_positions.get((position, ' '.join(words[start:start + length])))
+                if positions is not None:
+                    selected = positions if selected is None else np.intersect1d(selected, positions)
+                    break
+            else:
+                length = 1
+            start += length
+        return None if selected is None else [int(p) for p in selected]
+
+    def matching_variants(self, product, text):
+        """The variants named in ``text``, else every variant of the product"""
+        named = self.named_variants(product, text)
+        return named if named is not None else list(self._variant_range(product) or ())
+
+    def share(self):
+        """
+        Move the stock arrays into anonymous shared memory, guarded by a process-shared
+        lock, so processes forked afterwards (see prefork) all see each other's ``apply``.
+        Rebind anything holding the old arrays, e.g. FacetIndex.in_stock.
+        """
+        for name in ('quantities', 'available', 'in_stock_counts', 'product_in_stock', 'stock_version'):
+            array = getattr(self, name)
+            shared = np.frombuffer(mmap.mmap(-1, max(array.nbytes, 1)), dtype=array.dtype, count=array.size)
+            shared[:] = array
+            setattr(self, name, shared)
+        self._lock = multiprocessing.Lock()
+
+    def apply(self, changes, absolute=False):
+        """
+        Apply ``(variant_id, amount)`` inventory changes in place: ``amount`` is added to
+        the quantity on hand, or replaces it with ``absolute``. Only the stock arrays
+        change; the variant records keep their loaded levels so their pages stay shared
+        between pre-fork workers, and current levels are read through this index.
+        Returns the number of variants changed; unknown ids are skipped.
+        """
+        applied = 0
+        with self._lock:
+            for variant_id, amount in changes:
+                position = self.position_of_variant.get(variant_id)
+                if position is None:
+                    self.unknown_variants += 1
+                    continue
+                quantity = int(amount) if absolute else int(self.quantities[position]) + int(amount)
+                self.quantities[position] = quantity
+                available = bool(quantity > 0 or self.oversell[position] or not self.tracked[position])
+                if available != self.available[position]:
+                    self.available[position] = available
+                    product_position = self.product_of[position]
+                    self.in_stock_counts[product_position] += 1 if available else -1
+                    self.product_in_stock[product_position] = self.in_stock_counts[product_position] > 0
+                applied += 1
+            self.updates += applied
+            if applied:
+                self.stock_version[0] += 1
+        return applied
+
+    def stats(self):
+        limited = self.tracked & ~self.oversell
+        return {
+            'variants': len(self.variants),
+            'products_in_stock': int(self.product_in_stock.sum()),
+            'variants_sold_out': int((~self.available).sum()),
+            'variants_low_stock': int((limited & (self.quantities > 0)
+                                       & (self.quantities <= self.low_stock_threshold)).sum()),
+            'updates': self.updates,
+            'unknown_variants': self.unknown_variants,
+        }
+
+
+def named_option(product, query):
+    """The option of a product ("Size") that a query asks about ("which sizes are left?"), or None"""
+    words = set(re.findall(r"\w+", query.lower()))
+    for option_name in product.options:
+        name = option_name.lower()
+        if name != 'title' and (name in words or name + 's' in words):
+            return option_name
+    return None
+
+
+def describe_availability(inventory, product, query=''):
+    """
+    One line on a product's stock for an availability question. Variants named by
+    their option values in ``query`` ("blue", "xl") are described alone; otherwise
+    multi-variant products list what is left and what is sold out, per value of an option
+    the query names ("which sizes are left?").
+    """
+    option_name = named_option(product, query)
+    if option_name:
+        name = option_name.lower()
+        values = inventory.option_values(product, option_name)
+        left = [value for value, available in values if available]
+        sold_out = [value for value, available in values if not available]
+        if not left:
+            return f"{product.title}: sold out in every {name}."
+        line = f"{product.title}: {name}s left: {', '.join(left)}"
+        if sold_out:
+            line += f"; sold out: {', '.join(sold_out)}"
+        return line + "."
+
+    positions = inventory.matching_variants(product, query)
+    if not positions:
+        return f"{product.title}: not available in that combination of options."
+    if len(positions) == 1:
+        position = positions[0]
+        variant = inventory.variants[position]
+        name = product.title
+        if variant.title and variant.title.lower() != DEFAULT_OPTION_VALUE:
+            name += f" ({variant.title})"
+        if not inventory.available[position]:
+            return f"{name}: sold out."
+        if inventory.is_low_stock(position):
+            return f"{name}: in stock, only {inventory.units_left(position)} left!"
+        return f"{name}: in stock."
+
+    left = []
+    sold_out = []
+    for position in positions:
+        title = inventory.variants[position].title
+        if not inventory.available[position]:
+            sold_out.append(title)
+        elif inventory.is_low_stock(position):
+            left.append(f"{title} (only {inventory.units_left(position)} left)")
+        else:
+            left.append(title)
+    if not left:
+        return f"{product.title}: sold out in every option."
+    line = f"{product.title}: available in {', '.join(left)}"
+    if sold_out:
+        line += f"; sold out: {', '.join(sold_out)}"
+    return line + "."
@@ -0,0 +1,101 @@
+"""
+Process-local LLM response cache with LRU and TTL eviction
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """Case- and whitespace-insensitive form of a prompt used for cache keys"""
+    return ' '.join(prompt.split()).casefold()
+
+
+def make_cache_key(prompt, request_data):
+    """
+    Cache key from the normalized prompt plus the generation config and any earlier
+    conversation turns that will be sent
+    """
+    generation_config = request_data.get('generationConfig', {}) if request_data else {}
+    history = request_data.get('contents', [])[:-1] if request_data else []
+    return (
+        normalize_prompt(prompt),
+        json.dumps(generation_config, sort_keys=True),
+        json.dumps(history, sort_keys=True) if history else '',
+    )
+
+
+class LLMResponseCache:
+    """
+    Bounded LRU cache of LLM responses with a per-entry time to live.
+
+    Thread-safe; all operations are O(1). Only successful responses should be stored,
+    error messages must never be cached.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached response for ``key``, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        """Store a response, evicting the least recently used entry when full"""
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the product catalog changed"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Counters for /health and logging"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
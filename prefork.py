@@ -0,0 +1,395 @@
+"""
+Pre-fork serving: the catalog is loaded and indexed once in a master process, which then
+forks worker processes that share those pages copy-on-write and accept on one socket
+"""
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stopping worker gets to finish its in-flight requests before it is killed
+GRACEFUL_TIMEOUT = 30
+# A worker exiting sooner than this after being forked is restarted only after the delay,
+# so a crashing worker can't turn the master into a fork loop
+MIN_WORKER_LIFETIME = 1.0
+
+# State of this process when it is a forked worker (see worker_stats)
+_current_worker = None
+
+
+def create_listen_socket(host, port, backlog=2048):
+    """Bound, listening TCP socket shared by every worker"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def freeze_heap():
+    """
+    Collect garbage (e.g. a replaced catalog), then move every surviving object to the
+    GC's permanent generation: collections in the workers skip those objects, so they
+    don't write to (and thereby copy) the pages the workers share with the master
+    """
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+
+
+def process_memory(pid='self'):
+    """Resident, proportional, shared and private bytes of a process from /proc (Linux), else None"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            lines = smaps.readlines()
+    except OSError:
+        return None
+    fields = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == 'kB':
+            fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+class RequestBudget:
+    """
+    Requests a worker serves before it is recycled: ``max_requests`` plus up to ``jitter``
+    more, so workers forked together don't all restart together. 0 means no limit.
+    """
+
+    def __init__(self, max_requests=0, jitter=0):
+        self.limit = max_requests + random.randint(0, max(0, jitter)) if max_requests > 0 else 0
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        """Count a request; True once, for the request that uses up the budget"""
+        with self._lock:
+            self.served += 1
+            return self.served == self.limit
+
+
+class _WorkerState:
+    def __init__(self, worker_id, generation, budget):
+        self.worker_id = worker_id
+        self.generation = generation
+        self.budget = budget
+        self.started_at = time.time()
+
+
+def in_worker():
+    """Whether this process is a pre-fork worker"""
+    return _current_worker is not None
+
+
+def count_request():
+    """
+    Count a request served by this worker; once its request budget is used up the
+    worker stops itself gracefully (SIGTERM) and the master forks a replacement.
+    A no-op outside a pre-fork worker.
+    """
+    worker = _current_worker
+    if worker is not None and worker.budget.count():
+        logger.info(f"Worker recycling after {worker.budget.served} requests - PID: {os.getpid()}")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def worker_stats():
+    """Slot, generation, requests served and memory of this worker; None outside a pre-fork worker"""
+    worker = _current_worker
+    if worker is None:
+        return None
+    return {
+        'pid': os.getpid(),
+        'worker_id': worker.worker_id,
+        'generation': worker.generation,
+        'started_at': worker.started_at,
+        'requests': worker.budget.served,
+        'max_requests': worker.budget.limit,
+        'memory': process_memory(),
+    }
+
+
+class _InflightMiddleware:
+    """WSGI middleware counting requests in flight (until their body is closed) and toward the budget"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def _done(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+        with self._lock:
+            self.inflight += 1
+        count_request()
+        try:
+            return ClosingIterator(self.wsgi_app(environ, start_response), self._done)
+        except BaseException:
+            self._done()
+            raise
+
+
+def serve_wsgi(wsgi_app, sock, graceful_timeout=GRACEFUL_TIMEOUT):
+    """
+    Threaded WSGI server on an inherited listening socket. SIGTERM stops accepting;
+    in-flight requests (streamed ones included) get ``graceful_timeout`` seconds to finish.
+    """
+    from werkzeug.serving import make_server
+    host, port = sock.getsockname()[:2]
+    middleware = _InflightMiddleware(wsgi_app)
+    server = make_server(host, port, middleware, threaded=True, fd=sock.fileno())
+    # serve_forever runs in this (the main) thread, so it has to be stopped from another one
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+    deadline = time.monotonic() + graceful_timeout
+    while middleware.inflight > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+class _WorkerProcess:
+    """The master's record of a forked worker"""
+
+    def __init__(self, pid, worker_id, generation):
+        self.pid = pid
+        self.worker_id = worker_id
+        self.generation = generation
+        self.started_at = time.monotonic()
+        self.stopping_since = None
+
+
+class PreforkServer:
+    """
+    Master of a pool of forked worker processes.
+
+    The master only supervises: ``serve(sock, worker_id)`` runs in each worker, serving
+    the shared listening socket until SIGTERM, then finishing in-flight requests and
+    returning. Before every fork ``before_fork()`` runs in the master (e.g. close pooled
+    connections, finish lazily built indexes) and the heap is frozen (freeze_heap), so
+    the catalog and its indexes are shared by all workers instead of copied.
+    ``after_fork(worker_id)`` runs first thing in the worker (e.g. start its threads).
+
+    Workers that exit, crash or use up their request budget (``max_requests`` plus up
+    to ``max_requests_jitter``) are replaced. Every ``poll_interval`` seconds ``check()``
+    is called; when it returns True (e.g. the catalog was reloaded) the workers are
+    re-forked from the new state: the new generation is started first, then the old one
+    is stopped gracefully, so there's no gap in serving. SIGHUP calls ``reload()`` and
+    re-forks unconditionally; SIGTERM or SIGINT stop the pool.
+    """
+
+    def __init__(self, sock, serve, workers, before_fork=None, after_fork=None, check=None, reload=None,
+                 poll_interval=5.0, max_requests=0, max_requests_jitter=0, graceful_timeout=GRACEFUL_TIMEOUT):
+        self.sock = sock
+        self.serve = serve
+        self.workers = workers
+        self.before_fork = before_fork
+        self.after_fork = after_fork
+        self.check = check
+        self.reload = reload
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.generation = 0
+        self._processes = {}
+        self._respawn_after = 0.0
+        self._stopping = False
+        self._reload_requested = False
+        self._wakeup_read = None
+        self._wakeup_write = None
+
+    def _handle_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload_requested = True
+        elif signum in (signal.SIGTERM, signal.SIGINT):
+            self._stopping = True
+
+    def _install_signals(self):
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        signal.set_wakeup_fd(self._wakeup_write)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._handle_signal)
+        # Only installed so that a worker exiting wakes the master up
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    def _wait(self, timeout):
+        """Sleep until a signal arrives or ``timeout`` passes"""
+        try:
+            readable, _, _ = select.select([self._wakeup_read], [], [], max(0.0, timeout))
+        except InterruptedError:
+            return
+        if readable:
+            try:
+                while os.read(self._wakeup_read, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def _spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(worker_id)
+        self._processes[pid] = _WorkerProcess(pid, worker_id, self.generation)
+        logger.info(f"Worker started - PID: {pid}, Worker: {worker_id}, Generation: {self.generation}")
+
+    def _run_worker(self, worker_id):
+        """Body of a forked worker; never returns"""
+        global _current_worker
+        exit_code = 0
+        try:
+            signal.set_wakeup_fd(-1)
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
+            for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            # Ctrl-C reaches the whole process group; the master stops the workers itself
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            gc.enable()
+            _current_worker = _WorkerState(
+                worker_id, self.generation, RequestBudget(self.max_requests, self.max_requests_jitter)
+            )
+            if self.after_fork is not None:
+                self.after_fork(worker_id)
+            self.serve(self.sock, worker_id)
+        except BaseException as e:
+            logger.exception(f"Worker failed - PID: {os.getpid()}, Error: {e}")
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            process = self._processes.pop(pid, None)
+            if process is None:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            if process.stopping_since is not None:
+                logger.info(f"Worker stopped - PID: {pid}, Generation: {process.generation}")
+            elif exit_code == 0:
+                logger.info(f"Worker exited, replacing it - PID: {pid}, Worker: {process.worker_id}")
+            else:
+                logger.warning(f"Worker died, replacing it - PID: {pid}, Worker: {process.worker_id}, Exit code: {exit_code}")
+                if time.monotonic() - process.started_at < MIN_WORKER_LIFETIME:
+                    self._respawn_after = time.monotonic() + MIN_WORKER_LIFETIME
+
+    def _stop_process(self, process, sig=signal.SIGTERM):
+        if process.stopping_since is None:
+            process.stopping_since = time.monotonic()
+        try:
+            os.kill(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _maintain(self):
+        """Fork missing workers of the current generation; kill workers overdue to stop"""
+        now = time.monotonic()
+        for process in list(self._processes.values()):
+            if process.stopping_since is not None and now - process.stopping_since > self.graceful_timeout:
+                logger.warning(f"Worker did not stop in time, killing it - PID: {process.pid}")
+                self._stop_process(process, signal.SIGKILL)
+        if now < self._respawn_after:
+            return
+        running = {process.worker_id for process in self._processes.values()
+                   if process.generation == self.generation and process.stopping_since is None}
+        missing = [worker_id for worker_id in range(self.workers) if worker_id not in running]
+        if not missing:
+            return
+        if self.before_fork is not None:
+            self.before_fork()
+        freeze_heap()
+        for worker_id in missing:
+            self._spawn(worker_id)
+
+    def refork(self):
+        """Start a new generation of workers from the master's current state, then stop the old one"""
+        old = [process for process in self._processes.values() if process.stopping_since is None]
+        self.generation += 1
+        self._maintain()
+        for process in old:
+            self._stop_process(process)
+        logger.info(f"Workers re-forked - Generation: {self.generation}, Stopping: {len(old)}")
+
+    def _reload(self):
+        if self.reload is not None:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Reload failed, re-forking from the current state - Error: {e}")
+        self.refork()
+
+    def _shutdown(self):
+        for process in self._processes.values():
+            self._stop_process(process)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._processes and time.monotonic() < deadline:
+            self._reap()
+            self._wait(0.1)
+        for process in self._processes.values():
+            self._stop_process(process, signal.SIGKILL)
+        while self._processes:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self._processes.pop(pid, None)
+
+    def run(self):
+        """Fork the workers and supervise them until SIGTERM/SIGINT"""
+        # Objects freed in the master would leave holes in pages the workers share; garbage
+        # is collected only right before forking (freeze_heap)
+        gc.disable()
+        self._install_signals()
+        logger.info(f"Pre-fork master started - PID: {os.getpid()}, Workers: {self.workers}")
+        next_check = time.monotonic() + self.poll_interval
+        try:
+            self._maintain()
+            while not self._stopping:
+                self._reap()
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._reload()
+                elif self.check is not None and self.poll_interval > 0 and time.monotonic() >= next_check:
+                    next_check = time.monotonic() + self.poll_interval
+                    if self.check():
+                        self.refork()
+                if self._stopping:
+                    break
+                self._maintain()
+                self._wait(min(1.0, self.poll_interval) if self.poll_interval > 0 else 1.0)
+        finally:
+            logger.info(f"Pre-fork master stopping - Workers: {len(self._processes)}")
+            self._shutdown()
+            signal.set_wakeup_fd(-1)
+            gc.enable()
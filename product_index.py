@@ -0,0 +1,101 @@
+"""
+Inverted token index for product search
+"""
+# Words that never identify a product; built once instead of on every search
+STOP_WORDS = frozenset([
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'link', 'url', 'buy', 'purchase', 'provide', 'give', 'me', 'please', 'can', 'you'
+])
+MIN_TERM_LENGTH = 3
+
+# Fields indexed per product, with the weight a match in that field adds to the score.
+# Title dominates so that title matches always rank ahead of tag/vendor/type-only matches.
+FIELD_WEIGHTS = {
+    'title': 100,
+    'product_type': 3,
+    'tags': 2,
+    'vendor': 1,
+}
+
+
+def extract_search_terms(query):
+    """Split a query into lowercase search terms, dropping stop words and short words"""
+    return [
+        word for word in query.lower().split()
+        if word not in STOP_WORDS and len(word) >= MIN_TERM_LENGTH
+    ]
+
+
+def _substrings(token):
+    """All substrings of a token that are long enough to be a search term"""
+    length = len(token)
+    return {
+        token[start:end]
+        for start in range(length - MIN_TERM_LENGTH + 1)
+        for end in range(start + MIN_TERM_LENGTH, length + 1)
+    }
+
+
+def _field_tokens(product, field):
+    value = getattr(product, field) or ''
+    if isinstance(value, tuple):
+        value = ' '.join(value)
+    return value.lower().split()
+
+
+class ProductIndex:
+    """
+    Token -> product position inverted index over title, tags, vendor and product_type.
+
+    Search terms are matched as substrings of whitespace-delimited field tokens, which is
+    exactly what the old linear ``term in title.lower()`` scan did for titles, but each
+    term is now a single dictionary lookup instead of a pass over the whole catalog.
+    """
+
+    def __init__(self, product_data):
+        """Index a list of catalog.ProductRecord"""
+        self.products = list(product_data)
+        self.postings = {}
+        for position, product in enumerate(self.products):
+            for field, weight in FIELD_WEIGHTS.items():
+                keys = set()
+                for token in _field_tokens(product, field):
+                    keys.update(_substrings(token))
+                for key in keys:
+                    field_weights = self.postings.setdefault(key, {})
+                    field_weights[position] = max(field_weights.get(position, 0), weight)
+
+    @classmethod
+    def from_postings(cls, product_data, postings):
+        """Rebuild an index from the ``postings`` of an identical, earlier built one"""
+        index = cls.__new__(cls)
+        index.products = list(product_data)
+        index.postings = postings
+        return index
+
+    def __len__(self):
+        return len(self.products)
+
+    def search_positions(self, search_terms, require_all=False):
+        """
+        Return product positions ranked by score.
+
+        The union of the posting lists is scored by the summed field weights of every
+        matched term; ``require_all`` restricts results to the intersection instead.
+        Ties keep catalog order.
+        """
+        scores = {}
+        hits = {}
+        for term in dict.fromkeys(search_terms):
+            for position, weight in self.postings.get(term, {}).items():
+                scores[position] = scores.get(position, 0) + weight
+                hits[position] = hits.get(position, 0) + 1
+        if require_all:
+            wanted = len(set(search_terms))
+            scores = {position: score for position, score in scores.items() if hits[position] == wanted}
+        return sorted(scores, key=lambda position: (-scores[position], position))
+
+    def search(self, query, require_all=False):
+        """Return the products matching a free-text query, best match first"""
+        positions = self.search_positions(extract_search_terms(query), require_all=require_all)
+        return [self.products[position] for position in positions]
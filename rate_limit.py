@@ -0,0 +1,85 @@
+"""
+In-memory token-bucket rate limiting keyed on users, sessions and client IPs
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets for many keys in one bounded store.
+
+    ``budgets`` maps a budget name to ``(rate, burst)``: tokens refilled per second and
+    bucket capacity. A request names the ``(budget, key)`` buckets it must pass and is
+    allowed only if every one of them holds a token, in which case each gives one up.
+    Buckets are kept in LRU order; the least recently used ones are evicted beyond
+    ``max_keys`` and once idle for ``idle_ttl`` seconds (by default the time an empty
+    bucket takes to refill, after which dropping it changes nothing). Thread-safe.
+    """
+
+    def __init__(self, budgets, max_keys=100000, idle_ttl=None, clock=time.monotonic):
+        self.budgets = dict(budgets)
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl if idle_ttl is not None else max(
+            burst / rate for rate, burst in self.budgets.values()
+        )
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.evictions = 0
+
+    def _expire(self, now):
+        # Least recently used buckets sit at the front, so stop at the first live one
+        while self._buckets:
+            _, (_, last_used) = next(iter(self._buckets.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._buckets.popitem(last=False)
+
+    def _tokens(self, bucket_key, now):
+        """Current tokens of a bucket (a fresh one is full)"""
+        rate, burst = self.budgets[bucket_key[0]]
+        entry = self._buckets.get(bucket_key)
+        if entry is None:
+            return burst
+        tokens, last_used = entry
+        return min(burst, tokens + (now - last_used) * rate)
+
+    def try_acquire(self, bucket_keys):
+        """
+        Take one token from each ``(budget, key)`` bucket. Returns 0.0 when allowed,
+        otherwise the seconds until all of them would have a token (nothing is taken).
+        """
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            levels = [(bucket_key, self._tokens(bucket_key, now)) for bucket_key in bucket_keys]
+            wait = max([(1 - tokens) / self.budgets[bucket_key[0]][0]
+                        for bucket_key, tokens in levels if tokens < 1] or [0.0])
+            if wait > 0:
+                self.limited += 1
+                return wait
+            for bucket_key, tokens in levels:
+                self._buckets.pop(bucket_key, None)
+                self._buckets[bucket_key] = (tokens - 1, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            self.allowed += 1
+            return 0.0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buckets': len(self._buckets),
+                'max_keys': self.max_keys,
+                'allowed': self.allowed,
+                'limited': self.limited,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,218 @@
+"""
+Deadlines, jittered retries, hedged requests and a circuit breaker for upstream calls
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
+
+RETRYABLE_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class Deadline:
+    """A point in time a whole operation, retries included, has to finish by"""
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class RetryPolicy:
+    """At most ``max_attempts`` tries with full-jitter exponential backoff between them"""
+
+    def __init__(self, max_attempts=3, base_delay=0.25, max_delay=2.0, retryable_statuses=RETRYABLE_STATUSES):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable_statuses = retryable_statuses
+
+    def is_retryable(self, status):
+        return status in self.retryable_statuses
+
+    def delay(self, attempt):
+        """Sleep before retry number ``attempt`` (0-based): uniform in [0, base * 2^attempt]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def should_retry(self, attempt, delay, deadline, min_attempt_time=0.0):
+        """Whether another attempt fits: attempts left and time for the sleep plus the call"""
+        return attempt + 1 < self.max_attempts and deadline.remaining() > delay + min_attempt_time
+
+
+class LatencyWindow:
+    """Recent successful call latencies, for picking the hedge delay"""
+
+    def __init__(self, size=256, min_samples=20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, q, default=None):
+        samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return default
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100.0))]
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive failures; open rejects calls
+    for ``recovery_timeout`` seconds, then half-open lets ``half_open_max_calls`` probe
+    calls through. A successful probe closes the breaker, a failed one reopens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started_at = 0.0
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _refresh(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        elif self._state == self.HALF_OPEN and self._probes and now - self._probe_started_at >= self.recovery_timeout:
+            # A probe that never reported back (e.g. an abandoned stream) must not wedge the breaker
+            self._probes = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh(self._clock())
+            return self._state
+
+    def is_open(self):
+        """True while calls would be rejected outright (no probe slot either)"""
+        with self._lock:
+            self._refresh(self._clock())
+            return self._state == self.OPEN or (
+                self._state == self.HALF_OPEN and self._probes >= self.half_open_max_calls
+            )
+
+    def allow_request(self):
+        """Reserve permission for one upstream call; every allowed call must report back"""
+        with self._lock:
+            self._refresh(self._clock())
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                self._probe_started_at = self._clock()
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._state = self.CLOSED
+            self._probes = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self.times_opened += 1
+
+    def stats(self):
+        with self._lock:
+            now = self._clock()
+            self._refresh(now)
+            return {
+                'state': self._state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'retry_in_seconds': round(max(0.0, self.recovery_timeout - (now - self._opened_at)), 1)
+                if self._state == self.OPEN else 0.0,
+            }
+
+
+def hedged_call(executor, fn, hedge_delay, timeout, is_success):
+    """
+    Run ``fn`` in ``executor``; if it has not finished after ``hedge_delay`` seconds,
+    start a second copy and return whichever successful result arrives first.
+
+    Returns ``(result, hedged)``. If neither copy succeeds the last outcome is returned
+    (or raised). The losing copy is left to finish in the background.
+    """
+    first = executor.submit(fn)
+    deadline = time.monotonic() + timeout
+    try:
+        return first.result(timeout=min(hedge_delay, timeout)), False
+    except FutureTimeoutError:
+        pass
+    if time.monotonic() >= deadline:
+        return first.result(timeout=0), False
+
+    pending = {first, executor.submit(fn)}
+    outcome = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            outcome = future
+            if future.exception() is None and is_success(future.result()):
+                return future.result(), True
+    if outcome is None:
+        raise FutureTimeoutError("Hedged call timed out")
+    return outcome.result(), True
+
+
+async def hedged_call_async(coroutine_fn, hedge_delay, timeout, is_success):
+    """asyncio version of ``hedged_call``; the losing copy is cancelled"""
+    first = asyncio.ensure_future(coroutine_fn())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    done, _ = await asyncio.wait({first}, timeout=min(hedge_delay, timeout))
+    if done or loop.time() >= deadline:
+        if not done:
+            first.cancel()
+            raise asyncio.TimeoutError()
+        return first.result(), False
+
+    pending = {first, asyncio.ensure_future(coroutine_fn())}
+    outcome = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                outcome = task
+                if task.exception() is None and is_success(task.result()):
+                    return task.result(), True
+    finally:
+        for task in pending:
+            task.cancel()
+    if outcome is None:
+        raise asyncio.TimeoutError()
+    return outcome.result(), True
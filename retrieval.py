@@ -0,0 +1,162 @@
+"""
+Local BM25 retrieval over product titles and descriptions
+"""
+import re
+
+import numpy as np
+
+from product_index import STOP_WORDS
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Conversational filler that carries no product signal in free-text queries
+RETRIEVAL_STOP_WORDS = STOP_WORDS | frozenset([
+    'is', 'are', 'was', 'be', 'it', 'its', 'this', 'that', 'these', 'those', 'i', 'my', 'we',
+    'our', 'your', 'do', 'does', 'have', 'has', 'any', 'some', 'something', 'anything',
+    'what', 'which', 'who', 'how', 'want', 'need', 'looking', 'show', 'find', 'get', 'like',
+    'from', 'about', 'there', 'one', 'all', 'more', 'very', 'so', 'as', 'if', 'not', 'no',
+    'yes', 'will', 'would', 'should', 'could', 'also', 'just', 'than', 'then', 'them', 'they',
+    's', 't', 'll', 've', 're', 'd', 'm'
+])
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens with stop words removed"""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in RETRIEVAL_STOP_WORDS]
+
+
+def product_document(product):
+    """Searchable text for one ProductRecord: title (counted twice), type, tags and description"""
+    return ' '.join([
+        product.title, product.title,
+        product.product_type,
+        ' '.join(product.tags),
+        product.description,
+    ])
+
+
+class BM25Retriever:
+    """
+    Okapi BM25 over a fixed set of documents.
+
+    The term/document matrix is stored column-wise (one contiguous slice of document ids
+    and precomputed BM25 weights per term), so a query is a concatenation of a few slices
+    followed by a single ``np.bincount`` over the catalog.
+    """
+
+    def __init__(self, documents, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        tokenized = [tokenize(document) for document in documents]
+        self.document_count = len(tokenized)
+
+        # Term frequencies per (term, document), collected term-major
+        term_docs = {}
+        for doc_id, tokens in enumerate(tokenized):
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_docs.setdefault(token, []).append((doc_id, count))
+
+        self.vocabulary = {term: column for column, term in enumerate(sorted(term_docs))}
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        average_length = float(lengths.mean()) if self.document_count and lengths.sum() else 1.0
+
+        indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        for term, column in self.vocabulary.items():
+            indptr[column + 1] = len(term_docs[term])
+        np.cumsum(indptr, out=indptr)
+
+        doc_ids = np.empty(indptr[-1], dtype=np.int32)
+        frequencies = np.empty(indptr[-1], dtype=np.float32)
+        for term, column in self.vocabulary.items():
+            postings = term_docs[term]
+            start, end = indptr[column], indptr[column + 1]
+            doc_ids[start:end] = [doc_id for doc_id, _ in postings]
+            frequencies[start:end] = [count for _, count in postings]
+
+        document_frequency = np.diff(indptr).astype(np.float32)
+        idf = np.log1p((self.document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = k1 * (1.0 - b + b * lengths[doc_ids] / average_length)
+        term_idf = np.repeat(idf, np.diff(indptr))
+
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = (term_idf * frequencies * (k1 + 1.0) / (frequencies + norm)).astype(np.float32)
+
+    @classmethod
+    def from_arrays(cls, vocabulary, indptr, doc_ids, weights, document_count, k1=1.2, b=0.75):
+        """Restore a retriever from the arrays of an earlier built one (e.g. memory-mapped)"""
+        engine = cls.__new__(cls)
+        engine.k1 = k1
+        engine.b = b
+        engine.vocabulary = vocabulary
+        engine.document_count = document_count
+        engine.indptr = indptr
+        engine.doc_ids = doc_ids
+        engine.weights = weights
+        return engine
+
+    def _query_postings(self, query):
+        """Document ids and weights of every posting for the distinct known query terms"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        columns = [self.vocabulary[term] for term in terms if term in self.vocabulary]
+        if not columns:
+            empty = np.empty(0, dtype=np.int32)
+            return len(terms), empty, empty.astype(np.float32)
+        if len(columns) == 1:
+            start, end = self.indptr[columns[0]], self.indptr[columns[0] + 1]
+            return len(terms), self.doc_ids[start:end], self.weights[start:end]
+        slices = [slice(self.indptr[column], self.indptr[column + 1]) for column in columns]
+        doc_ids = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        return len(terms), doc_ids, weights
+
+    def scores(self, query):
+        """BM25 score of every document for a query"""
+        _, doc_ids, weights = self._query_postings(query)
+        return np.bincount(doc_ids, weights=weights, minlength=self.document_count)
+
+    def top_k(self, query, k=5, min_score=0.0, min_coverage=0.0, min_matched_terms=0):
+        """
+        Return up to ``k`` ``(doc_id, score)`` pairs, best first.
+
+        Documents must score above ``min_score`` and contain at least ``min_coverage``
+        (a fraction) and at least ``min_matched_terms`` of the distinct query terms.
+        """
+        term_count, doc_ids, weights = self._query_postings(query)
+        if not self.document_count or not len(doc_ids) or term_count < min_matched_terms:
+            return []
+        scores = np.bincount(doc_ids, weights=weights, minlength=self.document_count)
+        if min_coverage or min_matched_terms:
+            matched_terms = np.bincount(doc_ids, minlength=self.document_count)
+            scores[(matched_terms < min_coverage * term_count) | (matched_terms < min_matched_terms)] = 0.0
+        k = min(k, self.document_count)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in candidates if scores[doc_id] > min_score]
+
+
+class ProductRetriever:
+    """
+    BM25 retrieval over a product catalog, returning products instead of row ids.
+
+    A product must match at least ``min_matched_terms`` query words: one word found
+    somewhere in a description ("cool") is chit-chat, not a product search, and product
+    names are already matched by the title index.
+    """
+
+    def __init__(self, product_data, min_score=1.0, min_coverage=0.6, min_matched_terms=2, engine=None):
+        """``engine`` may be a prebuilt BM25Retriever over exactly these products"""
+        self.products = list(product_data)
+        self.min_score = min_score
+        self.min_coverage = min_coverage
+        self.min_matched_terms = min_matched_terms
+        self.engine = engine or BM25Retriever([product_document(product) for product in self.products])
+
+    def search(self, query, k=5):
+        """Return up to ``k`` products relevant to a free-text query, best first"""
+        hits = self.engine.top_k(query, k=k, min_score=self.min_score, min_coverage=self.min_coverage,
+                                 min_matched_terms=self.min_matched_terms)
+        return [self.products[doc_id] for doc_id, _ in hits]
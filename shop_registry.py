@@ -0,0 +1,294 @@
+"""
+Catalogs of many storefronts served from one process, loaded on demand and evicted
+least recently used under a memory cap
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from catalog_binary import default_snapshot_path
+from catalog_reloader import CatalogReloader
+from resilience import LatencyWindow
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# A shop is its myshopify.com subdomain; anything else is rejected before touching the disk
+_SHOP_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9-]{0,62}$")
+
+
+class UnknownShopError(KeyError):
+    """No catalog exists for the requested shop"""
+
+
+def normalize_shop_name(shop):
+    """'Mystore', 'mystore.myshopify.com' or 'https://mystore.myshopify.com/' -> 'mystore', else None"""
+    if not shop:
+        return None
+    name = str(shop).strip().lower()
+    name = re.sub(r"^https?://", '', name).split('/')[0]
+    if name.endswith('.myshopify.com'):
+        name = name[:-len('.myshopify.com')]
+    return name if _SHOP_NAME_PATTERN.match(name) else None
+
+
+def shop_url_for(shop_name):
+    return f"https://{shop_name}.myshopify.com"
+
+
+def estimate_bytes(root):
+    """
+    Approximate memory held by an object graph: Python objects (following dicts,
+    sequences, sets and ``__slots__``/``__dict__`` attributes) plus numpy buffers.
+    Objects shared within the graph are counted once.
+    """
+    seen = set()
+    total = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (type, threading.Thread)):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            # A view owns no buffer of its own; count the array it was taken from instead
+            if isinstance(obj.base, np.ndarray):
+                stack.append(obj.base)
+            else:
+                total += obj.nbytes
+            continue
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, int, float, bool)):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            for name in getattr(type(obj), '__slots__', ()):
+                stack.append(getattr(obj, name, None))
+            if hasattr(obj, '__dict__'):
+                stack.extend(vars(obj).values())
+    return total
+
+
+class _Tenant:
+    """A resident shop: its catalog reloader, estimated footprint and request stats"""
+
+    def __init__(self, name, reloader, catalog_bytes, pinned=False):
+        self.name = name
+        self.reloader = reloader
+        self.catalog_bytes = catalog_bytes
+        self.pinned = pinned
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.latency = LatencyWindow(size=512, min_samples=1)
+
+
+class ShopRegistry:
+    """
+    Shop name -> CatalogReloader for every storefront served by this process.
+
+    The default shop's catalog (data/products.json) is always resident. Any other shop
+    is read from ``shops_dir/<shop>/products.json`` (or its binary snapshot) on its
+    first request, with product links pointing at its own myshopify.com URL;
+    concurrent first requests share one load. Shops are kept in LRU order and, once
+    their estimated total footprint exceeds ``max_bytes``, the least recently used
+    ones are dropped (requests still holding one of their snapshots finish on it).
+    One background thread polls the resident shops' files for changes.
+    """
+
+    def __init__(self, default_shop, default_reloader, shops_dir, max_bytes, poll_interval=5.0,
+                 use_snapshots=True, on_reload=None):
+        self.default_shop = default_shop
+        self.shops_dir = shops_dir
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.use_snapshots = use_snapshots
+        self.on_reload = list(on_reload or [])
+        self._tenants = OrderedDict()
+        self._tenants[default_shop] = _Tenant(
+            default_shop, default_reloader, estimate_bytes(default_reloader.current), pinned=True
+        )
+        self._lock = threading.Lock()
+        self._loads = SingleFlight()
+        self._stop = threading.Event()
+        self._thread = None
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        # Shop -> (mtime, size) of a products.json that failed to load; retried once it changes
+        self._failed_files = {}
+        default_reloader.on_reload.append(lambda snapshot: self._resize(default_shop, snapshot))
+
+    def products_path(self, shop_name):
+        return os.path.join(self.shops_dir, shop_name, 'products.json')
+
+    def resolve(self, shop):
+        """Shop name for a request's shop parameter; the default shop when none is given"""
+        if not shop:
+            return self.default_shop
+        name = normalize_shop_name(shop)
+        if name is None:
+            raise UnknownShopError(shop)
+        return name
+
+    def is_resident(self, shop_name):
+        return shop_name in self._tenants
+
+    def catalog(self, shop_name):
+        """Current CatalogSnapshot of a shop, loading it first if it isn't resident"""
+        tenant = self._touch(shop_name)
+        if tenant is None:
+            tenant = self._loads.do(shop_name, lambda: self._load(shop_name))
+        return tenant.reloader.current
+
+    def _touch(self, shop_name):
+        with self._lock:
+            tenant = self._tenants.get(shop_name)
+            if tenant is not None:
+                self._tenants.move_to_end(shop_name)
+                tenant.last_used = time.monotonic()
+            return tenant
+
+    def _load(self, shop_name):
+        tenant = self._touch(shop_name)
+        if tenant is not None:
+            return tenant
+        path = self.products_path(shop_name)
+        if not os.path.isfile(path):
+            raise UnknownShopError(shop_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            raise UnknownShopError(shop_name)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._failed_files.get(shop_name) == signature:
+            raise UnknownShopError(shop_name)
+        start_time = time.perf_counter()
+        try:
+            reloader = CatalogReloader(
+                path, shop_url_for(shop_name), poll_interval=self.poll_interval,
+                snapshot_path=default_snapshot_path(path) if self.use_snapshots else None
+            )
+        except Exception as e:
+            # A file with the wrong structure raises KeyError/TypeError/AttributeError
+            self.load_failures += 1
+            self._failed_files[shop_name] = signature
+            logger.error(f"Shop catalog load failed - Shop: {shop_name}, Error: {type(e).__name__}: {e}")
+            raise UnknownShopError(shop_name)
+        self._failed_files.pop(shop_name, None)
+        reloader.on_reload.extend(self.on_reload)
+        reloader.on_reload.append(lambda snapshot: self._resize(shop_name, snapshot))
+        tenant = _Tenant(shop_name, reloader, estimate_bytes(reloader.current))
+        with self._lock:
+            self._tenants[shop_name] = tenant
+            self.loads += 1
+            evicted = self._evict(keep=shop_name)
+        logger.info(f"Shop catalog loaded - Shop: {shop_name}, Products: {len(reloader.current)}, "
+                    f"Bytes: {tenant.catalog_bytes}, Time: {(time.perf_counter() - start_time) * 1000:.1f}ms")
+        if evicted:
+            logger.info(f"Shop catalogs evicted - Shops: {', '.join(evicted)}")
+        return tenant
+
+    def _evict(self, keep=None):
+        """Drop least recently used shops while over ``max_bytes``; call with the lock held"""
+        evicted = []
+        total = sum(tenant.catalog_bytes for tenant in self._tenants.values())
+        for name in list(self._tenants):
+            if total <= self.max_bytes:
+                break
+            tenant = self._tenants[name]
+            if tenant.pinned or name == keep:
+                continue
+            del self._tenants[name]
+            total -= tenant.catalog_bytes
+            evicted.append(name)
+        self.evictions += len(evicted)
+        return evicted
+
+    def _resize(self, shop_name, snapshot):
+        """Re-estimate a shop's footprint after its catalog reloaded"""
+        catalog_bytes = estimate_bytes(snapshot)
+        with self._lock:
+            tenant = self._tenants.get(shop_name)
+            if tenant is not None:
+                tenant.catalog_bytes = catalog_bytes
+                self._evict(keep=shop_name)
+
+    def record_request(self, shop_name, seconds):
+        tenant = self._tenants.get(shop_name)
+        if tenant is not None:
+            tenant.requests += 1
+            tenant.latency.record(seconds)
+
+    def request_counts(self):
+        with self._lock:
+            return {name: tenant.requests for name, tenant in self._tenants.items()}
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            with self._lock:
+                reloaders = [tenant.reloader for tenant in self._tenants.values() if not tenant.pinned]
+            for reloader in reloaders:
+                # One shop's bad file must not stop polling for the others
+                try:
+                    reloader.check_for_changes()
+                except Exception as e:
+                    logger.exception(f"Shop catalog poll failed - Path: {reloader.path}, Error: {e}")
+
+    def start(self):
+        """Poll the resident shops' catalogs for changes in a daemon thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='shop-catalog-reloader', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def tenant_stats(self):
+        """Per-shop catalog and latency stats, most recently used first"""
+        with self._lock:
+            tenants = list(self._tenants.values())
+        stats = {}
+        for tenant in reversed(tenants):
+            snapshot = tenant.reloader.current
+            stats[tenant.name] = {
+                'products': len(snapshot),
+                'catalog_version': snapshot.version,
+                'catalog_bytes': tenant.catalog_bytes,
+                'source': snapshot.source,
+                'loaded_at': tenant.loaded_at,
+                'idle_seconds': round(time.monotonic() - tenant.last_used, 1),
+                'requests': tenant.requests,
+                'latency_p50_ms': round(tenant.latency.percentile(50, 0.0) * 1000, 2),
+                'latency_p95_ms': round(tenant.latency.percentile(95, 0.0) * 1000, 2),
+            }
+        return stats
+
+    def stats(self):
+        with self._lock:
+            resident_bytes = sum(tenant.catalog_bytes for tenant in self._tenants.values())
+            resident = len(self._tenants)
+        return {
+            'default_shop': self.default_shop,
+            'resident': resident,
+            'resident_bytes': resident_bytes,
+            'max_bytes': self.max_bytes,
+            'loads': self.loads,
+            'load_failures': self.load_failures,
+            'evictions': self.evictions,
+            'shops': self.tenant_stats(),
+        }
@@ -0,0 +1,288 @@
+"""
+Rate-limit-aware, concurrent Shopify Admin API product fetching
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import requests
+
+import http_client
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+_DONE = object()
+
+
+class ShopifyAPIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"Shopify API error {status_code}: {message}")
+        self.status_code = status_code
+
+
+class CallLimitTracker:
+    """
+    Client-side model of Shopify's leaky-bucket REST limit.
+
+    The bucket level reported in ``X-Shopify-Shop-Api-Call-Limit`` ("32/40") is leaked
+    at ``leak_rate`` calls per second between responses; ``acquire`` blocks only while
+    the estimated level would exceed ``capacity - headroom``. That keeps the bucket
+    near full, for maximum throughput, without tripping a 429.
+    """
+
+    def __init__(self, capacity=40, leak_rate=2.0, headroom=2, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.headroom = headroom
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._level = 0.0
+        self._updated_at = clock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _current_level(self, now):
+        return max(0.0, self._level - (now - self._updated_at) * self.leak_rate)
+
+    def acquire(self):
+        """Reserve one call, sleeping until the bucket has room"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                level = self._current_level(now)
+                limit = self.capacity - self.headroom
+                if level + 1 <= limit:
+                    self._level = level + 1
+                    self._updated_at = now
+                    return
+                delay = (level + 1 - limit) / self.leak_rate
+                self.waits += 1
+                self.wait_seconds += delay
+            self._sleep(delay)
+
+    def update(self, header_value):
+        """Resynchronise with the level Shopify reported"""
+        if not header_value:
+            return
+        try:
+            used, capacity = (int(part) for part in header_value.split('/'))
+        except ValueError:
+            return
+        with self._lock:
+            self.capacity = capacity
+            self._level = float(used)
+            self._updated_at = self._clock()
+
+    def mark_throttled(self, retry_after=None):
+        """After a 429, hold every worker back for ``retry_after`` seconds"""
+        retry_after = retry_after or 1.0 / self.leak_rate
+        with self._lock:
+            now = self._clock()
+            # The level at which the next acquire has to wait exactly retry_after
+            blocked_level = self.capacity - self.headroom - 1 + retry_after * self.leak_rate
+            self._level = max(self._current_level(now), blocked_level)
+            self._updated_at = now
+
+
+class ShopifyClient:
+    """GET requests against the Admin API with rate limiting and retries"""
+
+    def __init__(self, base_url, headers, tracker=None, max_retries=5, backoff=0.5):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+        self.tracker = tracker or CallLimitTracker()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, url):
+        """GET with jittered exponential backoff on 429/5xx and connection errors"""
+        for attempt in range(self.max_retries + 1):
+            self.tracker.acquire()
+            self._count('requests')
+            try:
+                response = http_client.get(url, headers=self.headers)
+            except requests.exceptions.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+
+            self.tracker.update(response.headers.get('X-Shopify-Shop-Api-Call-Limit'))
+            if response.status_code == 200:
+                return response
+            if response.status_code not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                raise ShopifyAPIError(response.status_code, response.text[:200])
+
+            self._count('retries')
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            if response.status_code == 429:
+                self._count('throttled')
+                try:
+                    delay = max(delay, float(response.headers.get('Retry-After', 0)))
+                except ValueError:
+                    pass
+                self.tracker.mark_throttled(delay)
+            time.sleep(delay)
+
+    def paginate(self, path, key, params=None):
+        """Yield one list of ``key`` items per page, following the Link header"""
+        url = f"{self.base_url}/{path}"
+        if params:
+            url += f"?{urlencode(params)}"
+        while url:
+            response = self.get(url)
+            yield response.json().get(key, [])
+            url = next_page_url(response.headers.get('Link'))
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'limiter_waits': self.tracker.waits,
+            'limiter_wait_seconds': round(self.tracker.wait_seconds, 3),
+        }
+
+
+def next_page_url(link_header):
+    """URL of the rel="next" entry of a Link header, if any"""
+    if not link_header:
+        return None
+    for part in link_header.split(','):
+        if 'rel="next"' in part:
+            return part.split(';')[0].strip('<> ')
+    return None
+
+
+def created_at_partitions(start, end, count):
+    """
+    Split [start, end) into ``count`` disjoint ``created_at_min``/``created_at_max``
+    windows, so the catalog can be fetched by several workers without overlap
+    """
+    count = max(1, count)
+    step = (end - start) / count
+    bounds = [start + step * i for i in range(count)] + [end]
+    return [
+        {'created_at_min': bounds[i].isoformat(), 'created_at_max': bounds[i + 1].isoformat()}
+        for i in range(count)
+    ]
+
+
+def stream_products(client, partitions=None, workers=4, page_size=250, queue_pages=8):
+    """
+    Yield products fetched by ``workers`` threads, one partition (a dict of extra query
+    parameters, e.g. a collection_id or created_at window) per task.
+
+    Pages flow through a bounded queue, so at most ``queue_pages`` pages are held in
+    memory no matter how large the catalog is. Products returned by more than one
+    partition (e.g. overlapping collections) are yielded once.
+    """
+    partitions = partitions or [{}]
+    pages = queue.Queue(maxsize=queue_pages)
+    stop = threading.Event()
+
+    def fetch(partition):
+        try:
+            for page in client.paginate('products.json', 'products', {'limit': page_size, **partition}):
+                while not stop.is_set():
+                    try:
+                        pages.put(page, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(_DONE)
+
+    seen_ids = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for partition in partitions:
+            executor.submit(fetch, partition)
+        remaining = len(partitions)
+        try:
+            while remaining:
+                item = pages.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    for product in item:
+                        if product['id'] not in seen_ids:
+                            seen_ids.add(product['id'])
+                            yield product
+        finally:
+            stop.set()
+            # Unblock workers waiting on a full queue
+            while remaining:
+                try:
+                    if pages.get(timeout=0.1) is _DONE:
+                        remaining -= 1
+                except queue.Empty:
+                    continue
+
+
+class JSONArrayWriter:
+    """Write a JSON array item by item to a temp file, renamed over ``path`` on success"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp.{os.getpid()}"
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.tmp_path, 'w')
+        self._file.write('[')
+        return self
+
+    def write(self, item):
+        if self.count:
+            self._file.write(',')
+        json.dump(item, self._file, separators=(',', ':'))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self._file.write(']')
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if exc_type is None:
+                os.replace(self.tmp_path, self.path)
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+        return False
+
+
+def shop_created_at(client):
+    """Creation time of the shop, the lower bound for created_at partitions"""
+    response = client.get(f"{client.base_url}/shop.json")
+    return datetime.fromisoformat(response.json()['shop']['created_at'])
+
+
+def default_partitions(client, count):
+    if count <= 1:
+        return [{}]
+    return created_at_partitions(shop_created_at(client), datetime.now(timezone.utc), count)
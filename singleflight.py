@@ -0,0 +1,103 @@
+"""
+Single-flight coalescing of identical in-flight calls
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight threaded call and the outcome its followers wait for"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Share one execution between concurrent callers using the same key.
+
+    The first caller for a key (the leader) runs the function; callers arriving while it
+    is still running wait and receive the same result, or the same exception. Once the
+    call finishes the key is forgotten, so later callers run it again (results that
+    should outlive the flight belong in a cache).
+
+    ``do`` serves threaded callers and ``do_async`` asyncio callers; both report into
+    the same counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all threads concurrently asking for ``key``"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, coroutine_fn):
+        """
+        Await ``coroutine_fn()`` once for all coroutines concurrently asking for ``key``.
+
+        The shared call runs as its own task, so a caller that is cancelled (for example
+        because its client disconnected) does not cancel it for everyone else.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda finished, key=key: self._forget_task(key, finished))
+            with self._lock:
+                self.executions += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def in_flight(self):
+        return len(self._calls) + len(self._tasks)
+
+    def stats(self):
+        with self._lock:
+            requests = self.executions + self.coalesced
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'coalesced_ratio': round(self.coalesced / requests, 4) if requests else 0.0,
+                'in_flight': self.in_flight(),
+            }
@@ -0,0 +1,92 @@
+"""
+Server-Sent Events helpers for streaming LLM answers
+"""
+import json
+
+import markdown
+
+
+def format_sse(event, payload):
+    """Encode one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def parse_gemini_sse_line(line):
+    """
+    Return the text delta carried by one ``data:`` line of a Gemini
+    ``streamGenerateContent?alt=sse`` response, or '' for anything else
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    line = line.strip()
+    if not line.startswith('data:'):
+        return ''
+    try:
+        chunk = json.loads(line[len('data:'):].strip())
+        parts = chunk["candidates"][0]["content"]["parts"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ''
+    return ''.join(part.get('text', '') for part in parts)
+
+
+class MarkdownStreamRenderer:
+    """
+    Turn a stream of markdown text deltas into markdown-safe SSE events.
+
+    Text is only rendered once a whole markdown block (ended by a blank line, outside
+    any fenced code block) has arrived, so a half-received list or code fence is never
+    rendered with the wrong structure:
+
+    - ``delta``: ``{"text": ...}`` raw text of the still-open block, for display as plain text
+    - ``block``: ``{"html": ...}`` rendered HTML of newly completed blocks
+    - ``done``:  ``{"html": ...}`` rendering of the whole answer, which replaces the rest
+
+    Each block is rendered once, by ``render`` (e.g. the server's shared, memoizing
+    canned_responses.MarkdownRenderer), and only text that arrived since the last delta
+    is scanned for block boundaries and code fences.
+    """
+
+    def __init__(self, render=markdown.markdown):
+        self.render = render
+        self.text = ''
+        self._rendered_upto = 0
+        # Text before _scanned holds no unseen block boundary; _fences counts the code
+        # fences before _fences_upto
+        self._scanned = 0
+        self._fences = 0
+        self._fences_upto = 0
+
+    def _safe_boundary(self):
+        """End offset of the last complete markdown block not inside a code fence, or -1"""
+        boundary = -1
+        position = self.text.find('\n\n', max(self._scanned, self._rendered_upto))
+        while position != -1:
+            self._fences += self.text.count('```', self._fences_upto, position)
+            self._fences_upto = position
+            if self._fences % 2 == 0:
+                boundary = position + 2
+            position = self.text.find('\n\n', position + 1)
+        # A trailing newline may pair with the next delta's
+        self._scanned = max(self._scanned, len(self.text) - 1)
+        return boundary
+
+    def feed(self, delta):
+        """Consume a text delta and return the SSE strings to send for it"""
+        if not delta:
+            return []
+        self.text += delta
+        events = []
+        boundary = self._safe_boundary()
+        if boundary != -1:
+            completed = self.text[self._rendered_upto:boundary]
+            self._rendered_upto = boundary
+            if completed.strip():
+                events.append(format_sse('block', {'html': self.render(completed)}))
+        pending = self.text[self._rendered_upto:]
+        if pending:
+            events.append(format_sse('delta', {'text': pending}))
+        return events
+
+    def finish(self):
+        """Final event with the authoritative rendering of the full answer"""
+        return [format_sse('done', {'html': self.render(self.text)})]
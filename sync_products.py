@@ -1,51 +1,240 @@
+"""
+Sync the Shopify product catalog into data/products.json.
+
+    python sync_products.py                 # incremental when a previous sync exists
+    python sync_products.py --full          # download every product
+    python sync_products.py --shop NAME     # another storefront, into data/shops/NAME/
+
+Incremental runs only fetch products changed since the stored high-water mark
+(``updated_at_min``) plus product deletion events, merge them into the existing file
+and write it atomically. Full runs fetch ``--partitions`` created_at windows with
+``--workers`` threads and stream products straight to disk. All requests go through
+shopify_sync's leaky-bucket limiter and retry 429/5xx responses with backoff.
+Afterwards the binary catalog snapshot (data/products.snapshot, see catalog_binary)
+is rebuilt so app workers start without parsing the JSON; ``--snapshot-only`` just
+rebuilds it from the existing file.
+A JSON summary of the changes is printed on stdout; progress goes to stderr.
+"""
 import os
-import requests
+import sys
 import json
+import time
+import hashlib
+import argparse
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from catalog_binary import build_snapshot_file, default_snapshot_path
+from shopify_sync import (
+    CallLimitTracker, JSONArrayWriter, ShopifyClient, default_partitions, stream_products
+)
 
 # Load environment variables from .env
 load_dotenv()
 
-SHOP_NAME = os.environ.get("SHOP_NAME")
-ACCESS_TOKEN = os.environ.get("SHOPIFY_API_KEY")  # Using your preferred variable name
-
-if not SHOP_NAME or not ACCESS_TOKEN:
-    raise Exception("SHOP_NAME or SHOPIFY_API_KEY not set in .env")
-
-# Shopify API endpoint for products
-url = f"https://{SHOP_NAME}.myshopify.com/admin/api/2024-01/products.json?limit=250"
-
-headers = {
-    "X-Shopify-Access-Token": ACCESS_TOKEN,
-    "Content-Type": "application/json"
-}
-
-all_products = []
-page = 1
-
-while True:
-    print(f"Fetching page {page}...")
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        print("Error fetching products:", response.text)
-        break
-    data = response.json().get("products", [])
-    if not data:
-        break
-    all_products.extend(data)
-    # Shopify REST API pagination: check for 'Link' header for next page
-    link = response.headers.get("Link")
-    if link and 'rel="next"' in link:
-        # Extract next page URL from Link header
-        next_url = link.split(";")[0].strip("<> ")
-        url = next_url
-        page += 1
+API_VERSION = "2024-01"
+PRODUCTS_FILE = os.path.join("data", "products.json")
+STATE_FILE = os.path.join("data", "sync_state.json")
+SNAPSHOT_FILE = default_snapshot_path(PRODUCTS_FILE)
+# Catalogs of the further shops the app serves (see shop_registry), one directory each
+SHOPS_DIR = os.path.join("data", "shops")
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def get_shop_url(shop_name=None):
+    """Storefront URL the product links in the snapshot point at"""
+    return f"https://{shop_name or os.environ.get('SHOP_NAME', 'mffws4-kk')}.myshopify.com"
+
+
+def shop_paths(shop_name):
+    """(products, sync state, snapshot) files of a shop served from data/shops/<shop>/"""
+    directory = os.path.join(SHOPS_DIR, shop_name)
+    products_file = os.path.join(directory, "products.json")
+    return products_file, os.path.join(directory, "sync_state.json"), default_snapshot_path(products_file)
+
+
+def get_shop_config(shop_name=None):
+    """Admin API base URL and headers; SHOPIFY_API_KEY_<SHOP> holds another shop's token"""
+    access_token = None
+    if shop_name:
+        access_token = os.environ.get(f"SHOPIFY_API_KEY_{shop_name.upper().replace('-', '_')}")
+    shop_name = shop_name or os.environ.get("SHOP_NAME")
+    access_token = access_token or os.environ.get("SHOPIFY_API_KEY")  # Using your preferred variable name
+    if not shop_name or not access_token:
+        raise Exception("SHOP_NAME or SHOPIFY_API_KEY not set in .env")
+    base_url = f"https://{shop_name}.myshopify.com/admin/api/{API_VERSION}"
+    headers = {
+        "X-Shopify-Access-Token": access_token,
+        "Content-Type": "application/json"
+    }
+    return base_url, headers
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def fetch_products(client, updated_at_min=None):
+    params = {"limit": 250}
+    if updated_at_min:
+        params["updated_at_min"] = updated_at_min
+    return [product for page in client.paginate("products.json", "products", params) for product in page]
+
+
+def fetch_deleted_product_ids(client, created_at_min):
+    """IDs of products deleted since ``created_at_min``, from the store's event log"""
+    params = {"limit": 250, "filter": "Product", "verb": "destroy", "created_at_min": created_at_min}
+    return {event["subject_id"] for page in client.paginate("events.json", "events", params) for event in page}
+
+
+def product_digest(product):
+    return hashlib.sha1(json.dumps(product, sort_keys=True).encode("utf-8")).digest()
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json_atomic(path, data):
+    """Write to a temp file in the same directory and rename it over the target"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def merge_products(existing, changed, deleted_ids):
+    """
+    Apply changed and deleted products to the existing list, keeping its order.
+    Returns the merged list and (added, updated, removed) counts; re-fetched products
+    identical to the stored copy are not counted as updated.
+    """
+    positions = {product["id"]: i for i, product in enumerate(existing)}
+    merged = list(existing)
+    added = updated = 0
+    for product in changed:
+        position = positions.get(product["id"])
+        if position is None:
+            positions[product["id"]] = len(merged)
+            merged.append(product)
+            added += 1
+        elif merged[position] != product:
+            merged[position] = product
+            updated += 1
+    before = len(merged)
+    merged = [product for product in merged if product["id"] not in deleted_ids]
+    return merged, added, updated, before - len(merged)
+
+
+def high_water_mark(products, previous=None):
+    """Latest ``updated_at`` among the products (or the previous mark if later)"""
+    marks = [parse_timestamp(product.get("updated_at")) for product in products if product.get("updated_at")]
+    if previous:
+        marks.append(parse_timestamp(previous))
+    return max(marks).isoformat() if marks else None
+
+
+def stream_full_sync(client, products_file, partitions, workers):
+    """
+    Stream every product to products_file without holding the catalog in memory.
+    Existing products are reduced to digests only, for the change counts.
+    """
+    existing = {product["id"]: product_digest(product) for product in load_json(products_file, [])}
+    added = updated = 0
+    mark = None
+    with JSONArrayWriter(products_file) as writer:
+        for product in stream_products(client, partitions, workers=workers):
+            writer.write(product)
+            digest = existing.pop(product["id"], None)
+            if digest is None:
+                added += 1
+            elif digest != product_digest(product):
+                updated += 1
+            mark = high_water_mark([product], mark)
+            if writer.count % 1000 == 0:
+                log(f"Fetched {writer.count} products...")
+    return writer.count, added, updated, len(existing), mark
+
+
+def sync(full=False, products_file=PRODUCTS_FILE, state_file=STATE_FILE, workers=4, partitions=4,
+         bucket_size=40, leak_rate=2.0, snapshot_file=SNAPSHOT_FILE, shop_name=None):
+    base_url, headers = get_shop_config(shop_name)
+    client = ShopifyClient(base_url, headers, tracker=CallLimitTracker(capacity=bucket_size, leak_rate=leak_rate))
+    started_at = datetime.now(timezone.utc).isoformat()
+    start_time = time.time()
+    state = load_json(state_file, {})
+    incremental = bool(not full and state.get("updated_at_max") and os.path.exists(products_file))
+
+    if incremental:
+        changed = fetch_products(client, updated_at_min=state["updated_at_max"])
+        deleted_ids = fetch_deleted_product_ids(client, state["last_sync_started_at"])
+        products, added, updated, removed = merge_products(load_json(products_file, []), changed, deleted_ids)
+        mark = high_water_mark(changed, state["updated_at_max"])
+        total = len(products)
+        if added or updated or removed:
+            write_json_atomic(products_file, products)
     else:
-        break
+        total, added, updated, removed, mark = stream_full_sync(
+            client, products_file, default_partitions(client, partitions), workers
+        )
+    write_json_atomic(state_file, {"updated_at_max": mark, "last_sync_started_at": started_at})
+    snapshot = build_snapshot_file(products_file, get_shop_url(shop_name), snapshot_file) if snapshot_file else None
+
+    return {
+        "mode": "incremental" if incremental else "full",
+        "added": added,
+        "updated": updated,
+        "removed": removed,
+        "total": total,
+        "high_water_mark": mark,
+        "duration_seconds": round(time.time() - start_time, 3),
+        "api": client.stats(),
+        "snapshot": snapshot,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Shopify products into data/products.json")
+    parser.add_argument("--full", action="store_true", help="download every product instead of only changes")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent fetch threads for full syncs")
+    parser.add_argument("--partitions", type=int, default=4, help="created_at windows to split a full sync into")
+    parser.add_argument("--bucket-size", type=int, default=40, help="REST leaky bucket size (80 on Shopify Plus)")
+    parser.add_argument("--leak-rate", type=float, default=2.0, help="REST calls per second (4 on Shopify Plus)")
+    parser.add_argument("--no-snapshot", action="store_true", help="don't rebuild the binary catalog snapshot")
+    parser.add_argument("--snapshot-only", action="store_true",
+                        help="only rebuild the binary snapshot from the existing products.json")
+    parser.add_argument("--shop", help="sync another shop (by myshopify.com subdomain) into data/shops/<shop>/")
+    args = parser.parse_args()
+
+    products_file, state_file, snapshot_file = (
+        shop_paths(args.shop) if args.shop else (PRODUCTS_FILE, STATE_FILE, SNAPSHOT_FILE)
+    )
+    if args.snapshot_only:
+        snapshot = build_snapshot_file(products_file, get_shop_url(args.shop), snapshot_file)
+        log(f"Wrote {snapshot['products']} products to {snapshot_file} ({snapshot['bytes']} bytes)")
+        print(json.dumps(snapshot))
+        return
+
+    summary = sync(full=args.full, products_file=products_file, state_file=state_file, workers=args.workers,
+                   partitions=args.partitions, bucket_size=args.bucket_size, leak_rate=args.leak_rate,
+                   snapshot_file=None if args.no_snapshot else snapshot_file, shop_name=args.shop)
+    log(f"Synced {summary['total']} products to {products_file} "
+        f"({summary['added']} added, {summary['updated']} updated, {summary['removed']} removed)")
+    print(json.dumps(summary))
 
-# Save to products.json
-os.makedirs("data", exist_ok=True)
-with open("data/products.json", "w") as f:
-    json.dump(all_products, f, indent=2)
 
-print(f"Synced {len(all_products)} products to data/products.json")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Binary catalog snapshots: round-trip and stale-snapshot detection
+"""
+import json
+import os
+
+import pytest
+
+from catalog import CatalogSnapshot, file_checksum
+from catalog_binary import StaleSnapshotError, build_snapshot_file, read_snapshot, write_snapshot
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'products.json')
+SHOP_URL = 'https://example.myshopify.com'
+
+
+@pytest.fixture
+def products_path(tmp_path):
+    with open(PRODUCTS_FILE) as products_file:
+        products = json.load(products_file)[:20]
+    path = tmp_path / 'products.json'
+    path.write_text(json.dumps(products))
+    return str(path)
+
+
+def checksum_of(path):
+    with open(path, 'rb') as json_file:
+        return file_checksum(json_file.read())
+
+
+def test_round_trip_matches_json_catalog(products_path):
+    original = CatalogSnapshot.load(products_path, SHOP_URL)
+    snapshot_path = build_snapshot_file(products_path, SHOP_URL)['path']
+
+    loaded = read_snapshot(snapshot_path, SHOP_URL, checksum_of(products_path))
+
+    assert loaded.source == 'snapshot'
+    assert [p.id for p in loaded] == [p.id for p in original]
+    for before, after in zip(original, loaded):
+        assert (after.title, after.link, after.price, after.tags) == (before.title, before.link, before.price, before.tags)
+        assert [(v.id, v.price, v.inventory_quantity) for v in after.variants] == \
+            [(v.id, v.price, v.inventory_quantity) for v in before.variants]
+    for query in ("wireless headphones", "woolen sweater for winter", "something with sandalwood notes"):
+        assert [p.id for p in loaded.product_index.search(query)] == [p.id for p in original.product_index.search(query)]
+        assert [p.id for p in loaded.product_retriever.search(query)] == \
+            [p.id for p in original.product_retriever.search(query)]
+
+
+def test_rejects_stale_or_foreign_snapshots(products_path, tmp_path):
+    snapshot_path = str(tmp_path / 'products.snapshot')
+    write_snapshot(snapshot_path, CatalogSnapshot.load(products_path, SHOP_URL), SHOP_URL)
+    checksum = checksum_of(products_path)
+
+    with pytest.raises(StaleSnapshotError):
+        read_snapshot(snapshot_path, SHOP_URL, 'other checksum')
+    with pytest.raises(StaleSnapshotError):
+        read_snapshot(snapshot_path, 'https://other.myshopify.com', checksum)
+
+    garbage_path = tmp_path / 'garbage.snapshot'
+    garbage_path.write_bytes(b'not a snapshot at all' * 4)
+    with pytest.raises(StaleSnapshotError):
+        read_snapshot(str(garbage_path), SHOP_URL, checksum)
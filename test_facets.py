@@ -0,0 +1,63 @@
+"""
+FacetIndex: parsing filter questions and answering them from the facet arrays
+"""
+import os
+
+import pytest
+
+from catalog import CatalogSnapshot, load_catalog
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'products.json')
+
+
+@pytest.fixture(scope='module')
+def facets():
+    return CatalogSnapshot(load_catalog(PRODUCTS_FILE, 'https://example.myshopify.com')).facet_index
+
+
+def titles(facets, facet_query):
+    return [product.title for product, _ in facets.search(facet_query)]
+
+
+@pytest.mark.parametrize('query', [
+    "Is delivery available in Mumbai?",
+    "What payment methods are available",
+    "Is cash on delivery available",
+    "are returns available",
+    "is there a discount code",
+    "tell me more about offers",
+    "is shipping available",
+    "is it available",
+    "shipping takes up to 5 days?",
+    "is shipping free over 500",
+    "hello there",
+])
+def test_store_questions_are_not_filters(facets, query):
+    assert facets.parse(query) is None
+
+
+def test_price_bounds(facets):
+    facet_query = facets.parse("perfumes under 20000")
+    assert facet_query.max_price == 20000 and facet_query.min_price is None
+    assert titles(facets, facet_query) == ['BDC Pour Homme - Perfume']
+
+    facet_query = facets.parse("shoes between 4k and 1000")
+    assert (facet_query.min_price, facet_query.max_price) == (1000, 4000)
+    prices = [price for _, price in facets.search(facet_query)]
+    assert prices == sorted(prices) and all(1000 <= price <= 4000 for price in prices)
+
+
+def test_stock_sale_and_vendor(facets):
+    in_stock = facets.parse("what's in stock")
+    assert in_stock.in_stock and not in_stock.terms
+    assert all(facets.in_stock[facets.products.index(product)] for product, _ in facets.search(in_stock))
+
+    assert facets.parse("anything on sale").on_sale
+    assert facets.parse("any deals on watches").terms == ('watches',)
+    assert facets.parse("anything from Starky Shop").vendors == ('starky shop',)
+
+
+def test_weak_words_need_a_product(facets):
+    assert facets.parse("perfume available").in_stock
+    assert facets.parse("discounted sunglasses").on_sale
+    assert facets.parse("anything available under 2000").in_stock
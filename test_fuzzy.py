@@ -0,0 +1,49 @@
+"""
+Trigram index and bounded edit distance for misspelled product names
+"""
+import os
+
+import pytest
+
+from catalog import load_catalog
+from fuzzy import TrigramIndex, bounded_edit_distance, max_edits, substitution_cost
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'products.json')
+
+
+@pytest.fixture(scope='module')
+def index():
+    return TrigramIndex(load_catalog(PRODUCTS_FILE, 'https://example.myshopify.com'))
+
+
+def test_bounded_edit_distance():
+    assert bounded_edit_distance('sweater', 'swetaer', 2) == 1
+    assert bounded_edit_distance('perfum', 'perfume', 1) == 1
+    assert bounded_edit_distance('short', 'shirt', 1) == 1
+    assert bounded_edit_distance('short', 'shirt', 1, substitution=2) == 2
+    assert bounded_edit_distance('abc', 'xyzuvw', 1) == 2
+
+
+def test_short_terms_allow_one_edit_without_substitution():
+    assert (max_edits('shirt'), substitution_cost('shirt')) == (1, 2)
+    assert (max_edits('headphnes'), substitution_cost('headphnes')) == (2, 1)
+
+
+@pytest.mark.parametrize('query, word', [
+    ("perfum", 'perfume'),
+    ("swetaer", 'sweater'),
+    ("headphnes", 'headphones'),
+    ("wach", 'watch'),
+    ("tshrit", 'tshirt'),
+])
+def test_corrects_typos(index, query, word):
+    match = index.match(query)
+    assert match.corrections == {query: word}
+    assert len(match.positions)
+
+
+@pytest.mark.parametrize('query', ["short", "shorts", "good", "qwxzvk"])
+def test_leaves_other_words_alone(index, query):
+    match = index.match(query)
+    assert match.corrections == {}
+    assert not len(match.positions)
@@ -0,0 +1,30 @@
+"""
+IntentRouter: whole-word, priority-ordered intent matching
+"""
+from intent_router import IntentRouter
+
+router = IntentRouter()
+
+
+def test_whole_words_only():
+    assert router.intents("this one") == []
+    assert router.classify("whatever") is None
+    assert router.classify("hi there") == 'greeting'
+
+
+def test_priority_order():
+    assert router.intents("show products and their price") == ['product_list', 'price']
+    assert router.classify("how much is shipping") == 'price'
+    assert router.intents("is shipping available") == ['stock', 'shipping']
+
+
+def test_matched_phrases_and_strip():
+    assert router.matched_phrases("What  is in stock", 'explanation') == {'what is'}
+    assert router.matched_phrases("explain why", 'explanation') == {'explain', 'why'}
+    assert router.strip("Is the perfume in stock?", 'stock') == "is the perfume ?"
+
+
+def test_custom_intents():
+    custom = IntentRouter({'a': ['foo bar'], 'b': ['foo bar', 'baz']})
+    assert custom.intents("FOO   bar baz") == ['a', 'b']
+    assert custom.strip("foo bar baz", 'b') == "foo bar"
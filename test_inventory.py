@@ -0,0 +1,53 @@
+"""
+InventoryIndex: option-value lookups and in-place stock updates
+"""
+import pytest
+
+from catalog import CatalogSnapshot, build_catalog
+
+COLORS_AND_SIZES = [("Navy Blue", "M"), ("Blue", "M"), ("Navy Blue", "Extra Large"), ("Red", "Extra Large")]
+
+
+@pytest.fixture
+def snapshot():
+    variants = [
+        {
+            'id': 1000 + i, 'title': f"{color} / {size}", 'price': '500.00', 'option1': color, 'option2': size,
+            'inventory_quantity': i, 'inventory_management': 'shopify', 'inventory_policy': 'deny',
+        }
+        for i, (color, size) in enumerate(COLORS_AND_SIZES)
+    ]
+    product = {
+        'id': 1, 'title': 'Test Shirt', 'handle': 'test-shirt', 'body_html': '', 'vendor': 'Starky Shop',
+        'product_type': 'Shirt', 'tags': '', 'variants': variants,
+        'options': [{'name': 'Color'}, {'name': 'Size'}],
+    }
+    return CatalogSnapshot(build_catalog([product], 'https://example.myshopify.com'))
+
+
+@pytest.mark.parametrize('query, expected', [
+    ("is the navy blue one in stock", [0, 2]),
+    ("is the blue one in stock", [1]),
+    ("Navy  Blue in extra large?", [2]),
+    ("blue m", [1]),
+    ("is it in stock", None),
+])
+def test_named_variants_match_whole_option_phrases(snapshot, query, expected):
+    assert snapshot.inventory_index.named_variants(snapshot[0], query) == expected
+
+
+def test_apply_updates_shared_arrays_only(snapshot):
+    inventory = snapshot.inventory_index
+    product = snapshot[0]
+    assert not inventory.available[0] and inventory.is_in_stock(product)
+
+    assert inventory.apply([(1003, -3), (9999, 1)]) == 1
+    assert inventory.apply([(1001, 0), (1002, 0)], absolute=True) == 2
+    assert not inventory.is_in_stock(product)
+    assert not snapshot.facet_index.in_stock[0]
+    assert product.variants[3].inventory_quantity == 3
+    assert inventory.unknown_variants == 1
+
+    inventory.apply([(1000, 4)], absolute=True)
+    assert inventory.is_in_stock(product)
+    assert inventory.is_low_stock(0) and inventory.units_left(0) == 4
@@ -0,0 +1,53 @@
+"""
+LLM response cache: key normalization, TTL expiry and LRU eviction
+"""
+from llm_cache import LLMResponseCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_ignores_case_and_whitespace_only():
+    config = {'generationConfig': {'temperature': 0.2}, 'contents': [{'text': 'hi'}]}
+    assert make_cache_key("Do you  have SHIRTS?", config) == make_cache_key("do you have shirts?", config)
+    assert make_cache_key("shirts", config) != make_cache_key("shirts", {'generationConfig': {'temperature': 0.9}})
+    history = {'contents': [{'text': 'earlier turn'}, {'text': 'shirts'}]}
+    assert make_cache_key("shirts", history) != make_cache_key("shirts", {'contents': [{'text': 'shirts'}]})
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LLMResponseCache(ttl_seconds=10, clock=clock)
+    cache.set('key', 'answer')
+    clock.now = 9.9
+    assert cache.get('key') == 'answer'
+    clock.now = 10.0
+    assert cache.get('key') is None
+    assert cache.stats()['expirations'] == 1
+    assert len(cache) == 0
+
+
+def test_evicts_least_recently_used_entry():
+    cache = LLMResponseCache(max_entries=2, clock=FakeClock())
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_invalidate_and_disabled_cache():
+    cache = LLMResponseCache(clock=FakeClock())
+    cache.set('a', 1)
+    cache.invalidate()
+    assert cache.get('a') is None
+    disabled = LLMResponseCache(max_entries=0)
+    disabled.set('a', 1)
+    assert len(disabled) == 0
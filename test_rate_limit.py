@@ -0,0 +1,50 @@
+"""
+Token-bucket limiter: refill, multi-bucket requests and key eviction
+"""
+import pytest
+
+from rate_limit import TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter({'user': (1.0, 2)}, clock=clock)
+    assert limiter.try_acquire([('user', 'u1')]) == 0.0
+    assert limiter.try_acquire([('user', 'u1')]) == 0.0
+    assert limiter.try_acquire([('user', 'u1')]) == pytest.approx(1.0)
+    clock.now = 0.5
+    assert limiter.try_acquire([('user', 'u1')]) == pytest.approx(0.5)
+    clock.now = 1.0
+    assert limiter.try_acquire([('user', 'u1')]) == 0.0
+    assert limiter.try_acquire([('user', 'u2')]) == 0.0
+
+
+def test_all_buckets_must_have_a_token_and_none_is_taken_otherwise():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter({'user': (1.0, 1), 'ip': (0.5, 2)}, clock=clock)
+    assert limiter.try_acquire([('user', 'u1'), ('ip', '1.2.3.4')]) == 0.0
+    assert limiter.try_acquire([('user', 'u1'), ('ip', '1.2.3.4')]) == pytest.approx(1.0)
+    # The refused request left the IP bucket's second token in place
+    assert limiter.try_acquire([('user', 'u2'), ('ip', '1.2.3.4')]) == 0.0
+    assert limiter.try_acquire([('ip', '1.2.3.4')]) == pytest.approx(2.0)
+    assert (limiter.allowed, limiter.limited) == (2, 2)
+
+
+def test_idle_and_excess_buckets_are_dropped():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter({'user': (1.0, 2)}, max_keys=2, clock=clock)
+    for user in ('u1', 'u2', 'u3'):
+        limiter.try_acquire([('user', user)])
+    assert len(limiter) == 2
+    assert limiter.evictions == 1
+    clock.now = limiter.idle_ttl
+    limiter.try_acquire([('user', 'u4')])
+    assert len(limiter) == 1
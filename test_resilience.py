@@ -0,0 +1,72 @@
+"""
+Circuit breaker state changes, retry budget and deadlines
+"""
+from resilience import CircuitBreaker, Deadline, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30, clock=FakeClock())
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.rejected == 1
+
+
+def test_half_open_probe_closes_or_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now = 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+    clock.now = 60
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_abandoned_probe_frees_its_slot():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now = 30
+    assert breaker.allow_request()
+    assert breaker.is_open()
+    clock.now = 60
+    assert not breaker.is_open()
+    assert breaker.allow_request()
+
+
+def test_retries_stop_at_attempt_limit_or_deadline():
+    clock = FakeClock()
+    policy = RetryPolicy(max_attempts=3)
+    deadline = Deadline(5, clock=clock)
+    assert policy.should_retry(0, 1.0, deadline, min_attempt_time=2.0)
+    assert not policy.should_retry(2, 0.0, deadline)
+    clock.now = 3
+    assert deadline.remaining() == 2
+    assert not policy.should_retry(0, 1.0, deadline, min_attempt_time=2.0)
+    clock.now = 6
+    assert deadline.expired()
+    assert 0 <= policy.delay(10) <= policy.max_delay
+    assert policy.is_retryable(503) and not policy.is_retryable(400)
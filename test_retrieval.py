@@ -0,0 +1,40 @@
+"""
+BM25 retrieval: ranking, thresholds and the product wrapper
+"""
+import os
+
+from catalog import load_catalog
+from retrieval import BM25Retriever, ProductRetriever, tokenize
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'products.json')
+
+DOCUMENTS = [
+    "woody perfume with sandalwood notes",
+    "cotton shirt for summer",
+    "sandalwood soap",
+    "leather belt",
+]
+
+
+def test_tokenize_drops_stop_words():
+    assert tokenize("Is there something with Sandalwood?") == ['sandalwood']
+
+
+def test_ranks_documents_matching_more_terms_first():
+    engine = BM25Retriever(DOCUMENTS)
+    hits = engine.top_k("sandalwood perfume", k=3)
+    assert [doc_id for doc_id, _ in hits] == [0, 2]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_coverage_and_matched_term_thresholds():
+    engine = BM25Retriever(DOCUMENTS)
+    assert [doc_id for doc_id, _ in engine.top_k("sandalwood perfume", min_coverage=1.0)] == [0]
+    assert engine.top_k("sandalwood", min_matched_terms=2) == []
+    assert engine.top_k("unknown words") == []
+
+
+def test_product_retriever_ignores_one_word_chit_chat():
+    retriever = ProductRetriever(load_catalog(PRODUCTS_FILE, 'https://example.myshopify.com'))
+    assert retriever.search("cool") == []
+    assert retriever.search("something with sandalwood notes")[0].title == 'BDC Pour Homme - Perfume'
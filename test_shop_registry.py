@@ -0,0 +1,90 @@
+"""
+ShopRegistry: on-demand tenant loads, failed loads and LRU eviction
+"""
+import json
+import os
+
+import pytest
+
+from catalog_reloader import CatalogReloader
+from shop_registry import ShopRegistry, UnknownShopError
+
+PRODUCTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'products.json')
+
+
+def sample_products(count=3):
+    with open(PRODUCTS_FILE) as products_file:
+        return json.load(products_file)[:count]
+
+
+def write_shop(shops_dir, shop, payload):
+    os.makedirs(os.path.join(shops_dir, shop), exist_ok=True)
+    path = os.path.join(shops_dir, shop, 'products.json')
+    with open(path, 'w') as products_file:
+        json.dump(payload, products_file)
+    return path
+
+
+@pytest.fixture
+def shops_dir(tmp_path):
+    default_path = tmp_path / 'default.json'
+    default_path.write_text(json.dumps(sample_products()))
+    return tmp_path / 'shops'
+
+
+def make_registry(shops_dir, max_bytes=1 << 30):
+    default_reloader = CatalogReloader(str(shops_dir.parent / 'default.json'), 'https://main.myshopify.com')
+    return ShopRegistry('main', default_reloader, str(shops_dir), max_bytes, use_snapshots=False)
+
+
+def test_loads_shop_on_first_request(shops_dir):
+    write_shop(shops_dir, 'other', sample_products(2))
+    registry = make_registry(shops_dir)
+
+    catalog = registry.catalog(registry.resolve('https://Other.myshopify.com/'))
+
+    assert len(catalog) == 2
+    assert catalog[0].link.startswith('https://other.myshopify.com/')
+    assert registry.is_resident('other')
+    assert registry.loads == 1
+
+
+def test_unknown_and_invalid_shops(shops_dir):
+    registry = make_registry(shops_dir)
+    with pytest.raises(UnknownShopError):
+        registry.catalog('missing')
+    with pytest.raises(UnknownShopError):
+        registry.resolve('../etc')
+
+
+@pytest.mark.parametrize('payload', [
+    {'products': []},
+    [dict(sample_products(1)[0], variants='not a list')],
+])
+def test_malformed_file_fails_once_until_it_changes(shops_dir, payload):
+    path = write_shop(shops_dir, 'broken', payload)
+    registry = make_registry(shops_dir)
+
+    for _ in range(3):
+        with pytest.raises(UnknownShopError):
+            registry.catalog('broken')
+    assert registry.load_failures == 1
+    assert not registry.is_resident('broken')
+
+    with open(path, 'w') as products_file:
+        json.dump(sample_products(2), products_file)
+    assert len(registry.catalog('broken')) == 2
+
+
+def test_evicts_least_recently_used_shop_but_never_the_default(shops_dir):
+    for shop in ('first', 'second'):
+        write_shop(shops_dir, shop, sample_products())
+    registry = make_registry(shops_dir, max_bytes=1)
+
+    registry.catalog('first')
+    registry.catalog('second')
+
+    assert registry.is_resident('main')
+    assert registry.is_resident('second')
+    assert not registry.is_resident('first')
+    assert registry.evictions == 1